@@ -0,0 +1,59 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from zeep.exceptions import TransportError
+
+from resilience import DEFAULT_DEADLINE
+
+# Threads partilhadas por todos os pedidos da GUI para as chamadas SOAP em paralelo
+FANOUT_WORKERS = int(os.environ.get("SOAP_FANOUT_WORKERS", 16))
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='soap-fanout')
+
+
+class CallTimeout(TransportError):
+    """A chamada não terminou dentro do prazo (apanhada pelos ``except TransportError``)."""
+
+
+class CallGroup:
+    """Chamadas SOAP independentes de um pedido, executadas em paralelo.
+
+    ``submit`` arranca a chamada de imediato; ``result`` espera por ela até
+    ao prazo dessa chamada (o da operação em SOAP_DEADLINES, ver
+    resilience.py) e devolve o valor ou relança a exceção. Ao sair do
+    ``with`` as chamadas que ainda não começaram são canceladas::
+
+        with CallGroup() as calls:
+            calls.submit('users', client_ws2.service.getAllUsers)
+            ...
+            users = calls.result('users')
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def submit(self, name, fn, *args, **kwargs):
+        deadline = getattr(fn, 'deadline', DEFAULT_DEADLINE)
+        # A thread corre no contexto do pedido (ex.: o ReadState do soap_client)
+        context = contextvars.copy_context()
+        self._calls[name] = (_executor.submit(context.run, fn, *args, **kwargs), time.monotonic() + deadline)
+
+    def result(self, name):
+        future, expires_at = self._calls[name]
+        try:
+            return future.result(timeout=max(0.0, expires_at - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            raise CallTimeout(f"Chamada {name} excedeu o prazo")
+
+    def cancel(self):
+        for future, _ in self._calls.values():
+            future.cancel()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cancel()
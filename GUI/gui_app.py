@@ -1,406 +1,580 @@
-from flask import (
-    Flask, render_template, request, redirect, url_for, flash, session, abort
-)
-from zeep import Client, Settings, Transport
-from zeep.exceptions import Fault, TransportError
-import requests 
-import os
-from datetime import datetime 
-
-
-app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "default_secret_key_for_dev") 
-
-
-@app.context_processor
-def inject_now():
-    """Injecta a função datetime.utcnow no contexto do template."""
-    return {'now': datetime.utcnow}
-
-
-
-WSDL_WS1 = os.environ.get('WSDL_WS1_URL', 'http://localhost:5001/ws1?wsdl') 
-WSDL_WS2 = os.environ.get('WSDL_WS2_URL', 'http://localhost:5002/ws2?wsdl')
-
-# --- Configuração do Cliente SOAP (Zeep) ---
-
-http_session = requests.Session()
-settings = Settings(strict=False, xml_huge_tree=True)
-transport = Transport(session=http_session, timeout=10) 
-
-client_ws1 = None
-client_ws2 = None
-
-try:
-    client_ws1 = Client(WSDL_WS1, settings=settings, transport=transport)
-    print("Cliente WS1 conectado.")
-except Exception as e:
-    print(f"ERRO ao conectar ao WSDL WS1 ({WSDL_WS1}): {e}")
-
-try:
-    client_ws2 = Client(WSDL_WS2, settings=settings, transport=transport)
-    print("Cliente WS2 conectado.")
-except Exception as e:
-    print(f"ERRO ao conectar ao WSDL WS2 ({WSDL_WS2}): {e}")
-
-
-# --- Decorador para verificar login ---
-from functools import wraps
-
-def login_required(role="client"):
-    """Verifica se o utilizador está logado e tem o role correto."""
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            if 'user_id' not in session:
-                flash('Login necessário para aceder a esta página.', 'warning')
-                return redirect(url_for('login', next=request.url))
-            if session.get('role') != role and role != "any": 
-                 flash(f'Acesso não autorizado. Role necessário: {role}.', 'danger')
-                 return redirect(url_for('index')) 
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
-
-# --- Rotas ---
-@app.route('/')
-def index():
-    if 'user_id' in session:
-        if session.get('role') == 'admin':
-            return redirect(url_for('admin_dashboard'))
-        else:
-            return redirect(url_for('client_dashboard'))
-    return redirect(url_for('login'))
-
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if 'user_id' in session: return redirect(url_for('index')) 
-
-    if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
-
-        if not client_ws1:
-             flash('Erro crítico: Serviço de autenticação indisponível.', 'danger')
-             return render_template('login.html')
-        if not username or not password:
-             flash('Utilizador e password são obrigatórios.', 'warning')
-             return render_template('login.html')
-
-        try:
-            user_info = client_ws1.service.login(username=username, password=password)
-
-            if user_info and user_info.user_id:
-                 session['user_id'] = user_info.user_id
-                 session['username'] = user_info.username 
-                 session['role'] = user_info.role
-                 flash(f'Login bem sucedido como {user_info.role}!', 'success')
-
-                 next_page = request.args.get('next')
-                 return redirect(next_page or url_for('index'))
-            else:
-                 flash('Resposta inesperada do serviço de login.', 'danger')
-
-        except Fault as f: 
-            flash(f"Erro: {f.message}", 'danger')
-        except TransportError as te:
-             print(f"Erro de transporte ao contactar WS1: {te}")
-             flash('Erro de comunicação com o serviço de autenticação.', 'danger')
-        except Exception as e:
-            print(f"Erro inesperado no login: {type(e).__name__} - {e}")
-            flash('Ocorreu um erro inesperado durante o login.', 'danger')
-
-    return render_template('login.html')
-
-@app.route('/register', methods=['GET', 'POST'])
-def register():
-    if 'user_id' in session: return redirect(url_for('index'))
-
-    if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
-        confirm_password = request.form.get('confirm_password')
-        email = request.form.get('email')
-
-        if not client_ws1:
-             flash('Erro crítico: Serviço de registo indisponível.', 'danger')
-             return render_template('register.html')
-
-        error = None
-        if not username: error = 'Username é obrigatório.'
-        elif not password: error = 'Password é obrigatória.'
-        elif password != confirm_password: error = 'Passwords não coincidem.'
-        elif not email: error = 'Email é obrigatório.'
-
-        if error:
-             flash(error, 'warning')
-        else:
-            try:
-                success = client_ws1.service.register(username=username, password=password, email=email)
-                if success:
-                    flash('Registo bem sucedido! Pode agora fazer login.', 'success')
-                    return redirect(url_for('login'))
-                else:
-                    flash('Erro desconhecido no registo.', 'danger')
-            except Fault as f:
-                flash(f"Erro no registo: {f.message}", 'danger')
-            except TransportError as te:
-                 print(f"Erro de transporte ao contactar WS1: {te}")
-                 flash('Erro de comunicação com o serviço de registo.', 'danger')
-            except Exception as e:
-                print(f"Erro inesperado no registo: {type(e).__name__} - {e}")
-                flash('Ocorreu um erro inesperado durante o registo.', 'danger')
-
-    return render_template('register.html')
-
-@app.route('/logout')
-def logout():
-    session.pop('user_id', None)
-    session.pop('username', None)
-    session.pop('role', None)
-    flash('Logout bem sucedido.', 'info')
-    return redirect(url_for('login'))
-
-@app.route('/dashboard/client')
-@login_required(role="client")
-def client_dashboard():
-    packages = []
-    if not client_ws1:
-        flash('Erro crítico: Serviço de pacotes indisponível.', 'danger')
-    else:
-        try:
-            user_id = session['user_id']
-            search_term = request.args.get('search', '') 
-
-            if search_term:
-                 packages_data = client_ws1.service.searchPackages(user_id=user_id, search_term=search_term)
-                 flash(f'Mostrando resultados para "{search_term}".', 'info')
-            else:
-                 packages_data = client_ws1.service.listPackages(user_id=user_id)
-
-            packages = packages_data if packages_data else []
-
-        except Fault as f:
-            flash(f"Erro ao buscar pacotes: {f.message}", 'danger')
-        except TransportError as te:
-             print(f"Erro de transporte ao contactar WS1: {te}")
-             flash('Erro de comunicação com o serviço de pacotes.', 'danger')
-        except Exception as e:
-            print(f"Erro inesperado no client dashboard: {type(e).__name__} - {e}")
-            flash('Ocorreu um erro inesperado ao carregar os seus pacotes.', 'danger')
-
-    return render_template('client_dashboard.html', packages=packages)
-
-
-@app.route('/package/<int:package_id>')
-@login_required(role="any")
-def package_details(package_id):
-    package_info = None
-    tracking_history = []
-    error_msg = None
-
-    if not client_ws1:
-         error_msg = 'Erro crítico: Serviço de pacotes indisponível.'
-    else:
-        try:
-            user_id = session['user_id']
-            all_packages = client_ws1.service.listPackages(user_id=user_id) or []
-            found = False
-            for pkg in all_packages:
-                 if pkg.id == package_id:
-                      package_info = pkg
-                      found = True
-                      break
-            if not found:
-                 abort(404, description="Pacote não encontrado ou não pertence a si.")
-
-            if package_info and package_info.is_tracked:
-                tracking_history = client_ws1.service.checkStatus(package_id=package_id) or []
-
-        except Fault as f:
-            error_msg = f"Erro ao buscar detalhes do pacote: {f.message}"
-        except TransportError as te:
-             error_msg = 'Erro de comunicação com o serviço de pacotes.'
-             print(f"Erro de transporte ao contactar WS1: {te}")
-        except Exception as e:
-            error_msg = 'Ocorreu um erro inesperado.'
-            print(f"Erro inesperado em package_details: {type(e).__name__} - {e}")
-
-    if error_msg: flash(error_msg, 'danger')
-
-    return render_template('package_details.html', 
-                            package=package_info,
-                            tracking_history=tracking_history)
-
-
-@app.route('/dashboard/admin')
-@login_required(role="admin")
-def admin_dashboard():
-    packages = []
-    if not client_ws2:
-         flash('Erro crítico: Serviço de administração indisponível.', 'danger')
-    else:
-        try:
-             packages_data = client_ws2.service.getAllPackages()
-             packages = packages_data if packages_data else []
-        except Fault as f:
-            flash(f"Erro ao buscar pacotes: {f.message}", 'danger')
-        except TransportError as te:
-             print(f"Erro de transporte ao contactar WS2: {te}")
-             flash('Erro de comunicação com o serviço de administração.', 'danger')
-        except Exception as e:
-            print(f"Erro inesperado no admin dashboard: {type(e).__name__} - {e}")
-            flash('Ocorreu um erro inesperado ao carregar os pacotes.', 'danger')
-
-    return render_template('admin_dashboard.html', packages=packages)
-
-@app.route('/admin/package/add', methods=['GET', 'POST'])
-@login_required(role="admin")
-def add_package():
-    users = []
-    if client_ws2:
-        try:
-             users_data = client_ws2.service.getAllUsers()
-             users = users_data if users_data else []
-        except Exception as e:
-             flash('Erro ao carregar lista de utilizadores.', 'warning')
-             print(f"Erro getAllUsers: {e}")
-
-    if request.method == 'POST':
-        if not client_ws2:
-             flash('Erro crítico: Serviço de administração indisponível.', 'danger')
-             return render_template('add_package.html', users=users)
-
-        try:
-            sender_id = int(request.form.get('sender_id'))
-            receiver_id = int(request.form.get('receiver_id'))
-            name = request.form.get('name')
-            description = request.form.get('description')
-            sender_city = request.form.get('sender_city')
-            destination_city = request.form.get('destination_city')
-
-            if not all([sender_id, receiver_id, name, sender_city, destination_city]):
-                 flash('Todos os campos obrigatórios devem ser preenchidos.', 'warning')
-            else:
-                new_id = client_ws2.service.addPackage(
-                    sender_id=sender_id, receiver_id=receiver_id, name=name,
-                    description=description, sender_city=sender_city, destination_city=destination_city
-                )
-                if new_id:
-                    flash(f'Pacote "{name}" adicionado com sucesso (ID: {new_id}).', 'success')
-                    return redirect(url_for('admin_dashboard'))
-                else:
-                    flash('Falha ao adicionar pacote (resposta inesperada do serviço).', 'danger')
-
-        except ValueError:
-             flash('IDs de remetente/destinatário inválidos.', 'warning')
-        except Fault as f:
-            flash(f"Erro ao adicionar pacote: {f.message}", 'danger')
-        except TransportError as te:
-             print(f"Erro de transporte ao contactar WS2: {te}")
-             flash('Erro de comunicação com o serviço de administração.', 'danger')
-        except Exception as e:
-            print(f"Erro inesperado em add_package: {type(e).__name__} - {e}")
-            flash('Ocorreu um erro inesperado ao adicionar o pacote.', 'danger')
-
-    return render_template('add_package.html', users=users) # Criar este template
-
-@app.route('/admin/package/delete/<int:package_id>', methods=['POST'])
-@login_required(role="admin")
-def delete_package(package_id):
-    if not client_ws2:
-        flash('Erro crítico: Serviço de administração indisponível.', 'danger')
-    else:
-        try:
-             success = client_ws2.service.removePackage(package_id=package_id)
-             if success:
-                  flash(f'Pacote {package_id} removido com sucesso.', 'success')
-             else:
-                  flash(f'Falha ao remover pacote {package_id} (resposta inesperada).', 'warning')
-        except Fault as f:
-             flash(f"Erro ao remover pacote: {f.message}", 'danger')
-        except TransportError as te:
-             print(f"Erro de transporte ao contactar WS2: {te}")
-             flash('Erro de comunicação com o serviço de administração.', 'danger')
-        except Exception as e:
-            print(f"Erro inesperado em delete_package: {type(e).__name__} - {e}")
-            flash('Ocorreu um erro inesperado ao remover o pacote.', 'danger')
-
-    return redirect(url_for('admin_dashboard'))
-
-@app.route('/admin/package/register_track/<int:package_id>', methods=['POST'])
-@login_required(role="admin")
-def register_track(package_id):
-     if not client_ws2:
-        flash('Erro crítico: Serviço de administração indisponível.', 'danger')
-     else:
-        try:
-            city = request.form.get('initial_city')
-            timestamp = datetime.utcnow() 
-
-            if not city:
-                 flash('Cidade inicial é obrigatória para registar rastreio.', 'warning')
-            else:
-                success = client_ws2.service.registerPackageTracking(
-                    package_id=package_id,
-                    initial_city=city,
-                    initial_time=timestamp 
-                )
-                if success:
-                    flash(f'Rastreio registado para pacote {package_id} a partir de {city}.', 'success')
-                else:
-                    flash('Falha ao registar rastreio (resposta inesperada).', 'warning')
-        except Fault as f:
-             flash(f"Erro ao registar rastreio: {f.message}", 'danger')
-        except TransportError as te:
-             flash('Erro de comunicação com o serviço de administração.', 'danger')
-        except Exception as e:
-            flash('Ocorreu um erro inesperado.', 'danger')
-
-     return redirect(url_for('admin_dashboard')) 
-
-@app.route('/admin/package/update_status/<int:package_id>', methods=['POST'])
-@login_required(role="admin")
-def update_status(package_id):
-    if not client_ws2:
-        flash('Erro crítico: Serviço de administração indisponível.', 'danger')
-    else:
-        try:
-            city = request.form.get('city')
-            timestamp = datetime.utcnow() 
-
-            if not city:
-                 flash('Cidade é obrigatória para atualizar estado.', 'warning')
-            else:
-                success = client_ws2.service.updatePackageStatus(
-                    package_id=package_id,
-                    city=city,
-                    time=timestamp
-                )
-                if success:
-                    flash(f'Estado do pacote {package_id} atualizado: Chegou a {city}.', 'success')
-                else:
-                    flash('Falha ao atualizar estado (resposta inesperada).', 'warning')
-        except Fault as f:
-             flash(f"Erro ao atualizar estado: {f.message}", 'danger')
-        except TransportError as te:
-             flash('Erro de comunicação com o serviço de administração.', 'danger')
-        except Exception as e:
-            flash('Ocorreu um erro inesperado.', 'danger')
-
-  
-    return redirect(url_for('admin_dashboard'))
-
-
-@app.errorhandler(404)
-def page_not_found(e):
-    return render_template('404.html'), 404 
-
-@app.errorhandler(500)
-def internal_server_error(e):
-    print(f"Internal Server Error: {e}") 
-    return render_template('500.html'), 500 
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=os.environ.get("FLASK_DEBUG", "0") == "1")
+from flask import (
+    Flask, Response, render_template, request, redirect, url_for, flash, session, abort, jsonify, g
+)
+from zeep import Settings, Transport
+from zeep.exceptions import Fault, TransportError
+import os
+import queue
+import tempfile
+import time
+from datetime import datetime 
+
+from package_import import READERS, start_import, get_import_job
+from soap_client import begin_read_state, make_client, make_session, wsdl_cache
+from fanout import CallGroup
+from resilience import ResilientClient
+from live_tracking import (
+    GONE, LIVE_BUSY_RETRY_MS, LIVE_KEEPALIVE, LIVE_RETRY_MS, LIVE_STREAM_SECONDS, TrackingHub, format_event
+)
+
+
+app = Flask(__name__)
+app.secret_key = os.environ.get("SECRET_KEY", "default_secret_key_for_dev") 
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("IMPORT_MAX_UPLOAD_MB", 200)) * 1024 * 1024
+
+
+@app.context_processor
+def inject_now():
+    """Injecta a função datetime.utcnow no contexto do template."""
+    return {'now': datetime.utcnow}
+
+
+
+WSDL_WS1 = os.environ.get('WSDL_WS1_URL', 'http://localhost:5001/ws1?wsdl') 
+WSDL_WS2 = os.environ.get('WSDL_WS2_URL', 'http://localhost:5002/ws2?wsdl')
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+USER_SEARCH_LIMIT = int(os.environ.get('USER_SEARCH_LIMIT', 20))
+
+# --- Configuração do Cliente SOAP (Zeep) ---
+
+settings = Settings(strict=False, xml_huge_tree=True)
+
+def _build_clients():
+    """Sessão HTTP, transporte e clientes dos dois serviços.
+
+    SOAP: os clientes são criados no primeiro pedido (e recriados se o
+    serviço ainda não estava no ar); SOAP_PROTOCOL=json/msgpack usa os
+    endpoints compactos dos serviços. Cada chamada passa pelo
+    ResilientClient (prazo por operação, retries, circuit breaker).
+    """
+    global http_session, transport, client_ws1, client_ws2
+    http_session = make_session()
+    transport = Transport(session=http_session, timeout=10, cache=wsdl_cache())
+    client_ws1 = ResilientClient('WS1', make_client('WS1', WSDL_WS1, settings, transport))
+    client_ws2 = ResilientClient('WS2', make_client('WS2', WSDL_WS2, settings, transport))
+
+_build_clients()
+
+def _tracking_changes(user_id, package_id, after_id):
+    """getTrackingChanges do WS1 -> ([{id, city, timestamp}], cursor)."""
+    changes = client_ws1.service.getTrackingChanges(user_id=user_id, package_id=package_id, after_id=after_id)
+    entries = (changes.entries.TrackingChange or []) if changes.entries else []
+    return [{'id': entry.id, 'city': entry.city, 'timestamp': entry.timestamp} for entry in entries], changes.cursor
+
+live_hub = TrackingHub(_tracking_changes)
+
+def reset_after_fork():
+    """Chamado em cada worker do gunicorn: as ligações HTTP do processo pai não são partilháveis."""
+    _build_clients()
+    live_hub.reset()
+
+
+@app.route('/health/clients')
+def client_stats():
+    """Circuit breaker, orçamento de retries e chamadas por operação de cada serviço."""
+    return jsonify({'WS1': client_ws1.stats(), 'WS2': client_ws2.stats()}), 200
+
+@app.route('/health/live')
+def live_stats():
+    """Browsers ligados às atualizações ao vivo e subscrições por pacote deste worker."""
+    return jsonify(live_hub.stats()), 200
+
+
+@app.before_request
+def _begin_read_state():
+    """As leituras logo a seguir a uma escrita deste utilizador vão ao primário (réplicas atrasadas)."""
+    g.read_state = begin_read_state(session.get('read_primary_until', 0.0))
+
+@app.after_request
+def _remember_read_state(response):
+    state = g.get('read_state')
+    if state is not None and state.primary_until > session.get('read_primary_until', 0.0):
+        session['read_primary_until'] = state.primary_until
+    return response
+
+
+# --- Decorador para verificar login ---
+from functools import wraps
+
+def login_required(role="client"):
+    """Verifica se o utilizador está logado e tem o role correto."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if 'user_id' not in session:
+                flash('Login necessário para aceder a esta página.', 'warning')
+                return redirect(url_for('login', next=request.url))
+            if session.get('role') != role and role != "any": 
+                 flash(f'Acesso não autorizado. Role necessário: {role}.', 'danger')
+                 return redirect(url_for('index')) 
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+# --- Rotas ---
+@app.route('/')
+def index():
+    if 'user_id' in session:
+        if session.get('role') == 'admin':
+            return redirect(url_for('admin_dashboard'))
+        else:
+            return redirect(url_for('client_dashboard'))
+    return redirect(url_for('login'))
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if 'user_id' in session: return redirect(url_for('index')) 
+
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+
+        if not client_ws1:
+             flash('Erro crítico: Serviço de autenticação indisponível.', 'danger')
+             return render_template('login.html')
+        if not username or not password:
+             flash('Utilizador e password são obrigatórios.', 'warning')
+             return render_template('login.html')
+
+        try:
+            user_info = client_ws1.service.login(username=username, password=password)
+
+            if user_info and user_info.user_id:
+                 session['user_id'] = user_info.user_id
+                 session['username'] = user_info.username 
+                 session['role'] = user_info.role
+                 flash(f'Login bem sucedido como {user_info.role}!', 'success')
+
+                 next_page = request.args.get('next')
+                 return redirect(next_page or url_for('index'))
+            else:
+                 flash('Resposta inesperada do serviço de login.', 'danger')
+
+        except Fault as f: 
+            flash(f"Erro: {f.message}", 'danger')
+        except TransportError as te:
+             print(f"Erro de transporte ao contactar WS1: {te}")
+             flash('Erro de comunicação com o serviço de autenticação.', 'danger')
+        except Exception as e:
+            print(f"Erro inesperado no login: {type(e).__name__} - {e}")
+            flash('Ocorreu um erro inesperado durante o login.', 'danger')
+
+    return render_template('login.html')
+
+@app.route('/register', methods=['GET', 'POST'])
+def register():
+    if 'user_id' in session: return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        username = request.form.get('username')
+        password = request.form.get('password')
+        confirm_password = request.form.get('confirm_password')
+        email = request.form.get('email')
+
+        if not client_ws1:
+             flash('Erro crítico: Serviço de registo indisponível.', 'danger')
+             return render_template('register.html')
+
+        error = None
+        if not username: error = 'Username é obrigatório.'
+        elif not password: error = 'Password é obrigatória.'
+        elif password != confirm_password: error = 'Passwords não coincidem.'
+        elif not email: error = 'Email é obrigatório.'
+
+        if error:
+             flash(error, 'warning')
+        else:
+            try:
+                success = client_ws1.service.register(username=username, password=password, email=email)
+                if success:
+                    flash('Registo bem sucedido! Pode agora fazer login.', 'success')
+                    return redirect(url_for('login'))
+                else:
+                    flash('Erro desconhecido no registo.', 'danger')
+            except Fault as f:
+                flash(f"Erro no registo: {f.message}", 'danger')
+            except TransportError as te:
+                 print(f"Erro de transporte ao contactar WS1: {te}")
+                 flash('Erro de comunicação com o serviço de registo.', 'danger')
+            except Exception as e:
+                print(f"Erro inesperado no registo: {type(e).__name__} - {e}")
+                flash('Ocorreu um erro inesperado durante o registo.', 'danger')
+
+    return render_template('register.html')
+
+@app.route('/logout')
+def logout():
+    session.pop('user_id', None)
+    session.pop('username', None)
+    session.pop('role', None)
+    flash('Logout bem sucedido.', 'info')
+    return redirect(url_for('login'))
+
+@app.route('/dashboard/client')
+@login_required(role="client")
+def client_dashboard():
+    packages = []
+    next_cursor = None
+    if not client_ws1:
+        flash('Erro crítico: Serviço de pacotes indisponível.', 'danger')
+    else:
+        try:
+            user_id = session['user_id']
+            search_term = request.args.get('search', '') 
+            cursor = request.args.get('cursor') or None
+
+            if search_term:
+                 page = client_ws1.service.searchPackagesPage(user_id=user_id, search_term=search_term,
+                                                              page_size=PAGE_SIZE, cursor=cursor)
+                 flash(f'Mostrando resultados para "{search_term}".', 'info')
+            else:
+                 page = client_ws1.service.listPackagesPage(user_id=user_id, page_size=PAGE_SIZE, cursor=cursor)
+
+            if page and page.packages:
+                 packages = page.packages.PackageInfo or []
+            next_cursor = page.next_cursor if page else None
+
+        except Fault as f:
+            flash(f"Erro ao buscar pacotes: {f.message}", 'danger')
+        except TransportError as te:
+             print(f"Erro de transporte ao contactar WS1: {te}")
+             flash('Erro de comunicação com o serviço de pacotes.', 'danger')
+        except Exception as e:
+            print(f"Erro inesperado no client dashboard: {type(e).__name__} - {e}")
+            flash('Ocorreu um erro inesperado ao carregar os seus pacotes.', 'danger')
+
+    return render_template('client_dashboard.html', packages=packages, next_cursor=next_cursor)
+
+
+@app.route('/package/<int:package_id>')
+@login_required(role="any")
+def package_details(package_id):
+    package_info = None
+    tracking_history = []
+    live_cursor = None
+    error_msg = None
+
+    if not client_ws1:
+         error_msg = 'Erro crítico: Serviço de pacotes indisponível.'
+    else:
+        try:
+            details = client_ws1.service.getPackageDetails(user_id=session['user_id'], package_id=package_id)
+            package_info = details.package
+            if details.tracking_history:
+                tracking_history = details.tracking_history.TrackingStatus or []
+            # Cursor lido pelo WS1 antes do histórico; None se não conseguiu lê-lo (sem live)
+            live_cursor = details.tracking_cursor
+            if live_cursor is None:
+                print(f"Atualizações ao vivo indisponíveis para o pacote {package_id}")
+
+        except Fault as f:
+            if f.code and f.code.endswith('Client.NotFound'):
+                 abort(404, description="Pacote não encontrado ou não pertence a si.")
+            error_msg = f"Erro ao buscar detalhes do pacote: {f.message}"
+        except TransportError as te:
+             error_msg = 'Erro de comunicação com o serviço de pacotes.'
+             print(f"Erro de transporte ao contactar WS1: {te}")
+        except Exception as e:
+            error_msg = 'Ocorreu um erro inesperado.'
+            print(f"Erro inesperado em package_details: {type(e).__name__} - {e}")
+
+    if error_msg: flash(error_msg, 'danger')
+
+    return render_template('package_details.html', 
+                            package=package_info,
+                            tracking_history=tracking_history,
+                            live_cursor=live_cursor)
+
+
+def _sse_retry(milliseconds):
+    """Resposta SSE vazia: o browser volta a ligar daqui a ``milliseconds``."""
+    return Response(f"retry: {milliseconds}\n\n", mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@app.route('/package/<int:package_id>/live')
+@login_required(role="any")
+def package_live(package_id):
+    """Server-sent events com as entradas de rastreio novas do pacote (ver live_tracking.py)."""
+    try:
+        cursor = int(request.headers.get('Last-Event-ID') or request.args.get('cursor', ''))
+    except ValueError:
+        abort(400, description="Cursor inválido.")
+    if not client_ws1 or not live_hub.has_capacity():
+        return _sse_retry(LIVE_BUSY_RETRY_MS)
+    user_id = session['user_id']
+    try:
+        # Controlo de acesso e entradas gravadas desde que a página foi gerada
+        entries, cursor = _tracking_changes(user_id, package_id, cursor)
+    except Fault as f:
+        if f.code and f.code.endswith('Client.NotFound'):
+            abort(404, description="Pacote não encontrado ou não pertence a si.")
+        print(f"Erro getTrackingChanges: {f.message}")
+        return _sse_retry(LIVE_BUSY_RETRY_MS)
+    except Exception as e:
+        print(f"Erro getTrackingChanges: {type(e).__name__} - {e}")
+        return _sse_retry(LIVE_BUSY_RETRY_MS)
+    watcher = live_hub.watch(user_id, package_id, cursor)
+    if watcher is None:
+        return _sse_retry(LIVE_BUSY_RETRY_MS)
+
+    def stream():
+        try:
+            yield f"retry: {LIVE_RETRY_MS}\n\n"
+            if entries: yield format_event(entries, cursor)
+            ends_at = time.monotonic() + LIVE_STREAM_SECONDS
+            while True:
+                remaining = ends_at - time.monotonic()
+                if remaining <= 0: return  # o browser reconecta com o Last-Event-ID
+                try:
+                    item = watcher.queue.get(timeout=min(LIVE_KEEPALIVE, remaining))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is GONE:
+                    yield "event: gone\ndata: {}\n\n"
+                    return
+                yield format_event(*item)
+        finally:
+            live_hub.unwatch(watcher)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _count_items(array):
+    """Array(CountItem) do WS2 -> [(chave, total)] (o zeep devolve None para arrays vazios)."""
+    return [(item.key, item.count) for item in (array.CountItem or [])] if array else []
+
+@app.route('/dashboard/admin')
+@login_required(role="admin")
+def admin_dashboard():
+    packages = []
+    next_cursor = None
+    stats = None
+    if not client_ws2:
+         flash('Erro crítico: Serviço de administração indisponível.', 'danger')
+    else:
+        with CallGroup() as calls:
+            # Os totais vêm em paralelo com a página; se falharem a página mostra-se sem eles
+            calls.submit('stats', client_ws2.service.getDashboardStats)
+            try:
+                 cursor = request.args.get('cursor') or None
+                 page = client_ws2.service.getAllPackagesPage(page_size=PAGE_SIZE, cursor=cursor)
+                 if page and page.packages:
+                      packages = page.packages.PackageInfoAdmin or []
+                 next_cursor = page.next_cursor if page else None
+            except Fault as f:
+                flash(f"Erro ao buscar pacotes: {f.message}", 'danger')
+            except TransportError as te:
+                 print(f"Erro de transporte ao contactar WS2: {te}")
+                 flash('Erro de comunicação com o serviço de administração.', 'danger')
+            except Exception as e:
+                print(f"Erro inesperado no admin dashboard: {type(e).__name__} - {e}")
+                flash('Ocorreu um erro inesperado ao carregar os pacotes.', 'danger')
+
+            try:
+                 result = calls.result('stats')
+                 if result:
+                      stats = {'total_packages': result.total_packages, 'tracked': result.tracked,
+                               'untracked': result.untracked}
+                      for field in ('by_origin', 'by_destination', 'created_per_hour', 'updated_per_hour'):
+                           stats[field] = _count_items(getattr(result, field))
+            except Exception as e:
+                 print(f"Erro getDashboardStats: {e}")
+
+    return render_template('admin_dashboard.html', packages=packages, next_cursor=next_cursor, stats=stats)
+
+@app.route('/admin/users/search')
+@login_required(role="admin")
+def search_users():
+    """Sugestões (JSON) para os campos remetente/destinatário do formulário de pacotes."""
+    prefix = request.args.get('q', '').strip()
+    if not prefix: return jsonify([])
+    if not client_ws2: return jsonify({'error': 'Serviço de administração indisponível.'}), 503
+    try:
+        result = client_ws2.service.searchUsers(prefix=prefix, limit=USER_SEARCH_LIMIT)
+    except Exception as e:
+        print(f"Erro searchUsers: {e}")
+        return jsonify({'error': 'Erro ao pesquisar utilizadores.'}), 502
+    users = result or []  # o zeep desembrulha o Array (None se vazio)
+    return jsonify([{'id': user.id, 'username': user.username} for user in users])
+
+@app.route('/admin/package/add', methods=['GET', 'POST'])
+@login_required(role="admin")
+def add_package():
+    if not client_ws2:
+        flash('Erro crítico: Serviço de administração indisponível.', 'danger')
+        return render_template('add_package.html', form={})
+
+    if request.method == 'POST':
+        try:
+            sender_id = int(request.form.get('sender_id'))
+            receiver_id = int(request.form.get('receiver_id'))
+            name = request.form.get('name')
+            description = request.form.get('description')
+            sender_city = request.form.get('sender_city')
+            destination_city = request.form.get('destination_city')
+
+            if not all([sender_id, receiver_id, name, sender_city, destination_city]):
+                 flash('Todos os campos obrigatórios devem ser preenchidos.', 'warning')
+            else:
+                new_id = client_ws2.service.addPackage(
+                    sender_id=sender_id, receiver_id=receiver_id, name=name,
+                    description=description, sender_city=sender_city, destination_city=destination_city
+                )
+                if new_id:
+                    flash(f'Pacote "{name}" adicionado com sucesso (ID: {new_id}).', 'success')
+                    return redirect(url_for('admin_dashboard'))
+                else:
+                    flash('Falha ao adicionar pacote (resposta inesperada do serviço).', 'danger')
+
+        except (TypeError, ValueError):
+             flash('Escolha o remetente e o destinatário da lista de sugestões.', 'warning')
+        except Fault as f:
+            flash(f"Erro ao adicionar pacote: {f.message}", 'danger')
+        except TransportError as te:
+             print(f"Erro de transporte ao contactar WS2: {te}")
+             flash('Erro de comunicação com o serviço de administração.', 'danger')
+        except Exception as e:
+            print(f"Erro inesperado em add_package: {type(e).__name__} - {e}")
+            flash('Ocorreu um erro inesperado ao adicionar o pacote.', 'danger')
+
+    # Volta a mostrar o que foi escrito (os utilizadores já não vêm de uma lista completa)
+    return render_template('add_package.html', form=request.form)
+
+@app.route('/admin/package/import', methods=['GET', 'POST'])
+@login_required(role="admin")
+def import_packages():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        extension = os.path.splitext(upload.filename or '')[1].lower().lstrip('.') if upload else ''
+        if not client_ws2:
+             flash('Erro crítico: Serviço de administração indisponível.', 'danger')
+        elif not upload or not upload.filename:
+             flash('Selecione um ficheiro para importar.', 'warning')
+        elif extension not in READERS:
+             flash('Formato não suportado: use um ficheiro .csv ou .xml.', 'warning')
+        else:
+            fd, path = tempfile.mkstemp(prefix='import_', suffix='.' + extension)
+            with os.fdopen(fd, 'wb') as tmp:
+                upload.save(tmp)  # copia em blocos; o ficheiro nunca fica todo em memória
+            job = start_import(path, extension, client_ws2, filename=upload.filename)
+            return redirect(url_for('import_status', job_id=job.id))
+
+    return render_template('import_packages.html')
+
+@app.route('/admin/package/import/<job_id>')
+@login_required(role="admin")
+def import_status(job_id):
+    job = get_import_job(job_id)
+    if job is None:
+        abort(404, description="Importação não encontrada.")
+    return render_template('import_status.html', job=job)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    flash('Ficheiro demasiado grande para importar.', 'danger')
+    return redirect(url_for('import_packages'))
+
+@app.route('/admin/package/delete/<int:package_id>', methods=['POST'])
+@login_required(role="admin")
+def delete_package(package_id):
+    if not client_ws2:
+        flash('Erro crítico: Serviço de administração indisponível.', 'danger')
+    else:
+        try:
+             success = client_ws2.service.removePackage(package_id=package_id)
+             if success:
+                  flash(f'Pacote {package_id} removido com sucesso.', 'success')
+             else:
+                  flash(f'Falha ao remover pacote {package_id} (resposta inesperada).', 'warning')
+        except Fault as f:
+             flash(f"Erro ao remover pacote: {f.message}", 'danger')
+        except TransportError as te:
+             print(f"Erro de transporte ao contactar WS2: {te}")
+             flash('Erro de comunicação com o serviço de administração.', 'danger')
+        except Exception as e:
+            print(f"Erro inesperado em delete_package: {type(e).__name__} - {e}")
+            flash('Ocorreu um erro inesperado ao remover o pacote.', 'danger')
+
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/package/register_track/<int:package_id>', methods=['POST'])
+@login_required(role="admin")
+def register_track(package_id):
+     if not client_ws2:
+        flash('Erro crítico: Serviço de administração indisponível.', 'danger')
+     else:
+        try:
+            city = request.form.get('initial_city')
+            timestamp = datetime.utcnow() 
+
+            if not city:
+                 flash('Cidade inicial é obrigatória para registar rastreio.', 'warning')
+            else:
+                success = client_ws2.service.registerPackageTracking(
+                    package_id=package_id,
+                    initial_city=city,
+                    initial_time=timestamp 
+                )
+                if success:
+                    flash(f'Rastreio registado para pacote {package_id} a partir de {city}.', 'success')
+                else:
+                    flash('Falha ao registar rastreio (resposta inesperada).', 'warning')
+        except Fault as f:
+             flash(f"Erro ao registar rastreio: {f.message}", 'danger')
+        except TransportError as te:
+             flash('Erro de comunicação com o serviço de administração.', 'danger')
+        except Exception as e:
+            flash('Ocorreu um erro inesperado.', 'danger')
+
+     return redirect(url_for('admin_dashboard')) 
+
+@app.route('/admin/package/update_status/<int:package_id>', methods=['POST'])
+@login_required(role="admin")
+def update_status(package_id):
+    if not client_ws2:
+        flash('Erro crítico: Serviço de administração indisponível.', 'danger')
+    else:
+        try:
+            city = request.form.get('city')
+            timestamp = datetime.utcnow() 
+
+            if not city:
+                 flash('Cidade é obrigatória para atualizar estado.', 'warning')
+            else:
+                # wait: com write-behind no WS2 só responde depois de gravado,
+                # para a página seguinte já mostrar a nova entrada
+                success = client_ws2.service.updatePackageStatus(
+                    package_id=package_id,
+                    city=city,
+                    time=timestamp,
+                    wait=True
+                )
+                if success:
+                    flash(f'Estado do pacote {package_id} atualizado: Chegou a {city}.', 'success')
+                else:
+                    flash('Falha ao atualizar estado (resposta inesperada).', 'warning')
+        except Fault as f:
+             flash(f"Erro ao atualizar estado: {f.message}", 'danger')
+        except TransportError as te:
+             flash('Erro de comunicação com o serviço de administração.', 'danger')
+        except Exception as e:
+            flash('Ocorreu um erro inesperado.', 'danger')
+
+  
+    return redirect(url_for('admin_dashboard'))
+
+
+@app.errorhandler(404)
+def page_not_found(e):
+    return render_template('404.html'), 404 
+
+@app.errorhandler(500)
+def internal_server_error(e):
+    print(f"Internal Server Error: {e}") 
+    return render_template('500.html'), 500 
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get("FLASK_DEBUG", "0") == "1")
     
\ No newline at end of file
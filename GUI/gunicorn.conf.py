@@ -0,0 +1,44 @@
+"""Configuração do gunicorn para a GUI em produção.
+
+    gunicorn -c gunicorn.conf.py gui_app:app
+
+Tudo é configurável por variáveis GUNICORN_*. Cada worker cria a sua
+sessão HTTP e os seus clientes SOAP em post_fork; os WSDL vêm da cache em
+disco partilhada (WSDL_CACHE_PATH) e o estado das importações também fica
+em disco (IMPORT_JOBS_DIR), para a página de progresso funcionar em
+qualquer worker.
+
+GUNICORN_WORKER_CLASS=gevent usa workers cooperativos: cada stream das
+atualizações ao vivo deixa de ocupar uma thread, por isso o limite por
+worker (LIVE_MAX_STREAMS) sobe para metade de GUNICORN_WORKER_CONNECTIONS.
+"""
+import os
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# Ligações simultâneas por worker gevent
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+if worker_class == "gevent":
+    # Tem de acontecer antes de a aplicação ser importada (preload): as
+    # sessões HTTP dos clientes SOAP, as threads do live e os locks passam
+    # a ser cooperativos.
+    from gevent import monkey
+    monkey.patch_all()
+    os.environ.setdefault("LIVE_MAX_STREAMS", str(worker_connections // 2))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 50))
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    import gui_app
+    gui_app.reset_after_fork()
@@ -0,0 +1,162 @@
+"""Atualizações ao vivo do histórico de rastreio na página de detalhes (server-sent events).
+
+Cada browser com a página aberta mantém um ``EventSource`` ligado a
+``/package/<id>/live``; a GUI envia-lhe só as entradas novas, à medida que
+o ``updatePackageStatus`` as grava. O cursor é o id da última entrada que o
+browser já tem (o WS1 ``getTrackingChanges`` devolve as entradas seguintes)
+e vai como id de cada evento, por isso ao reconectar o browser recomeça
+onde ficou (``Last-Event-ID``).
+
+O ``TrackingHub`` junta todos os browsers que veem o mesmo pacote numa só
+subscrição: uma thread por pacote pergunta ao WS1 a cada
+LIVE_POLL_INTERVAL segundos (enquanto houver alguém a ver) e distribui o
+resultado pelas filas de cada browser. Cada ligação nova faz uma chamada
+ao WS1 (controlo de acesso e entradas em atraso) antes de entrar na
+subscrição.
+
+Com o worker gthread cada stream ocupa uma thread do worker: por isso
+cada stream dura no máximo LIVE_STREAM_SECONDS (o browser reconecta
+sozinho) e há no máximo LIVE_MAX_STREAMS por worker; acima disso a
+ligação é recusada com um ``retry`` longo e o browser tenta mais tarde.
+Para muitos browsers em simultâneo usar GUNICORN_WORKER_CLASS=gevent.
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from zeep.exceptions import Fault
+
+LIVE_POLL_INTERVAL = float(os.environ.get("LIVE_POLL_INTERVAL", 2))
+LIVE_STREAM_SECONDS = float(os.environ.get("LIVE_STREAM_SECONDS", 55))
+LIVE_KEEPALIVE = float(os.environ.get("LIVE_KEEPALIVE", 15))
+LIVE_MAX_STREAMS = int(os.environ.get("LIVE_MAX_STREAMS", 4))
+# Tempo (ms) até o browser reconectar: normal e quando o worker está cheio
+LIVE_RETRY_MS = int(os.environ.get("LIVE_RETRY_MS", 2000))
+LIVE_BUSY_RETRY_MS = int(os.environ.get("LIVE_BUSY_RETRY_MS", 30000))
+
+# Na fila de um browser: o pacote deixou de estar acessível
+GONE = None
+
+
+def format_event(entries, cursor):
+    """Evento SSE 'tracking' com as entradas novas; o id é o cursor para o Last-Event-ID."""
+    data = json.dumps([{'city': entry['city'], 'timestamp': entry['timestamp']} for entry in entries])
+    return f"id: {cursor}\nevent: tracking\ndata: {data}\n\n"
+
+
+def _is_not_found(fault):
+    return bool(fault.code and fault.code.endswith('Client.NotFound'))
+
+
+class Watcher:
+    """Um browser a ver um pacote: a sua fila e até onde já recebeu."""
+
+    def __init__(self, user_id, package_id, cursor):
+        self.user_id = user_id
+        self.package_id = package_id
+        self.cursor = cursor
+        self.queue = queue.Queue()
+
+
+class _Subscription:
+    def __init__(self, package_id, cursor):
+        self.package_id = package_id
+        self.cursor = cursor  # menor cursor pedido ainda não consultado
+        self.watchers = set()
+
+
+class TrackingHub:
+    """Subscrições por pacote partilhadas pelos browsers do worker (ver o docstring do módulo).
+
+    ``fetch(user_id, package_id, after_id)`` devolve ``(entradas, cursor)``,
+    com as entradas como dicts ``{id, city, timestamp}`` por ordem de id.
+    """
+
+    def __init__(self, fetch, poll_interval=LIVE_POLL_INTERVAL, max_watchers=LIVE_MAX_STREAMS):
+        self._fetch = fetch
+        self.poll_interval = poll_interval
+        self.max_watchers = max_watchers
+        self.reset()
+
+    def reset(self):
+        """Depois de um fork as threads do pai não existem no filho."""
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._watching = 0
+        self._stats = {'watches': 0, 'rejected': 0, 'polls': 0, 'failures': 0, 'entries_sent': 0}
+
+    def has_capacity(self):
+        with self._lock:
+            return self._watching < self.max_watchers
+
+    def watch(self, user_id, package_id, cursor):
+        """Junta o browser à subscrição do pacote (criando-a); None se o worker já está cheio."""
+        with self._lock:
+            if self._watching >= self.max_watchers:
+                self._stats['rejected'] += 1
+                return None
+            watcher = Watcher(user_id, package_id, cursor)
+            subscription = self._subscriptions.get(package_id)
+            if subscription is None:
+                subscription = self._subscriptions[package_id] = _Subscription(package_id, cursor)
+                threading.Thread(target=self._poll, args=(subscription,),
+                                 name=f'live-tracking-{package_id}', daemon=True).start()
+            else:
+                subscription.cursor = min(subscription.cursor, cursor)
+            subscription.watchers.add(watcher)
+            self._watching += 1
+            self._stats['watches'] += 1
+        return watcher
+
+    def unwatch(self, watcher):
+        with self._lock:
+            subscription = self._subscriptions.get(watcher.package_id)
+            if subscription is None or watcher not in subscription.watchers: return
+            subscription.watchers.discard(watcher)
+            self._watching -= 1
+            if not subscription.watchers:
+                # A thread vê que a subscrição já não está registada e termina
+                del self._subscriptions[watcher.package_id]
+
+    def _poll(self, subscription):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if self._subscriptions.get(subscription.package_id) is not subscription: return
+                # Qualquer browser serve: todos passaram pelo controlo de acesso ao ligar
+                watcher = next(iter(subscription.watchers))
+                after_id = subscription.cursor
+                self._stats['polls'] += 1
+            try:
+                entries, cursor = self._fetch(watcher.user_id, subscription.package_id, after_id)
+            except Fault as f:
+                if not _is_not_found(f): self._failed(subscription, f)
+                else: watcher.queue.put(GONE)  # pacote removido (ou acesso retirado)
+                continue
+            except Exception as e:
+                self._failed(subscription, e)
+                continue
+            with self._lock:
+                # Se entretanto entrou um browser com um cursor mais antigo, fica esse
+                if subscription.cursor == after_id and cursor is not None:
+                    subscription.cursor = cursor
+                for member in subscription.watchers:
+                    fresh = [entry for entry in entries if entry['id'] > member.cursor]
+                    if not fresh: continue
+                    member.cursor = fresh[-1]['id']
+                    member.queue.put((fresh, member.cursor))
+                    self._stats['entries_sent'] += len(fresh)
+
+    def _failed(self, subscription, error):
+        print(f"Erro ao consultar o rastreio do pacote {subscription.package_id}: {type(error).__name__} - {error}")
+        with self._lock:
+            self._stats['failures'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(watching=self._watching, packages=len(self._subscriptions),
+                         max_watchers=self.max_watchers)
+        return stats
@@ -0,0 +1,242 @@
+"""Importação em massa de pacotes (CSV ou XML) para a área de administração.
+
+O ficheiro enviado fica num ficheiro temporário e é lido registo a registo
+numa thread em segundo plano; os registos seguem para o WS2
+(``importPackages``) em blocos de ``IMPORT_BATCH_ROWS``. Nunca há mais do
+que um bloco em memória, e a página de estado mostra o progresso (lido de
+IMPORT_JOBS_DIR, por isso funciona com vários workers).
+
+Formato CSV (com cabeçalho):
+    sender_username,receiver_username,name,description,sender_city,destination_city
+
+Formato XML:
+    <packages><package><sender_username>...</sender_username>...</package>...</packages>
+"""
+import csv
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from lxml import etree
+from zeep.exceptions import Fault, TransportError
+
+IMPORT_FIELDS = ('sender_username', 'receiver_username', 'name', 'description', 'sender_city', 'destination_city')
+REQUIRED_COLUMNS = ('sender_username', 'receiver_username', 'name', 'sender_city', 'destination_city')
+
+IMPORT_BATCH_ROWS = int(os.environ.get('IMPORT_BATCH_ROWS', 1000))
+MAX_REPORTED_ERRORS = int(os.environ.get('IMPORT_MAX_REPORTED_ERRORS', 200))
+MAX_FINISHED_JOBS = 20
+# Estado das importações, partilhado pelos workers do gunicorn (mesmo disco)
+IMPORT_JOBS_DIR = os.environ.get('IMPORT_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'gui_import_jobs'))
+IMPORT_HEARTBEAT = float(os.environ.get('IMPORT_HEARTBEAT', 5))
+IMPORT_STALE_AFTER = float(os.environ.get('IMPORT_STALE_AFTER', 30))
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+_JOB_FILE = re.compile(r'[0-9a-f]{32}\.json')
+
+
+def _clean(value):
+    value = (value or '').strip()
+    return value or None
+
+
+def iter_csv_rows(path):
+    """Lê o CSV um registo de cada vez."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"colunas em falta no cabeçalho: {', '.join(missing)}")
+        for row in reader:
+            yield {field: _clean(row.get(field)) for field in IMPORT_FIELDS}
+
+
+def iter_xml_rows(path):
+    """Lê os elementos <package> um de cada vez, libertando os já processados."""
+    for _, elem in etree.iterparse(path, events=('end',), tag='package',
+                                   resolve_entities=False, no_network=True, huge_tree=True):
+        yield {field: _clean(elem.findtext(field)) for field in IMPORT_FIELDS}
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+READERS = {'csv': iter_csv_rows, 'xml': iter_xml_rows}
+
+
+class ImportJob:
+    """Uma importação em curso ou terminada (status: pending, running, done, failed).
+
+    O estado é gravado num ficheiro JSON em IMPORT_JOBS_DIR (partilhado
+    pelos workers, como a cache de WSDL) no arranque, depois de cada bloco
+    e a cada IMPORT_HEARTBEAT segundos, por isso a página de estado pode
+    ser servida por qualquer worker.
+    """
+
+    def __init__(self, path, file_format, client, filename=None):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = 'pending'
+        self.rows_read = 0
+        self.rows_confirmed = 0  # registos já processados pelo WS2
+        self.imported = 0
+        self.failed = 0
+        self.errors = []  # (registo, mensagem), no máximo MAX_REPORTED_ERRORS
+        self.message = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._path = path
+        self._reader = READERS[file_format]
+        self._client = client
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    def run(self):
+        self.status = 'running'
+        heartbeat = threading.Thread(target=self._heartbeat, name=f"import-heartbeat-{self.id}", daemon=True)
+        heartbeat.start()
+        try:
+            batch = []
+            for row in self._reader(self._path):
+                self.rows_read += 1
+                batch.append(row)
+                if len(batch) >= IMPORT_BATCH_ROWS:
+                    self._send(batch)
+                    batch = []
+            if batch:
+                self._send(batch)
+            self.status = 'done'
+        except (ValueError, csv.Error, etree.XMLSyntaxError, UnicodeDecodeError) as e:
+            self._fail(f"Ficheiro inválido perto do registo {self.rows_read + 1}: {e}")
+        except Fault as f:
+            self._fail(f"Erro do serviço de administração: {f.message}")
+        except TransportError as te:
+            print(f"Erro de transporte ao contactar WS2 na importação: {te}")
+            self._fail("Erro de comunicação com o serviço de administração.")
+        except Exception as e:
+            print(f"Erro inesperado na importação {self.id}: {type(e).__name__} - {e}")
+            self._fail("Ocorreu um erro inesperado durante a importação.")
+        finally:
+            self.finished_at = time.time()
+            self._finished.set()
+            self.save()
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+
+    def _heartbeat(self):
+        while not self._finished.wait(IMPORT_HEARTBEAT):
+            self.save()
+
+    def _fail(self, message):
+        self.status = 'failed'
+        self.message = message
+
+    def _send(self, batch):
+        first_row = self.rows_read - len(batch) + 1
+        result = self._client.service.importPackages(rows={'PackageImportRow': batch})
+        errors = result.errors.PackageImportError if result.errors else []
+        with self._lock:
+            self.rows_confirmed = first_row + len(batch) - 1
+            self.imported += result.imported or 0
+            self.failed += len(errors)
+            for error in errors:
+                if len(self.errors) >= MAX_REPORTED_ERRORS: break
+                self.errors.append((first_row + error.row, error.error))
+        self.save()
+
+    def snapshot(self):
+        """Estado atual para a página de progresso."""
+        with self._lock:
+            return {
+                'id': self.id, 'filename': self.filename, 'status': self.status,
+                'rows_read': self.rows_read, 'rows_confirmed': self.rows_confirmed, 'imported': self.imported, 'failed': self.failed,
+                'errors': list(self.errors), 'errors_truncated': self.failed > len(self.errors),
+                'message': self.message, 'started_at': self.started_at, 'finished_at': self.finished_at,
+                'elapsed': (self.finished_at or time.time()) - self.started_at,
+            }
+
+    def save(self):
+        """Grava o estado (com a hora, para se saber se o worker ainda está vivo)."""
+        state = self.snapshot()
+        state['heartbeat'] = time.time()
+        try:
+            _write_state(state)
+        except OSError as e:
+            print(f"Erro ao gravar o estado da importação {self.id}: {e}")
+
+
+def _job_file(job_id):
+    return os.path.join(IMPORT_JOBS_DIR, f"{job_id}.json")
+
+
+def _write_state(state):
+    """Escrita atómica (ficheiro temporário + rename): quem lê nunca vê um JSON a meio."""
+    os.makedirs(IMPORT_JOBS_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=IMPORT_JOBS_DIR, prefix='.job_')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp, _job_file(state['id']))
+
+
+def _read_state(job_id):
+    try:
+        with open(_job_file(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _prune_finished_jobs():
+    """Mantém só os MAX_FINISHED_JOBS ficheiros de importações terminadas mais recentes."""
+    try:
+        names = [name for name in os.listdir(IMPORT_JOBS_DIR) if _JOB_FILE.fullmatch(name)]
+    except OSError:
+        return
+    finished = []
+    for name in names:
+        state = _read_state(name[:-len('.json')])
+        if state and state.get('finished_at'): finished.append((state['finished_at'], name))
+    for _, name in sorted(finished)[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        try:
+            os.remove(os.path.join(IMPORT_JOBS_DIR, name))
+        except OSError:
+            pass
+
+
+def start_import(path, file_format, client, filename=None):
+    """Arranca a importação do ficheiro ``path`` numa thread e devolve o job."""
+    _prune_finished_jobs()
+    job = ImportJob(path, file_format, client, filename)
+    job.save()
+    threading.Thread(target=job.run, name=f"import-{job.id}", daemon=True).start()
+    return job
+
+
+def get_import_job(job_id):
+    """Estado (dict de ``ImportJob.snapshot``) da importação, lido do ficheiro partilhado; None se não existir.
+
+    Uma importação em curso cujo worker deixou de dar sinal há mais de
+    IMPORT_STALE_AFTER segundos (reinício ou reciclagem do worker) é dada
+    como interrompida, com os totais já confirmados pelo WS2.
+    """
+    if not _JOB_ID.fullmatch(job_id or ''): return None
+    state = _read_state(job_id)
+    if state is None: return None
+    if state['status'] in ('pending', 'running') and time.time() - state['heartbeat'] > IMPORT_STALE_AFTER:
+        state.update(status='failed', finished_at=state['heartbeat'], message=(
+            f"o servidor foi reiniciado durante a importação. Os registos até ao "
+            f"{state['rows_confirmed']} foram processados; o bloco seguinte pode ou não ter sido "
+            f"gravado e os restantes não foram importados."))
+        try:
+            _write_state(state)
+        except OSError as e:
+            print(f"Erro ao gravar o estado da importação {job_id}: {e}")
+    state['elapsed'] = (state['finished_at'] or time.time()) - state['started_at']
+    state['errors'] = [tuple(error) for error in state['errors']]
+    return state
@@ -0,0 +1,269 @@
+"""Prazos por operação, retries limitados e circuit breaker nas chamadas aos serviços.
+
+``ResilientClient`` embrulha ``client_ws1``/``client_ws2`` (zeep ou
+compacto) sem mudar a forma de chamar (``client.service.operacao(...)``):
+
+- cada operação tem o seu prazo (SOAP_DEADLINES), aplicado como timeout do
+  pedido HTTP: um checkStatus lento falha em 2s em vez de prender a thread
+  do worker 10s;
+- as leituras (idempotentes) são repetidas uma vez em caso de falha de
+  rede, dentro do mesmo prazo e só enquanto houver orçamento de retries
+  (no máximo ~RETRY_BUDGET_RATIO das chamadas), para que os retries não
+  multipliquem a carga de um serviço que já está em dificuldades;
+- depois de BREAKER_FAILURES falhas seguidas o serviço fica "aberto"
+  durante BREAKER_RESET segundos: as chamadas falham logo com
+  ``CircuitOpen`` (um ``TransportError``, tratado pelas páginas como
+  serviço indisponível) e ``if not client`` é falso. Passado esse tempo
+  uma chamada de teste decide se volta a fechar.
+
+Só contam como falhas do serviço os erros de rede e timeouts
+(``requests.RequestException``, ``TransportError``, incluindo o
+``CallTimeout`` do CallGroup) e as respostas HTTP 5xx. Faults do serviço,
+HTTP 4xx e erros do lado da GUI (argumentos inválidos, ``ValidationError``
+do zeep) não abrem o circuito.
+
+Estes prazos são os únicos da GUI: o CallGroup (fanout.py) espera por cada
+chamada o prazo da sua operação.
+"""
+import os
+import threading
+import time
+
+import requests
+from zeep.exceptions import Fault, TransportError
+
+from soap_client import call_timeout
+
+DEFAULT_DEADLINE = float(os.environ.get("SOAP_DEFAULT_DEADLINE", 10))
+RETRY_ATTEMPTS = int(os.environ.get("SOAP_RETRY_ATTEMPTS", 2))
+RETRY_BUDGET_RATIO = float(os.environ.get("SOAP_RETRY_BUDGET_RATIO", 0.1))
+RETRY_BUDGET_MIN = float(os.environ.get("SOAP_RETRY_BUDGET_MIN", 10))
+BREAKER_FAILURES = int(os.environ.get("SOAP_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.environ.get("SOAP_BREAKER_RESET", 30))
+
+# Prazo (s) por operação; SOAP_DEADLINES="checkStatus=1.5,getAllPackages=30" altera-os
+DEADLINES = {
+    'login': 5, 'register': 5,
+    'checkStatus': 2, 'getPackageDetails': 3, 'getTrackingChanges': 2,
+    'listPackages': 5, 'listPackagesPage': 5, 'searchPackages': 5, 'searchPackagesPage': 5,
+    'searchUsers': 2, 'getAllUsers': 10, 'getDashboardStats': 3,
+    'getAllPackages': 30, 'getAllPackagesPage': 8,
+    'addPackage': 5, 'removePackage': 5, 'registerPackageTracking': 5, 'updatePackageStatus': 10,
+    'bulkUpdatePackageStatus': 30, 'importPackages': 60,
+}
+for _item in filter(None, os.environ.get("SOAP_DEADLINES", "").split(",")):
+    _name, _, _seconds = _item.partition("=")
+    DEADLINES[_name.strip()] = float(_seconds)
+
+# Só estas são repetidas: não alteram nada no serviço
+READ_OPERATIONS = frozenset({
+    'checkStatus', 'getPackageDetails', 'getTrackingChanges', 'listPackages', 'listPackagesPage', 'searchPackages',
+    'searchPackagesPage', 'searchUsers', 'getAllUsers', 'getDashboardStats', 'getAllPackages',
+    'getAllPackagesPage',
+})
+
+# Falhas de rede/timeouts (contam para o breaker e podem ser repetidas); o
+# LazyClient lança ConnectionError quando não consegue obter o WSDL
+_NETWORK_ERRORS = (requests.RequestException, ConnectionError)
+
+
+def deadline_for(operation):
+    return DEADLINES.get(operation, DEFAULT_DEADLINE)
+
+
+def _is_failure(error):
+    """TransportError sem resposta ou com HTTP 5xx (os 4xx são erros do pedido)."""
+    status = getattr(error, 'status_code', None)
+    return not status or status >= 500
+
+
+class CircuitOpen(TransportError):
+    """O serviço falhou demasiadas vezes seguidas; a chamada nem foi tentada."""
+
+
+class RetryBudget:
+    """Cada chamada deposita ``ratio`` fichas e cada retry gasta uma (máximo ``cap``)."""
+
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, cap=RETRY_BUDGET_MIN):
+        self.ratio = ratio
+        self.cap = cap
+        self._tokens = cap
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.cap, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1: return False
+            self._tokens -= 1
+            return True
+
+    def tokens(self):
+        with self._lock:
+            return self._tokens
+
+
+class CircuitBreaker:
+    """closed -> open (``failures`` falhas seguidas) -> half_open (uma chamada de teste) -> closed/open."""
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._stats = {'opened': 0, 'short_circuited': 0}
+
+    def allow(self):
+        """True se a chamada pode ser feita (em half_open só uma de cada vez)."""
+        with self._lock:
+            if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_after:
+                self._state = 'half_open'
+            if self._state == 'closed': return True
+            if self._state == 'half_open' and not self._trial:
+                self._trial = True
+                return True
+            self._stats['short_circuited'] += 1
+            return False
+
+    def available(self):
+        """Como ``allow`` mas sem reservar a chamada de teste (para ``if not client``)."""
+        with self._lock:
+            return self._state != 'open' or time.monotonic() - self._opened_at >= self.reset_after
+
+    def record_success(self):
+        with self._lock:
+            self._state, self._consecutive, self._trial = 'closed', 0, False
+
+    def release(self):
+        """A chamada falhou antes de chegar ao serviço: não conta, mas liberta a chamada de teste."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._trial = False
+            if self._state == 'half_open' or self._consecutive >= self.failures:
+                if self._state != 'open': self._stats['opened'] += 1
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(state=self._state, consecutive_failures=self._consecutive)
+            if self._state == 'open':
+                stats['retry_in'] = max(0.0, self.reset_after - (time.monotonic() - self._opened_at))
+        return stats
+
+
+class _Operation:
+    """``client.service.operacao``: chamável, com o prazo da operação (usado pelo CallGroup)."""
+
+    def __init__(self, client, name):
+        self._client = client
+        self.name = name
+        self.deadline = deadline_for(name)
+
+    def __call__(self, *args, **kwargs):
+        return self._client.call(self.name, *args, **kwargs)
+
+
+class _ResilientService:
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, operation):
+        if operation.startswith('__'): raise AttributeError(operation)
+        return _Operation(self._client, operation)
+
+
+class ResilientClient:
+    """Cliente de um serviço com prazos, retries e circuit breaker (ver o docstring do módulo)."""
+
+    def __init__(self, name, client):
+        self.name = name
+        self._client = client
+        self.breaker = CircuitBreaker()
+        self.budget = RetryBudget()
+        self.service = _ResilientService(self)
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def __bool__(self):
+        # Com o circuito aberto nem se tenta carregar o WSDL
+        return self.breaker.available() and bool(self._client)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def call(self, operation, *args, **kwargs):
+        deadline = deadline_for(operation)
+        expires_at = time.monotonic() + deadline
+        attempts = RETRY_ATTEMPTS if operation in READ_OPERATIONS else 1
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self.breaker.allow():
+                self._count(operation, 'short_circuited')
+                raise CircuitOpen(f"{self.name}: serviço indisponível (circuit breaker aberto)")
+            remaining = expires_at - time.monotonic()
+            started = time.monotonic()
+            try:
+                with call_timeout(max(remaining, 0.1)):
+                    result = getattr(self._client.service, operation)(*args, **kwargs)
+            except Fault:
+                self.breaker.record_success()  # o serviço respondeu
+                self._count(operation, 'calls', time.monotonic() - started)
+                raise
+            except TransportError as e:
+                if not _is_failure(e):  # HTTP 4xx: o pedido é que está errado
+                    self.breaker.record_success()
+                    self._count(operation, 'calls', time.monotonic() - started)
+                    raise
+                self.breaker.record_failure()
+                self._count(operation, 'failures', time.monotonic() - started)
+                if not self._may_retry(attempt, attempts, expires_at): raise
+                print(f"{self.name}.{operation} falhou ({type(e).__name__}); nova tentativa")
+                self._count(operation, 'retries')
+                continue
+            except _NETWORK_ERRORS as e:
+                self.breaker.record_failure()
+                self._count(operation, 'failures', time.monotonic() - started)
+                if not self._may_retry(attempt, attempts, expires_at): raise
+                print(f"{self.name}.{operation} falhou ({type(e).__name__}); nova tentativa")
+                self._count(operation, 'retries')
+                continue
+            except Exception:
+                # Erro do lado da GUI (argumentos, ValidationError...): o serviço não tem culpa
+                self.breaker.release()
+                self._count(operation, 'errors', time.monotonic() - started)
+                raise
+            self.breaker.record_success()
+            self._count(operation, 'calls', time.monotonic() - started)
+            return result
+
+    def _may_retry(self, attempt, attempts, expires_at):
+        return attempt < attempts and expires_at - time.monotonic() >= 0.1 and self.budget.withdraw()
+
+    def _count(self, operation, key, elapsed=None):
+        with self._lock:
+            stats = self._operations.setdefault(operation, {
+                'calls': 0, 'failures': 0, 'errors': 0, 'retries': 0, 'short_circuited': 0, 'time_max': 0.0,
+            })
+            stats[key] += 1
+            if elapsed is not None:
+                stats['time_max'] = max(stats['time_max'], elapsed)
+
+    def stats(self):
+        with self._lock:
+            operations = {name: dict(stats, deadline=deadline_for(name))
+                          for name, stats in self._operations.items()}
+        return {'breaker': self.breaker.stats(), 'retry_budget': self.budget.tokens(),
+                'operations': operations}
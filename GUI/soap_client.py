@@ -0,0 +1,314 @@
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+import msgpack
+import requests
+from requests.adapters import HTTPAdapter
+from zeep import Client
+from zeep.cache import SqliteCache
+from zeep.exceptions import Fault, TransportError
+
+# Cache em disco dos WSDL/XSD partilhada por todos os processos da GUI;
+# WSDL_CACHE_PATH vazio desativa-a.
+WSDL_CACHE_PATH = os.environ.get("WSDL_CACHE_PATH", os.path.join(tempfile.gettempdir(), "gui_wsdl_cache.db"))
+WSDL_CACHE_TTL = int(os.environ.get("WSDL_CACHE_TTL", 300))
+CLIENT_RETRY_MIN = float(os.environ.get("SOAP_CLIENT_RETRY_MIN", 1))
+CLIENT_RETRY_MAX = float(os.environ.get("SOAP_CLIENT_RETRY_MAX", 60))
+# Corpos de pedido acima disto vão comprimidos com gzip (0 = nunca); as
+# respostas vêm comprimidas pelos serviços (Accept-Encoding do requests)
+REQUEST_COMPRESSION_MIN = int(os.environ.get("SOAP_REQUEST_COMPRESSION_MIN", 1024))
+# Ligações keep-alive por serviço: devem cobrir as threads do worker mais as do CallGroup
+POOL_CONNECTIONS = int(os.environ.get("SOAP_POOL_CONNECTIONS", 4))
+POOL_MAXSIZE = int(os.environ.get("SOAP_POOL_MAXSIZE", 32))
+
+
+# "Ler as próprias escritas": os serviços devolvem este cabeçalho depois de
+# uma escrita (segundos até as réplicas a terem) e leem do primário enquanto
+# o cliente o reenviar com o tempo que falta.
+READ_PRIMARY_HEADER = 'X-Read-Primary-For'
+
+_read_state = contextvars.ContextVar('gui_read_state', default=None)
+
+
+class ReadState:
+    """Até quando (``time.time()``) as leituras do utilizador atual devem ir ao primário."""
+
+    def __init__(self, primary_until=0.0):
+        self.primary_until = primary_until
+
+
+def begin_read_state(primary_until=0.0):
+    """Estado das chamadas aos serviços do pedido atual (copiado para as threads do CallGroup)."""
+    state = ReadState(primary_until)
+    _read_state.set(state)
+    return state
+
+
+_call_timeout = contextvars.ContextVar('gui_call_timeout', default=None)
+
+
+@contextmanager
+def call_timeout(seconds):
+    """Timeout dos pedidos HTTP feitos dentro do bloco (em vez do do Transport)."""
+    token = _call_timeout.set(seconds)
+    try:
+        yield
+    finally:
+        _call_timeout.reset(token)
+
+
+class ServiceSession(requests.Session):
+    """Sessão HTTP partilhada pelos clientes dos serviços.
+
+    Em cada pedido envia e atualiza o ``ReadState`` do pedido atual da GUI,
+    aplica o prazo de ``call_timeout`` e comprime com gzip os corpos maiores
+    do que REQUEST_COMPRESSION_MIN.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        timeout = _call_timeout.get()
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        headers = dict(kwargs.get('headers') or {})
+        state = _read_state.get()
+        if state is not None:
+            remaining = state.primary_until - time.time()
+            if remaining > 0:
+                headers[READ_PRIMARY_HEADER] = f"{remaining:.3f}"
+        data = kwargs.get('data')
+        if REQUEST_COMPRESSION_MIN and isinstance(data, (bytes, str)) and len(data) >= REQUEST_COMPRESSION_MIN:
+            kwargs['data'] = _gzip(data.encode('utf-8') if isinstance(data, str) else data)
+            headers['Content-Encoding'] = 'gzip'
+        kwargs['headers'] = headers
+        response = super().request(method, url, *args, **kwargs)
+        window = response.headers.get(READ_PRIMARY_HEADER)
+        if state is not None and window:
+            try:
+                state.primary_until = max(state.primary_until, time.time() + float(window))
+            except ValueError:
+                pass
+        return response
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def make_session():
+    """ServiceSession com o pool de ligações dimensionado para os workers com threads."""
+    session = ServiceSession()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def wsdl_cache():
+    """Cache SQLite do zeep para os documentos WSDL/XSD, ou None se desativada."""
+    if not WSDL_CACHE_PATH: return None
+    try:
+        return SqliteCache(path=WSDL_CACHE_PATH, timeout=WSDL_CACHE_TTL)
+    except Exception as e:
+        print(f"Cache de WSDL indisponível ({WSDL_CACHE_PATH}): {e}")
+        return None
+
+
+class LazyClient:
+    """Cliente zeep criado no primeiro uso e recriado se falhar.
+
+    ``if not client`` tenta (re)criar o cliente; em caso de falha espera
+    entre tentativas com backoff exponencial (``CLIENT_RETRY_MIN`` até
+    ``CLIENT_RETRY_MAX`` segundos), para a GUI arrancar mesmo com os
+    serviços em baixo e recuperar sozinha quando voltarem.
+    """
+
+    def __init__(self, name, wsdl, settings, transport):
+        self.name = name
+        self.wsdl = wsdl
+        self._settings = settings
+        self._transport = transport
+        self._client = None
+        self._lock = threading.Lock()
+        self._retry_delay = CLIENT_RETRY_MIN
+        self._next_attempt = 0.0
+
+    def get(self):
+        """Devolve o zeep.Client, ou None se o WSDL ainda não estiver acessível."""
+        client = self._client
+        if client is not None or time.monotonic() < self._next_attempt:
+            return client
+        with self._lock:
+            if self._client is None and time.monotonic() >= self._next_attempt:
+                try:
+                    self._client = Client(self.wsdl, settings=self._settings, transport=self._transport)
+                    self._retry_delay = CLIENT_RETRY_MIN
+                    print(f"Cliente {self.name} conectado.")
+                except Exception as e:
+                    print(f"ERRO ao conectar ao WSDL {self.name} ({self.wsdl}): {e}; "
+                          f"nova tentativa em {self._retry_delay:g}s")
+                    self._next_attempt = time.monotonic() + self._retry_delay
+                    self._retry_delay = min(self._retry_delay * 2, CLIENT_RETRY_MAX)
+            return self._client
+
+    def reset(self):
+        """Esquece o cliente atual (ex.: o serviço mudou de WSDL)."""
+        with self._lock:
+            self._client = None
+            self._next_attempt = 0.0
+
+    def __bool__(self):
+        return self.get() is not None
+
+    @property
+    def service(self):
+        client = self.get()
+        if client is None:
+            raise ConnectionError(f"Serviço {self.name} indisponível ({self.wsdl})")
+        return client.service
+
+    def __getattr__(self, name):
+        client = self.get()
+        if client is None:
+            raise ConnectionError(f"Serviço {self.name} indisponível ({self.wsdl})")
+        return getattr(client, name)
+
+
+# --- Endpoints compactos (JSON / MessagePack) ---
+
+class _Result(dict):
+    """Objeto devolvido pelo CompactClient: acesso por atributo, como nos objetos do zeep."""
+
+    def __getattr__(self, name):
+        if name.startswith('__'): raise AttributeError(name)
+        return self.get(name)
+
+
+class _Array(list):
+    """Lista devolvida pelo CompactClient.
+
+    O zeep embrulha cada Array num objeto com um campo por tipo de item
+    (``page.packages.PackageInfo``); aqui qualquer atributo devolve a
+    própria lista, para o código da GUI funcionar com os dois clientes.
+    """
+
+    def __getattr__(self, name):
+        if name.startswith('__'): raise AttributeError(name)
+        return self
+
+
+def _wrap(value):
+    if isinstance(value, dict):
+        return _Result((key, _wrap(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return _Array(_wrap(item) for item in value)
+    return value
+
+
+def _plain(value):
+    """Converte um argumento para o formato dos endpoints compactos."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        # forma do zeep para arrays: {'TipoDoItem': [...]}
+        if len(value) == 1 and isinstance(next(iter(value.values())), list):
+            return _plain(next(iter(value.values())))
+        return {key: _plain(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _text(value):
+    """O Spyne envia as strings em MessagePack como binário; converte-as para str."""
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, dict):
+        return {_text(key): _text(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_text(item) for item in value]
+    return value
+
+
+def _msgpack_encode(body):
+    # o Spyne procura o nome da operação como binário
+    return msgpack.packb({operation.encode('utf-8'): args for operation, args in body.items()}, use_bin_type=True)
+
+
+_CODECS = {
+    'json': ('application/json',
+             lambda body: json.dumps(body).encode('utf-8'),
+             lambda data: json.loads(data.decode('utf-8'))),
+    'msgpack': ('application/x-msgpack',
+                _msgpack_encode,
+                lambda data: _text(msgpack.unpackb(data, raw=False))),
+}
+
+
+class _CompactService:
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, operation):
+        if operation.startswith('__'): raise AttributeError(operation)
+        return lambda **kwargs: self._client.call(operation, **kwargs)
+
+
+class CompactClient:
+    """Cliente dos endpoints JSON/MessagePack dos serviços, com a interface do zeep.
+
+    ``client.service.operacao(arg=...)`` faz um POST para ``url`` e devolve
+    o resultado com acesso por atributo; Faults do serviço são relançados
+    como ``zeep.exceptions.Fault`` e erros de rede como ``TransportError``.
+    Só aceita argumentos por nome.
+    """
+
+    def __init__(self, name, url, protocol, session, timeout=10):
+        self.name = name
+        self.url = url
+        self.protocol = protocol
+        self._content_type, self._encode, self._decode = _CODECS[protocol]
+        self._session = session
+        self._timeout = timeout
+        self.service = _CompactService(self)
+
+    def __bool__(self):
+        return True  # não há WSDL para carregar; falhas aparecem em cada chamada
+
+    def call(self, operation, **kwargs):
+        body = {operation: {key: _plain(value) for key, value in kwargs.items() if value is not None}}
+        try:
+            response = self._session.post(self.url, data=self._encode(body), timeout=self._timeout,
+                                          headers={'Content-Type': self._content_type})
+        except requests.RequestException as e:
+            raise TransportError(f"{self.name}: {e}")
+
+        try:
+            payload = self._decode(response.content) if response.content else None
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict) and 'faultcode' in payload:
+            raise Fault(message=payload.get('faultstring'), code=payload.get('faultcode'))
+        if response.status_code >= 400:
+            raise TransportError(f"{self.name}: HTTP {response.status_code}",
+                                 status_code=response.status_code, content=response.content)
+        return _wrap(payload)
+
+
+# soap (zeep + WSDL), json ou msgpack
+SOAP_PROTOCOL = os.environ.get("SOAP_PROTOCOL", "soap")
+
+
+def make_client(name, wsdl, settings, transport):
+    """Cliente para o serviço no protocolo configurado em SOAP_PROTOCOL."""
+    if SOAP_PROTOCOL in _CODECS:
+        url = wsdl.split('?')[0].rstrip('/') + '/' + SOAP_PROTOCOL
+        return CompactClient(name, url, SOAP_PROTOCOL, transport.session, timeout=transport.operation_timeout or transport.load_timeout)
+    return LazyClient(name, wsdl, settings, transport)
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from mysql.connector import Error
+
+
+class LRUCache:
+    """Cache LRU com TTL, thread-safe, com contadores de hits/misses/evictions."""
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._epoch = 0  # incrementado a cada invalidação
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        """Devolve (encontrado, valor)."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return True, value
+                del self._data[key]
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            return False, None
+
+    def epoch(self):
+        with self._lock:
+            return self._epoch
+
+    def put(self, key, value, epoch=None):
+        """Guarda o valor, exceto se houve uma invalidação desde ``epoch``.
+
+        Evita que um valor lido antes de uma escrita no WS2 volte a entrar na
+        cache depois de a invalidação já ter sido processada.
+        """
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, keys):
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._stats['invalidations'] += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+
+class DbPollingInvalidationChannel:
+    """Lê a tabela ``package_changes``, onde o WS2 regista cada escrita.
+
+    O cursor é o id (auto-increment) da última linha lida, não o
+    changed_at: o changed_at é a hora do INSERT, e uma transação longa (um
+    bulk, uma importação) só fica visível no commit, muito depois. Os ids
+    abaixo do maior já lido que ainda não apareceram (transações por
+    confirmar) são relidos em cada leitura até aparecerem ou passarem
+    ``gap_timeout`` segundos (um id de uma transação desfeita nunca
+    aparece; com ``gap_timeout`` igual ao TTL da cache, o que estava em
+    cache antes desse commit já expirou).
+    """
+
+    MAX_GAPS = 10000
+
+    def __init__(self, get_connection, gap_timeout=300.0):
+        self._get_connection = get_connection
+        self.gap_timeout = gap_timeout
+        self._last_id = None
+        self._gaps = {}  # id -> instante (monotonic) em que foi visto em falta
+
+    def poll(self):
+        """Devolve os pacotes alterados; lança Error se a base de dados falhar."""
+        conn = self._get_connection()
+        if conn is None: raise Error(msg="Sem conexão para ler package_changes")
+        cursor = conn.cursor()
+        try:
+            if self._last_id is None:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) FROM package_changes")
+                self._last_id = cursor.fetchone()[0]  # cache vazia: nada a invalidar ainda
+                return set()
+            gaps = sorted(self._gaps)
+            query = "SELECT id, package_id FROM package_changes WHERE id > %s"
+            if gaps:
+                query += f" OR id IN ({', '.join(['%s'] * len(gaps))})"
+            cursor.execute(query, [self._last_id] + gaps)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        now = time.monotonic()
+        seen = {row_id for row_id, _ in rows}
+        for row_id in seen:
+            self._gaps.pop(row_id, None)
+        highest = max(seen, default=self._last_id)
+        for row_id in range(self._last_id + 1, highest):
+            if row_id not in seen: self._gaps[row_id] = now
+        self._last_id = max(self._last_id, highest)
+        expired = [row_id for row_id, since in self._gaps.items() if now - since > self.gap_timeout]
+        for row_id in expired:
+            del self._gaps[row_id]
+        for row_id in sorted(self._gaps)[:max(0, len(self._gaps) - self.MAX_GAPS)]:
+            del self._gaps[row_id]
+        return {package_id for _, package_id in rows}
+
+
+class TrackingCache:
+    """Cache de leitura (read-through) do histórico e dos dados de pacotes.
+
+    Antes de cada leitura consulta o canal de invalidação, no máximo uma vez
+    a cada ``poll_interval`` segundos. Se o canal falhar, a cache é ignorada
+    até voltar a responder, para nunca servir dados de que não se sabe a
+    frescura.
+    """
+
+    def __init__(self, cache, channel, poll_interval=1.0):
+        self.cache = cache
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self._next_poll = 0.0
+        self._healthy = channel is not None
+        self._poll_lock = threading.Lock()
+        self._poll_failures = 0
+
+    def _maybe_poll(self):
+        if self.channel is None or time.monotonic() < self._next_poll:
+            return
+        if not self._poll_lock.acquire(blocking=False):
+            return  # outro pedido já está a atualizar
+        try:
+            changed = self.channel.poll()
+            if changed:
+                self.cache.invalidate([key for pid in changed for key in (('package', pid), ('history', pid))])
+            self._healthy = True
+        except Error as e:
+            if self._healthy:
+                print(f"Cache de rastreio desativada (canal de invalidação falhou): {e}")
+            self._healthy = False
+            self._poll_failures += 1
+            self.cache.clear()
+        finally:
+            self._next_poll = time.monotonic() + self.poll_interval
+            self._poll_lock.release()
+
+    def get_or_load(self, key, loader):
+        """Devolve o valor em cache ou chama ``loader`` (None = erro, não é guardado)."""
+        self._maybe_poll()
+        if not self._healthy:
+            return loader()
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        epoch = self.cache.epoch()
+        value = loader()
+        if value is not None:
+            self.cache.put(key, value, epoch)
+        return value
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['enabled'] = self._healthy
+        stats['poll_failures'] = self._poll_failures
+        return stats
+
+
+def tracking_cache_from_env(get_connection):
+    """Cria a cache com a configuração TRACKING_CACHE_* (canal: db ou none).
+
+    As escritas acontecem no WS2, outro processo: o único canal que as vê é
+    a tabela package_changes (db). ``none`` desativa a cache.
+    """
+    mode = os.environ.get("TRACKING_CACHE_INVALIDATION", "db")
+    if mode not in ("db", "none"):
+        raise ValueError(f"TRACKING_CACHE_INVALIDATION inválido: {mode!r} (use 'db' ou 'none')")
+    if os.environ.get("TRACKING_CACHE_ENABLED", "1") != "1" or mode == "none":
+        channel = None
+    else:
+        channel = DbPollingInvalidationChannel(get_connection, gap_timeout=float(
+            os.environ.get("TRACKING_CACHE_GAP_TIMEOUT", os.environ.get("TRACKING_CACHE_TTL", 300))))
+    cache = LRUCache(maxsize=int(os.environ.get("TRACKING_CACHE_SIZE", 10000)),
+                     ttl=float(os.environ.get("TRACKING_CACHE_TTL", 300)))
+    return TrackingCache(cache, channel, poll_interval=float(os.environ.get("TRACKING_CACHE_POLL_INTERVAL", 1)))
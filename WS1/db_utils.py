@@ -1,161 +1,489 @@
-import mysql.connector
-from mysql.connector import Error
-import os
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
-from datetime import datetime 
-
-# --- Configuração e Conexão BD ---
-DB_CONFIG = {
-    'user': os.environ.get("MYSQL_USER"),
-    'password': os.environ.get("MYSQL_PASSWORD"),
-    'host': os.environ.get("MYSQL_HOST"),
-    'database': os.environ.get("MYSQL_DATABASE"),
-    'port': os.environ.get("MYSQL_PORT", 3306)
-}
-
-def get_db_connection():
-    """Estabelece e retorna uma conexão MySQL."""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except Error as e:
-        print(f"Erro ao conectar ao MySQL: {e}")
-        return None
-
-
-ph = PasswordHasher()
-
-def hash_password(password):
-    """Gera o hash de uma password usando Argon2."""
-    return ph.hash(password.encode('utf-8'))
-
-def check_password(hashed_password, plain_password):
-    """Verifica se a password fornecida corresponde ao hash Argon2."""
-    if not hashed_password or not plain_password:
-         return False
-    try:
-        ph.verify(hashed_password, plain_password.encode('utf-8'))
-        return True
-    except VerifyMismatchError:
-        return False
-    except Exception as e:
-        print(f"Erro ao verificar password com Argon2: {e}")
-        return False
-
-
-
-# Funções de Acesso à BD 
-
-
-def db_user_login(username, password):
-    conn = get_db_connection()
-    if conn is None: return None
-    cursor = conn.cursor(dictionary=True)
-    user_info = None
-    try:
-        query = "SELECT id, password_hash, role FROM users WHERE username = %s"
-        cursor.execute(query, (username,))
-        user_record = cursor.fetchone()
-        if user_record and check_password(user_record['password_hash'], password):
-            user_info = {"user_id": user_record['id'], "role": user_record['role']}
-    except Error as e: print(f"Erro na query db_user_login: {e}")
-    except Exception as argon_e: print(f"Erro Argon2 em db_user_login: {argon_e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return user_info
-
-def db_user_register(username, password, email):
-    conn = get_db_connection()
-    if conn is None: return False
-    cursor = conn.cursor()
-    success = False
-    try:
-        check_query = "SELECT id FROM users WHERE username = %s OR email = %s"
-        cursor.execute(check_query, (username, email))
-        if cursor.fetchone():
-             print(f"Utilizador ou email já existe: {username}/{email}")
-             return False
-        hashed_pw = hash_password(password)
-        insert_query = """
-            INSERT INTO users (username, password_hash, email, role)
-            VALUES (%s, %s, %s, %s)
-        """
-        cursor.execute(insert_query, (username, hashed_pw, email, 'client'))
-        conn.commit()
-        success = cursor.rowcount > 0
-    except Error as e:
-        print(f"Erro na query db_user_register: {e}")
-        conn.rollback()
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return success
-
-def db_list_packages(user_id):
-    conn = get_db_connection()
-    if conn is None: return []
-    cursor = conn.cursor(dictionary=True)
-    packages = []
-    try:
-        query = """
-            SELECT id, name, description, sender_city, destination_city, is_tracked
-            FROM packages
-            WHERE sender_id = %s OR receiver_id = %s
-            ORDER BY creation_date DESC
-        """
-        cursor.execute(query, (user_id, user_id))
-        packages = cursor.fetchall()
-    except Error as e: print(f"Erro na query db_list_packages: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return packages
-
-def db_check_status(package_id):
-    conn = get_db_connection()
-    if conn is None: return []
-    cursor = conn.cursor(dictionary=True)
-    tracking_history = []
-    try:
-        query = """
-            SELECT city, timestamp
-            FROM tracking_info
-            WHERE package_id = %s
-            ORDER BY timestamp ASC
-        """
-        cursor.execute(query, (package_id,))
-        tracking_history = cursor.fetchall()
-        for entry in tracking_history:
-             if isinstance(entry['timestamp'], datetime):
-                 entry['timestamp'] = entry['timestamp'].isoformat()
-    except Error as e: print(f"Erro na query db_check_status: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return tracking_history
-
-def db_search_packages(user_id, search_term):
-    """Procura pacotes de um utilizador por um termo (nome ou descrição)."""
-    conn = get_db_connection()
-    if conn is None: return []
-    cursor = conn.cursor(dictionary=True)
-    packages = []
-    try:
-        term = f"%{search_term}%"
-        query = """
-            SELECT id, name, description, sender_city, destination_city, is_tracked
-            FROM packages
-            WHERE (sender_id = %s OR receiver_id = %s)
-              AND (name LIKE %s OR description LIKE %s)
-            ORDER BY creation_date DESC
-        """
-        cursor.execute(query, (user_id, user_id, term, term))
-        packages = cursor.fetchall()
-    except Error as e:
-        print(f"Erro na query db_search_packages: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return packages
\ No newline at end of file
+import mysql.connector
+from mysql.connector import Error
+import os
+import re
+import base64
+import json
+from datetime import datetime 
+from db_pool import pool_from_env, router_from_env
+from password_pool import PasswordPoolBusy, make_hasher, password_pool_from_env
+from cache import tracking_cache_from_env
+from tracking_archive import archived_history
+
+# --- Configuração e Conexão BD ---
+DB_CONFIG = {
+    'user': os.environ.get("MYSQL_USER"),
+    'password': os.environ.get("MYSQL_PASSWORD"),
+    'host': os.environ.get("MYSQL_HOST"),
+    'database': os.environ.get("MYSQL_DATABASE"),
+    'port': os.environ.get("MYSQL_PORT", 3306),
+}
+
+# Driver em Python puro: com workers gevent os sockets cedem ao event loop
+# (a extensão C bloqueia o processo inteiro em cada query). Sem a variável o
+# conector escolhe sozinho (use_pure=False falha se a extensão C não existir).
+if os.environ.get("MYSQL_USE_PURE", "0") == "1":
+    DB_CONFIG['use_pure'] = True
+
+_pool = pool_from_env(DB_CONFIG)
+# Réplicas de leitura (DB_REPLICAS); sem réplicas as leituras usam o pool acima
+_router = router_from_env(DB_CONFIG, _pool)
+
+def get_db_connection():
+    """Empresta uma conexão do pool MySQL (``conn.close()`` devolve-a ao pool)."""
+    try:
+        conn = _pool.acquire()
+        return conn
+    except Error as e:
+        print(f"Erro ao conectar ao MySQL: {e}")
+        return None
+
+def get_read_connection():
+    """Conexão para leituras que toleram o atraso de uma réplica (ver ReplicaRouter)."""
+    try:
+        return _router.acquire_read()
+    except Error as e:
+        print(f"Erro ao conectar ao MySQL: {e}")
+        return None
+
+def get_replica_stats():
+    """Leituras por réplica, atraso e estado de cada uma, e leituras desviadas para o primário."""
+    return _router.stats()
+
+def get_pool_stats():
+    """Estatísticas do pool (em uso, livres, tempos de espera) para dimensionamento."""
+    return _pool.stats()
+
+def reset_after_fork():
+    """Chamado em cada worker do gunicorn: conexões e processos do pai não são partilháveis."""
+    _pool.reset()
+    _router.reset()
+    _password_pool.reset()
+
+def close_connections():
+    """Fecha as conexões livres (fim de um worker)."""
+    _pool.close_all()
+    _router.close_all()
+
+# Histórico e dados dos pacotes só mudam quando o WS2 escreve; ver cache.py
+# Os loaders leem do primário: uma linha antiga de uma réplica atrasada
+# ficaria na cache até ao TTL depois de a invalidação já ter passado.
+_tracking_cache = tracking_cache_from_env(get_db_connection)
+
+def get_cache_stats():
+    """Contadores da cache de rastreio (hits, misses, evictions, invalidações)."""
+    return _tracking_cache.stats()
+
+
+# --- Paginação por keyset ---
+
+# Conversores dos valores guardados em cada tipo de cursor
+DATE_CURSOR = (datetime.fromisoformat, int)   # (creation_date, id)
+SEARCH_CURSOR = (int, int)                    # (relevance * RELEVANCE_SCALE, id)
+
+def encode_cursor(*values):
+    """Codifica a posição da última linha de uma página num token opaco."""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(token, converters=DATE_CURSOR):
+    """Devolve a posição codificada no token; ValueError se for inválido."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        if len(values) != len(converters): raise ValueError(token)
+        return tuple(convert(value) for convert, value in zip(converters, values))
+    except Exception:
+        raise ValueError(f"Cursor inválido: {token}")
+
+def _keyset_clause(after, alias=""):
+    """Condição SQL (e parâmetros) para começar depois da posição ``after``."""
+    if after is None: return "", ()
+    creation_date, package_id = after
+    clause = f" AND ({alias}creation_date < %s OR ({alias}creation_date = %s AND {alias}id < %s))"
+    return clause, (creation_date, creation_date, package_id)
+
+def _limit_clause(limit):
+    if limit is None: return "", ()
+    return " LIMIT %s", (limit,)
+
+
+# Argon2 corre num pool de processos limitado (password_pool.py); ``ph`` só
+# é usado para operações baratas, como ler os parâmetros de um hash.
+_password_pool = password_pool_from_env()
+ph = make_hasher()
+
+def hash_password(password):
+    """Gera o hash de uma password usando Argon2 (lança PasswordPoolBusy se o pool estiver cheio)."""
+    return _password_pool.hash(password)
+
+def check_password(hashed_password, plain_password):
+    """Verifica se a password fornecida corresponde ao hash Argon2."""
+    if not hashed_password or not plain_password:
+         return False
+    return _password_pool.verify(hashed_password, plain_password)
+
+def check_password_needs_rehash(hashed_password):
+     """Verifica se o hash usa os parâmetros Argon2 atuais."""
+     if not hashed_password: return False
+     try:
+          return ph.check_needs_rehash(hashed_password)
+     except Exception:
+          return False 
+
+def get_password_pool_stats():
+    return _password_pool.stats()
+
+
+def _update_password_hash(user_id, old_hash, new_hash):
+    """Substitui o hash só se ainda for o mesmo (outro login pode já o ter feito)."""
+    conn = get_db_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    success = False
+    try:
+        query = "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s"
+        cursor.execute(query, (new_hash, user_id, old_hash))
+        conn.commit()
+        success = cursor.rowcount > 0
+    except Error as e:
+        print(f"Erro na query _update_password_hash: {e}")
+        conn.rollback()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return success
+
+def db_user_login(username, password):
+    """Autentica o utilizador; lança PasswordPoolBusy se o pool de Argon2 estiver cheio.
+
+    A conexão é devolvida ao pool antes de verificar a password, e hashes
+    com parâmetros antigos são atualizados depois de um login correto.
+    """
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    user_record = None
+    try:
+        query = "SELECT id, password_hash, role FROM users WHERE username = %s"
+        cursor.execute(query, (username,))
+        user_record = cursor.fetchone()
+    except Error as e: print(f"Erro na query db_user_login: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+    if not user_record or not check_password(user_record['password_hash'], password):
+        return None
+    if check_password_needs_rehash(user_record['password_hash']):
+        try:
+            _update_password_hash(user_record['id'], user_record['password_hash'], hash_password(password))
+        except PasswordPoolBusy:
+            pass  # fica para o próximo login
+    return {"user_id": user_record['id'], "role": user_record['role']}
+
+def db_user_register(username, password, email):
+    # O hash é calculado antes de pedir a conexão, para não a prender durante o Argon2
+    hashed_pw = hash_password(password)
+    conn = get_db_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    success = False
+    try:
+        check_query = "SELECT id FROM users WHERE username = %s OR email = %s"
+        cursor.execute(check_query, (username, email))
+        if cursor.fetchone():
+             print(f"Utilizador ou email já existe: {username}/{email}")
+             return False
+        insert_query = """
+            INSERT INTO users (username, password_hash, email, role)
+            VALUES (%s, %s, %s, %s)
+        """
+        cursor.execute(insert_query, (username, hashed_pw, email, 'client'))
+        conn.commit()
+        success = cursor.rowcount > 0
+    except Error as e:
+        print(f"Erro na query db_user_register: {e}")
+        conn.rollback()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return success
+
+_PACKAGE_COLUMNS = ("id, name, description, sender_city, destination_city, is_tracked, creation_date, "
+                    "current_city, last_update, hop_count")
+_PACKAGE_DATE_KEYS = ('creation_date', 'last_update')
+
+def _dates_to_iso(row, keys=_PACKAGE_DATE_KEYS):
+    """Converte as datas de uma linha para ISO 8601 (os modelos SOAP usam Unicode)."""
+    for key in keys:
+        if isinstance(row.get(key), datetime):
+            row[key] = row[key].isoformat()
+    return row
+
+_TRACKING_HISTORY_QUERY = """
+            SELECT city, timestamp
+            FROM tracking_info
+            WHERE package_id = %s
+            ORDER BY timestamp ASC
+        """
+
+def _list_packages_query(user_id, limit=None, after=None):
+    """Listagem do utilizador como UNION ALL de dois acessos por índice.
+
+    ``sender_id = %s OR receiver_id = %s`` não pode usar nenhum índice; cada
+    ramo usa o seu (sender_id/receiver_id, creation_date, id), já sai
+    ordenado e lê no máximo ``limit`` linhas.
+    """
+    keyset, keyset_params = _keyset_clause(after)
+    limit_sql, limit_params = _limit_clause(limit)
+    query = f"""
+            (SELECT {_PACKAGE_COLUMNS} FROM packages
+             WHERE sender_id = %s{keyset}
+             ORDER BY creation_date DESC, id DESC{limit_sql})
+            UNION ALL
+            (SELECT {_PACKAGE_COLUMNS} FROM packages
+             WHERE receiver_id = %s AND sender_id <> %s{keyset}
+             ORDER BY creation_date DESC, id DESC{limit_sql})
+            ORDER BY creation_date DESC, id DESC{limit_sql}
+        """
+    params = ((user_id,) + keyset_params + limit_params
+              + (user_id, user_id) + keyset_params + limit_params
+              + limit_params)
+    return query, params
+
+def db_list_packages(user_id, limit=None, after=None):
+    """Pacotes enviados/recebidos pelo utilizador, mais recentes primeiro.
+
+    ``limit`` e ``after`` (posição devolvida por ``decode_cursor``) permitem
+    paginar por keyset em vez de devolver tudo.
+    """
+    conn = get_read_connection()
+    if conn is None: return []
+    cursor = conn.cursor(dictionary=True)
+    packages = []
+    try:
+        query, params = _list_packages_query(user_id, limit, after)
+        cursor.execute(query, params)
+        packages = cursor.fetchall()
+        for pkg in packages:
+            _dates_to_iso(pkg)
+    except Error as e: print(f"Erro na query db_list_packages: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return packages
+
+def _load_tracking_history(package_id):
+    """Lê o histórico da BD e o cursor do live correspondente; None em caso de erro (para não ficar em cache).
+
+    Devolve ``{'entries': [...], 'cursor': id da última entrada lida}``:
+    o cursor fica em cache com o histórico, por isso as atualizações ao
+    vivo continuam exatamente a partir do que foi devolvido, mesmo que a
+    cache esteja atrasada.
+    """
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    loaded = None
+    try:
+        cursor.execute(_TRACKING_HISTORY_QUERY, (package_id,))
+        tracking_history = cursor.fetchall()
+        for entry in tracking_history:
+             if isinstance(entry['timestamp'], datetime):
+                 entry['timestamp'] = entry['timestamp'].isoformat()
+        # Mesma transação (REPEATABLE READ): as leituras veem o mesmo
+        # snapshot, mesmo que o arquivo mova as entradas entre elas
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS last_id FROM tracking_info WHERE package_id = %s",
+                       (package_id,))
+        last_id = cursor.fetchone()['last_id']
+        archived = archived_history(cursor, package_id)
+        if archived:
+            tracking_history = sorted(archived + tracking_history, key=lambda entry: entry['timestamp'])
+        loaded = {'entries': tracking_history, 'cursor': last_id}
+    except Error as e: print(f"Erro na query db_check_status: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return loaded
+
+def _load_package(package_id):
+    """Lê um pacote (com remetente/destinatário para o controlo de acesso); None se não existir."""
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    package = None
+    try:
+        query = f"""
+            SELECT {_PACKAGE_COLUMNS}, sender_id, receiver_id
+            FROM packages
+            WHERE id = %s
+        """
+        cursor.execute(query, (package_id,))
+        package = cursor.fetchone()
+        if package: _dates_to_iso(package)
+    except Error as e: print(f"Erro na query db_get_package_details: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return package
+
+def _tracking_history(package_id):
+    return _tracking_cache.get_or_load(('history', package_id), lambda: _load_tracking_history(package_id))
+
+def db_check_status(package_id):
+    loaded = _tracking_history(package_id)
+    return loaded['entries'] if loaded is not None else []
+
+def db_get_package_details(user_id, package_id):
+    """Devolve um pacote do utilizador, o seu histórico e o cursor das atualizações ao vivo.
+
+    None se o pacote não lhe pertencer. O cursor (ver db_tracking_changes) é
+    o da última entrada do histórico devolvido (lido com ele, e em cache
+    com ele), por isso o live continua exatamente daí; é None se não foi
+    possível lê-lo.
+    """
+    package = _tracking_cache.get_or_load(('package', package_id), lambda: _load_package(package_id))
+    if package is None or user_id not in (package['sender_id'], package['receiver_id']):
+        return None
+    if not package['is_tracked']:
+        return {'package': package, 'tracking_history': [], 'tracking_cursor': _tracking_cursor(package_id)}
+    loaded = _tracking_history(package_id)
+    if loaded is None:
+        return {'package': package, 'tracking_history': [], 'tracking_cursor': None}
+    return {'package': package, 'tracking_history': loaded['entries'], 'tracking_cursor': loaded['cursor']}
+
+# Máximo de entradas devolvidas por db_tracking_changes (o resto vem na chamada seguinte)
+TRACKING_CHANGES_LIMIT = int(os.environ.get("TRACKING_CHANGES_LIMIT", 200))
+
+def _tracking_cursor(package_id):
+    """Id da última entrada de rastreio do pacote (0 se não tem), lido do primário; None em caso de erro."""
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    last_id = None
+    try:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS last_id FROM tracking_info WHERE package_id = %s",
+                       (package_id,))
+        last_id = cursor.fetchone()['last_id']
+    except Error as e: print(f"Erro na query db_tracking_changes: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return last_id
+
+def db_tracking_changes(user_id, package_id, after_id=None):
+    """Entradas de rastreio novas de um pacote do utilizador (id > after_id), ou None se não lhe pertencer.
+
+    O cursor é o id da última entrada em tracking_info: os ids crescem pela
+    ordem em que as atualizações são gravadas (o timestamp vem de quem
+    atualiza e não serve de cursor). Sem ``after_id`` devolve só o cursor
+    atual. Lê do primário e sem cache: é a fonte das atualizações ao vivo.
+    """
+    package = _tracking_cache.get_or_load(('package', package_id), lambda: _load_package(package_id))
+    if package is None or user_id not in (package['sender_id'], package['receiver_id']):
+        return None
+    if after_id is None: return {'entries': [], 'cursor': _tracking_cursor(package_id)}
+    conn = get_db_connection()
+    if conn is None: return {'entries': [], 'cursor': after_id}
+    cursor = conn.cursor(dictionary=True)
+    entries = []
+    try:
+        cursor.execute("""
+            SELECT id, city, timestamp
+            FROM tracking_info
+            WHERE package_id = %s AND id > %s
+            ORDER BY id
+            LIMIT %s
+        """, (package_id, after_id, TRACKING_CHANGES_LIMIT))
+        entries = cursor.fetchall()
+        for entry in entries:
+            if isinstance(entry['timestamp'], datetime):
+                entry['timestamp'] = entry['timestamp'].isoformat()
+    except Error as e: print(f"Erro na query db_tracking_changes: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return {'entries': entries, 'cursor': entries[-1]['id'] if entries else after_id}
+
+# Tamanho mínimo de palavra indexada pelo FULLTEXT do InnoDB (innodb_ft_min_token_size)
+FT_MIN_TOKEN_SIZE = int(os.environ.get("FT_MIN_TOKEN_SIZE", 3))
+
+def _fulltext_query(search_term):
+    """Converte o termo numa pesquisa booleana (todas as palavras, por prefixo).
+
+    Devolve None quando o FULLTEXT não serve (termo vazio ou palavras mais
+    curtas do que o tamanho mínimo indexado) e deve usar-se o LIKE.
+    """
+    words = re.findall(r"\w+", search_term or "")
+    if not words or any(len(w) < FT_MIN_TOKEN_SIZE for w in words):
+        return None
+    return " ".join(f"+{w}*" for w in words)
+
+# A relevância do MATCH é um float: vai para o cursor e volta a ser comparada
+# com "=", por isso é arredondada a um inteiro (escala fixa) no próprio SELECT
+RELEVANCE_SCALE = 1000000
+
+def _search_packages_query(user_id, search_term, limit=None, after=None):
+    """Pesquisa do utilizador: FULLTEXT (ou LIKE) em cada ramo do UNION ALL.
+
+    Como em _list_packages_query, cada ramo aplica o keyset e ordena e
+    limita por si (lê no máximo ``limit`` linhas); o keyset usa a
+    relevância já arredondada (HAVING, sobre o alias), a mesma que vai no
+    cursor, por isso a comparação por igualdade é exata.
+    """
+    fulltext = _fulltext_query(search_term)
+    if fulltext:
+        relevance = f"CAST(ROUND(MATCH(name, description) AGAINST (%s IN BOOLEAN MODE) * {RELEVANCE_SCALE}) AS SIGNED)"
+        relevance_params = (fulltext,)
+        match_filter = "MATCH(name, description) AGAINST (%s IN BOOLEAN MODE)"
+        match_params = (fulltext,)
+    else:
+        term = f"%{search_term}%"
+        relevance, relevance_params = "0", ()
+        match_filter, match_params = "(name LIKE %s OR description LIKE %s)", (term, term)
+
+    keyset, keyset_params = "", ()
+    if after is not None:
+        keyset = " HAVING relevance < %s OR (relevance = %s AND id < %s)"
+        keyset_params = (after[0], after[0], after[1])
+    limit_sql, limit_params = _limit_clause(limit)
+    query = f"""
+            (SELECT {_PACKAGE_COLUMNS}, {relevance} AS relevance
+             FROM packages
+             WHERE sender_id = %s AND {match_filter}{keyset}
+             ORDER BY relevance DESC, id DESC{limit_sql})
+            UNION ALL
+            (SELECT {_PACKAGE_COLUMNS}, {relevance} AS relevance
+             FROM packages
+             WHERE receiver_id = %s AND sender_id <> %s AND {match_filter}{keyset}
+             ORDER BY relevance DESC, id DESC{limit_sql})
+            ORDER BY relevance DESC, id DESC{limit_sql}
+        """
+    params = (relevance_params + (user_id,) + match_params + keyset_params + limit_params
+              + relevance_params + (user_id, user_id) + match_params + keyset_params + limit_params
+              + limit_params)
+    return query, params
+
+def db_search_packages(user_id, search_term, limit=None, after=None):
+    """Procura pacotes de um utilizador por um termo (nome ou descrição).
+
+    Usa o índice FULLTEXT (name, description) com resultados ordenados por
+    relevância; ``after`` é uma posição (relevance, id) de ``SEARCH_CURSOR``.
+    """
+    conn = get_read_connection()
+    if conn is None: return []
+    cursor = conn.cursor(dictionary=True)
+    packages = []
+    try:
+        query, params = _search_packages_query(user_id, search_term, limit, after)
+        cursor.execute(query, params)
+        packages = cursor.fetchall()
+        for pkg in packages:
+            _dates_to_iso(pkg)
+    except Error as e:
+        print(f"Erro na query db_search_packages: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return packages
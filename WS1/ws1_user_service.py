@@ -1,80 +1,213 @@
-from flask import Flask 
-from spyne import Application, rpc, ServiceBase, Unicode, Integer, Boolean, Iterable, ComplexModel, Fault
-from spyne.protocol.soap import Soap11
-from spyne.server.wsgi import WsgiApplication 
-from werkzeug.middleware.dispatcher import DispatcherMiddleware 
-import os 
-
-
-from db_utils import (
-    db_user_login, db_user_register, db_list_packages,
-    db_check_status, db_search_packages
-)
-
-
-class PackageInfo(ComplexModel):
-    _type_info = [('id', Integer), ('name', Unicode), ('description', Unicode), ('sender_city', Unicode), ('destination_city', Unicode), ('is_tracked', Boolean)]
-class TrackingStatus(ComplexModel):
-     _type_info = [('city', Unicode), ('timestamp', Unicode)]
-class UserInfo(ComplexModel):
-     _type_info = [('user_id', Integer), ('username', Unicode), ('role', Unicode)]
-
-
-
-class UserService(ServiceBase):
-    @rpc(Unicode, Unicode, _returns=UserInfo)
-    def login(ctx, username, password):
-        if not username or not password: raise Fault(faultcode='Client', faultstring='Username and password are required.')
-        user_data = db_user_login(username, password)
-        if user_data: return UserInfo(user_id=user_data['user_id'], username=username, role=user_data['role'])
-        else: raise Fault(faultcode='Client', faultstring='Invalid credentials.')
-
-    @rpc(Unicode, Unicode, Unicode, _returns=Boolean)
-    def register(ctx, username, password, email):
-        if not username or not password or not email: raise Fault(faultcode='Client', faultstring='Username, password, and email are required.')
-        success = db_user_register(username, password, email)
-        if not success: raise Fault(faultcode='Client', faultstring='Registration failed. Username or email might already exist.')
-        return success
-
-    @rpc(Integer, _returns=Iterable(PackageInfo))
-    def listPackages(ctx, user_id):
-        if user_id is None: raise Fault(faultcode='Client', faultstring='User ID is required.')
-        packages_data = db_list_packages(user_id)
-        return [PackageInfo(**pkg) for pkg in packages_data]
-
-    @rpc(Integer, Unicode, _returns=Iterable(PackageInfo))
-    def searchPackages(ctx, user_id, search_term):
-        if user_id is None: raise Fault(faultcode='Client', faultstring='User ID is required.')
-        if search_term is None: search_term = ""
-        packages_data = db_search_packages(user_id, search_term)
-        return [PackageInfo(**pkg) for pkg in packages_data]
-
-    @rpc(Integer, _returns=Iterable(TrackingStatus))
-    def checkStatus(ctx, package_id):
-        if package_id is None: raise Fault(faultcode='Client', faultstring='Package ID is required.')
-        status_data = db_check_status(package_id)
-        return [TrackingStatus(**status) for status in status_data]
-
-
-
-flask_app = Flask(__name__) 
-
-
-spyne_app = Application([UserService],
-    tns='sds.lab.user.v1',
-    in_protocol=Soap11(validator='lxml'),
-    out_protocol=Soap11()
-)
-
-spyne_wsgi_app = WsgiApplication(spyne_app)
-
-flask_app.wsgi_app = DispatcherMiddleware(flask_app.wsgi_app, {
-    '/ws1': spyne_wsgi_app
-})
-
-@flask_app.route('/health')
-def health_check():
-    return "WS1 OK", 200
-
-if __name__ == '__main__':
+from flask import Flask, jsonify
+from spyne import Application, rpc, ServiceBase, Unicode, Integer, Boolean, Iterable, Array, ComplexModel, Fault
+from spyne.protocol.soap import Soap11
+from spyne.protocol.json import JsonDocument
+from spyne.protocol.msgpack import MessagePackDocument
+from spyne.server.wsgi import WsgiApplication 
+from werkzeug.middleware.dispatcher import DispatcherMiddleware 
+import os 
+
+
+from db_utils import (
+    db_user_login, db_user_register, db_list_packages,
+    db_check_status, db_search_packages, db_get_package_details, db_tracking_changes,
+    get_pool_stats, get_replica_stats, get_cache_stats, get_password_pool_stats, encode_cursor, decode_cursor,
+    DATE_CURSOR, SEARCH_CURSOR, PasswordPoolBusy
+)
+from migrations import apply_migrations
+from db_pool import ReadYourWrites
+from compression import CompressionMiddleware
+from request_timing import TimedSoap11, RequestTiming, soap_validator_from_env
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+if os.environ.get("DB_AUTO_MIGRATE", "0") == "1":
+    apply_migrations()
+
+
+class PackageInfo(ComplexModel):
+    _type_info = [('id', Integer), ('name', Unicode), ('description', Unicode), ('sender_city', Unicode), ('destination_city', Unicode), ('is_tracked', Boolean), ('creation_date', Unicode),
+                  ('current_city', Unicode), ('last_update', Unicode), ('hop_count', Integer)]
+class TrackingStatus(ComplexModel):
+     _type_info = [('city', Unicode), ('timestamp', Unicode)]
+class UserInfo(ComplexModel):
+     _type_info = [('user_id', Integer), ('username', Unicode), ('role', Unicode)]
+class PackageDetails(ComplexModel):
+     _type_info = [('package', PackageInfo), ('tracking_history', Array(TrackingStatus)),
+                   ('tracking_cursor', Integer)]
+class PackagePage(ComplexModel):
+     _type_info = [('packages', Array(PackageInfo)), ('next_cursor', Unicode)]
+class TrackingChange(ComplexModel):
+     _type_info = [('id', Integer), ('city', Unicode), ('timestamp', Unicode)]
+class TrackingChanges(ComplexModel):
+     _type_info = [('entries', Array(TrackingChange)), ('cursor', Integer)]
+
+
+def _page_args(page_size, cursor, converters=DATE_CURSOR):
+    """Valida os parâmetros de paginação; devolve (page_size, posição inicial)."""
+    if page_size is None or page_size <= 0: page_size = DEFAULT_PAGE_SIZE
+    page_size = min(page_size, MAX_PAGE_SIZE)
+    try:
+        after = decode_cursor(cursor, converters) if cursor else None
+    except ValueError:
+        raise Fault(faultcode='Client', faultstring='Invalid pagination cursor.')
+    return page_size, after
+
+def _make_page(packages_data, page_size, key=('creation_date', 'id')):
+    """Constrói a página a partir de page_size + 1 linhas (a extra indica que há mais)."""
+    next_cursor = None
+    if len(packages_data) > page_size:
+        packages_data = packages_data[:page_size]
+        last = packages_data[-1]
+        next_cursor = encode_cursor(*(last[k] for k in key))
+    return PackagePage(packages=[PackageInfo(**pkg) for pkg in packages_data], next_cursor=next_cursor)
+
+
+
+class UserService(ServiceBase):
+    @rpc(Unicode, Unicode, _returns=UserInfo)
+    def login(ctx, username, password):
+        if not username or not password: raise Fault(faultcode='Client', faultstring='Username and password are required.')
+        try:
+            user_data = db_user_login(username, password)
+        except PasswordPoolBusy:
+            raise Fault(faultcode='Server.Busy', faultstring='Too many concurrent logins, please retry.')
+        if user_data: return UserInfo(user_id=user_data['user_id'], username=username, role=user_data['role'])
+        else: raise Fault(faultcode='Client', faultstring='Invalid credentials.')
+
+    @rpc(Unicode, Unicode, Unicode, _returns=Boolean)
+    def register(ctx, username, password, email):
+        if not username or not password or not email: raise Fault(faultcode='Client', faultstring='Username, password, and email are required.')
+        try:
+            success = db_user_register(username, password, email)
+        except PasswordPoolBusy:
+            raise Fault(faultcode='Server.Busy', faultstring='Too many concurrent requests, please retry.')
+        if not success: raise Fault(faultcode='Client', faultstring='Registration failed. Username or email might already exist.')
+        return success
+
+    @rpc(Integer, _returns=Iterable(PackageInfo))
+    def listPackages(ctx, user_id):
+        if user_id is None: raise Fault(faultcode='Client', faultstring='User ID is required.')
+        packages_data = db_list_packages(user_id)
+        return [PackageInfo(**pkg) for pkg in packages_data]
+
+    @rpc(Integer, Unicode, _returns=Iterable(PackageInfo))
+    def searchPackages(ctx, user_id, search_term):
+        if user_id is None: raise Fault(faultcode='Client', faultstring='User ID is required.')
+        if search_term is None: search_term = ""
+        packages_data = db_search_packages(user_id, search_term)
+        return [PackageInfo(**pkg) for pkg in packages_data]
+
+    @rpc(Integer, Integer, Unicode, _returns=PackagePage)
+    def listPackagesPage(ctx, user_id, page_size, cursor):
+        """Uma página de listPackages; passar next_cursor para obter a seguinte."""
+        if user_id is None: raise Fault(faultcode='Client', faultstring='User ID is required.')
+        page_size, after = _page_args(page_size, cursor)
+        packages_data = db_list_packages(user_id, limit=page_size + 1, after=after)
+        return _make_page(packages_data, page_size)
+
+    @rpc(Integer, Unicode, Integer, Unicode, _returns=PackagePage)
+    def searchPackagesPage(ctx, user_id, search_term, page_size, cursor):
+        """Uma página de searchPackages; passar next_cursor para obter a seguinte."""
+        if user_id is None: raise Fault(faultcode='Client', faultstring='User ID is required.')
+        if search_term is None: search_term = ""
+        page_size, after = _page_args(page_size, cursor, SEARCH_CURSOR)
+        packages_data = db_search_packages(user_id, search_term, limit=page_size + 1, after=after)
+        return _make_page(packages_data, page_size, key=('relevance', 'id'))
+
+    @rpc(Integer, _returns=Iterable(TrackingStatus))
+    def checkStatus(ctx, package_id):
+        if package_id is None: raise Fault(faultcode='Client', faultstring='Package ID is required.')
+        status_data = db_check_status(package_id)
+        return [TrackingStatus(**status) for status in status_data]
+
+    @rpc(Integer, Integer, _returns=PackageDetails)
+    def getPackageDetails(ctx, user_id, package_id):
+        """Devolve um pacote do utilizador, o histórico de rastreio e o cursor do live numa só chamada."""
+        if user_id is None or package_id is None: raise Fault(faultcode='Client', faultstring='User ID and Package ID are required.')
+        details = db_get_package_details(user_id, package_id)
+        if details is None: raise Fault(faultcode='Client.NotFound', faultstring='Package not found.')
+        return PackageDetails(package=PackageInfo(**details['package']),
+                              tracking_history=[TrackingStatus(**status) for status in details['tracking_history']],
+                              tracking_cursor=details['tracking_cursor'])
+
+    @rpc(Integer, Integer, Integer, _returns=TrackingChanges)
+    def getTrackingChanges(ctx, user_id, package_id, after_id):
+        """Entradas de rastreio gravadas depois do cursor ``after_id`` (sem cursor devolve só o atual)."""
+        if user_id is None or package_id is None: raise Fault(faultcode='Client', faultstring='User ID and Package ID are required.')
+        changes = db_tracking_changes(user_id, package_id, after_id)
+        if changes is None: raise Fault(faultcode='Client.NotFound', faultstring='Package not found.')
+        return TrackingChanges(entries=[TrackingChange(**entry) for entry in changes['entries']],
+                               cursor=changes['cursor'])
+
+
+
+flask_app = Flask(__name__) 
+
+
+spyne_app = Application([UserService],
+    tns='sds.lab.user.v1',
+    in_protocol=TimedSoap11(validator=soap_validator_from_env()),
+    out_protocol=Soap11()
+)
+
+# Mesmo serviço em protocolos compactos para o tráfego interno da GUI
+# (sem envelope nem validação XML): /ws1/json e /ws1/msgpack.
+json_app = Application([UserService],
+    tns='sds.lab.user.v1',
+    in_protocol=JsonDocument(validator='soft'),
+    out_protocol=JsonDocument(ignore_wrappers=True)
+)
+
+msgpack_app = Application([UserService],
+    tns='sds.lab.user.v1',
+    in_protocol=MessagePackDocument(validator='soft'),
+    out_protocol=MessagePackDocument(ignore_wrappers=True)
+)
+
+spyne_wsgi_app = WsgiApplication(spyne_app)
+json_wsgi_app = WsgiApplication(json_app)
+msgpack_wsgi_app = WsgiApplication(msgpack_app)
+
+request_timing = RequestTiming()
+request_timing.install(spyne_wsgi_app, 'soap')
+request_timing.install(json_wsgi_app, 'json')
+request_timing.install(msgpack_wsgi_app, 'msgpack')
+
+flask_app.wsgi_app = DispatcherMiddleware(flask_app.wsgi_app, {
+    '/ws1': spyne_wsgi_app,
+    '/ws1/json': json_wsgi_app,
+    '/ws1/msgpack': msgpack_wsgi_app,
+})
+# Leituras logo a seguir a uma escrita da mesma sessão vão para o primário
+flask_app.wsgi_app = ReadYourWrites(flask_app.wsgi_app)
+# Respostas (e pedidos) comprimidos com gzip/deflate quando o cliente aceita
+flask_app.wsgi_app = CompressionMiddleware(flask_app.wsgi_app)
+
+@flask_app.route('/health')
+def health_check():
+    return "WS1 OK", 200
+
+@flask_app.route('/health/pool')
+def pool_stats():
+    return jsonify(get_pool_stats()), 200
+
+@flask_app.route('/health/replicas')
+def replica_stats():
+    return jsonify(get_replica_stats()), 200
+
+@flask_app.route('/health/timing')
+def timing_stats():
+    return jsonify(request_timing.stats()), 200
+
+@flask_app.route('/health/cache')
+def cache_stats():
+    return jsonify(get_cache_stats()), 200
+
+@flask_app.route('/health/passwords')
+def password_pool_stats():
+    return jsonify(get_password_pool_stats()), 200
+
+if __name__ == '__main__':
     flask_app.run(host='0.0.0.0', port=5001, debug=os.environ.get("FLASK_DEBUG", "0") == "1")
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""Compressão HTTP (gzip/deflate) das respostas e dos pedidos dos serviços.
+
+As respostas SOAP das listagens são XML muito repetitivo: comprimidas ficam
+tipicamente 10-20x mais pequenas. A codificação é negociada pelo
+``Accept-Encoding`` do cliente (o requests da GUI envia ``gzip, deflate``)
+e só se aplica a partir de COMPRESSION_MIN_SIZE bytes. Respostas em
+streaming (sem Content-Length) são comprimidas bloco a bloco, sem perder o
+streaming. Pedidos com ``Content-Encoding: gzip``/``deflate`` são
+descomprimidos antes de chegarem ao Spyne.
+
+WS1 e WS2 têm cópias iguais deste ficheiro.
+"""
+import os
+import zlib
+from io import BytesIO
+
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_LEVEL = int(os.environ.get("COMPRESSION_LEVEL", 6))
+# Limite do pedido depois de descomprimido (um pedido pequeno pode expandir para GB)
+MAX_REQUEST_BYTES = int(os.environ.get("COMPRESSION_MAX_REQUEST_MB", 64)) * 1024 * 1024
+
+# wbits do zlib: gzip = cabeçalho gzip; deflate em HTTP = formato zlib
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+_COMPRESSIBLE = ('text/', 'application/xml', 'application/soap+xml', 'application/json',
+                 'application/x-msgpack')
+
+
+def _negotiate(accept_encoding):
+    """Primeira codificação suportada aceite pelo cliente (q > 0), preferindo gzip."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ('gzip', 'deflate'):
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def _header(headers, name):
+    name = name.lower()
+    return next((value for key, value in headers if key.lower() == name), None)
+
+
+class _Body:
+    """Iterável de resposta que fecha o corpo original (ex.: o cursor do streaming) no fim."""
+
+    def __init__(self, *parts, close=None):
+        self._parts = parts
+        self._close = close
+
+    def __iter__(self):
+        for part in self._parts:
+            yield from part
+
+    def close(self):
+        if hasattr(self._close, 'close'): self._close.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CompressionMiddleware:
+    """Middleware WSGI: descomprime pedidos e comprime respostas."""
+
+    def __init__(self, app, min_size=COMPRESSION_MIN_SIZE, level=COMPRESSION_LEVEL,
+                 max_request_bytes=MAX_REQUEST_BYTES):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.max_request_bytes = max_request_bytes
+
+    def __call__(self, environ, start_response):
+        request_encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if request_encoding in _WBITS:
+            error = self._decompress_request(environ, request_encoding)
+            if error is not None:
+                status, message = error
+                start_response(status, [('Content-Type', 'text/plain'), ('Content-Length', str(len(message)))])
+                return [message]
+
+        encoding = _negotiate(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        captured = []
+        buffered = []
+
+        def _start_response(status, headers, exc_info=None):
+            captured[:] = [status, list(headers), exc_info]
+            return buffered.append  # write() do WSGI: guardado até decidirmos
+
+        body = rest = self.app(environ, _start_response)
+        if not captured:
+            # start_response só é chamado na primeira iteração (apps geradoras)
+            rest = iter(body)
+            buffered.append(next(rest, b""))
+        status, headers, exc_info = captured
+        if not self._should_compress(status, headers):
+            start_response(status, headers, exc_info)
+            return _Body(buffered, rest, close=body) if buffered else body
+
+        headers = [(key, value) for key, value in headers if key.lower() != 'content-length']
+        headers += [('Content-Encoding', encoding), ('Vary', 'Accept-Encoding')]
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, _WBITS[encoding])
+        if _header(captured[1], 'Content-Length') is not None:
+            # Resposta completa já em memória: comprime de uma vez
+            with _Body(buffered, rest, close=body) as chunks:
+                data = compressor.compress(b"".join(chunks)) + compressor.flush()
+            start_response(status, headers + [('Content-Length', str(len(data)))], exc_info)
+            return [data]
+        start_response(status, headers, exc_info)
+        return _Body(self._stream(compressor, _Body(buffered, rest)), close=body)
+
+    def _should_compress(self, status, headers):
+        if not COMPRESSION_ENABLED or status[:3] in ('204', '304'): return False
+        if _header(headers, 'Content-Encoding') is not None: return False
+        content_type = (_header(headers, 'Content-Type') or '').lower()
+        if not content_type.startswith(_COMPRESSIBLE): return False
+        length = _header(headers, 'Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    @staticmethod
+    def _stream(compressor, chunks):
+        """Comprime cada bloco e envia-o logo (Z_SYNC_FLUSH), para o cliente ir lendo."""
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    def _decompress_request(self, environ, encoding):
+        """Substitui wsgi.input pelo corpo descomprimido; devolve (status, mensagem) se falhar."""
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        data = environ['wsgi.input'].read(length) if length else environ['wsgi.input'].read()
+        decompressor = zlib.decompressobj(_WBITS[encoding])
+        try:
+            body = decompressor.decompress(data, self.max_request_bytes)
+            if decompressor.unconsumed_tail:
+                return '413 Request Entity Too Large', b"Corpo do pedido demasiado grande."
+            body += decompressor.flush()
+        except zlib.error:
+            return '400 Bad Request', f"Corpo {encoding} inválido.".encode('utf-8')
+        environ['wsgi.input'] = BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        del environ['HTTP_CONTENT_ENCODING']
+        return None
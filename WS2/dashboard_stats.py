@@ -0,0 +1,309 @@
+"""Contadores do dashboard de administração (getDashboardStats).
+
+Os totais por estado, cidade de origem/destino e por hora (pacotes criados,
+entradas de rastreio) vivem em ``dashboard_counters`` e são atualizados
+pelas escritas do WS2 na mesma transação (``package_deltas`` /
+``tracking_deltas`` + ``bump_counters``). Cada incremento vai para um de
+COUNTER_SHARDS shards escolhido ao acaso, para que as escritas concorrentes
+não fiquem todas à espera do lock da mesma linha (ex.: a hora atual); a
+leitura soma os shards.
+
+Um job periódico (``DashboardReconciler``) corrige os contadores a partir
+das tabelas base (sem bloquear as escritas) e apaga o registo antigo de
+package_changes. Cada reconciliação lê a tabela packages inteira (quatro
+GROUP BY) e as entradas de tracking_info das últimas HOURS_RETENTION horas
+(idx_tracking_time), num snapshot consistente: com milhões de pacotes são
+segundos de CPU e I/O no MySQL. Como os contadores já são atualizados
+pelas escritas, a reconciliação só corrige desvios (ex.: alterações feitas
+diretamente na base de dados) e corre de hora a hora, num só processo de
+cada vez e no máximo duas vezes por intervalo em todo o cluster.
+"""
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+from mysql.connector import Error
+
+COUNTER_SHARDS = int(os.environ.get("DASHBOARD_COUNTER_SHARDS", 8))
+HOURS_SHOWN = int(os.environ.get("DASHBOARD_HOURS", 24))
+HOURS_RETENTION = int(os.environ.get("DASHBOARD_HOURS_RETENTION", 168))
+TOP_CITIES = int(os.environ.get("DASHBOARD_TOP_CITIES", 10))
+RECONCILE_INTERVAL = float(os.environ.get("DASHBOARD_RECONCILE_INTERVAL", 3600))
+PACKAGE_CHANGES_RETENTION = int(os.environ.get("PACKAGE_CHANGES_RETENTION", 3600))
+
+# Mesmo formato em Python (strftime) e no MySQL (DATE_FORMAT); é também um
+# limite inferior válido para comparar com TIMESTAMP ('2024-01-01 10:00')
+HOUR_FORMAT = '%Y-%m-%d %H:00'
+BUCKET_MAX_LENGTH = 100  # = VARCHAR das cidades
+
+RECONCILE_LOCK = 'tracking_dashboard_reconcile'
+# Hora da última reconciliação (UNIX_TIMESTAMP do MySQL), numa linha própria
+# de dashboard_counters partilhada por todos os workers e réplicas
+RECONCILED_METRIC = 'reconciled_at'
+HOURLY_METRICS = ('created_hour', 'updated_hour')
+
+
+def hour_bucket(time_obj):
+    return time_obj.strftime(HOUR_FORMAT)
+
+
+def package_deltas(packages, sign=1):
+    """Deltas dos contadores de pacotes; ``packages`` são (origem, destino, rastreado, hora de criação)."""
+    deltas = Counter()
+    for sender_city, destination_city, is_tracked, created_hour in packages:
+        deltas[('status', 'tracked' if is_tracked else 'untracked')] += sign
+        deltas[('origin', sender_city)] += sign
+        deltas[('destination', destination_city)] += sign
+        deltas[('created_hour', created_hour)] += sign
+    return deltas
+
+
+def tracking_deltas(times, sign=1):
+    """Deltas das entradas de rastreio por hora, a partir dos timestamps das entradas."""
+    return Counter({('updated_hour', bucket): sign * count
+                    for bucket, count in Counter(hour_bucket(t) for t in times).items()})
+
+
+def bump_counters(cursor, deltas):
+    """Soma os deltas ``{(metric, bucket): n}`` aos contadores, sem commit.
+
+    As linhas são escritas por ordem de chave para que duas transações
+    nunca as bloqueiem em ordens diferentes (deadlock).
+    """
+    shard = random.randrange(COUNTER_SHARDS)
+    rows = sorted((metric, str(bucket)[:BUCKET_MAX_LENGTH], shard, n)
+                  for (metric, bucket), n in deltas.items() if n and bucket is not None)
+    if not rows: return
+    cursor.executemany("""
+        INSERT INTO dashboard_counters (metric, bucket, shard, value) VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE value = value + VALUES(value)
+    """, rows)
+
+
+def read_stats(get_connection):
+    """Totais atuais (shards somados), ou None sem base de dados."""
+    conn = get_connection()
+    if conn is None: return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT metric, bucket, SUM(value) FROM dashboard_counters
+            GROUP BY metric, bucket HAVING SUM(value) <> 0
+        """)
+        rows = cursor.fetchall()
+        # Últimas HOURS_SHOWN horas até à hora atual (não os últimos buckets que existirem)
+        cursor.execute("SELECT DATE_FORMAT(NOW() - INTERVAL %s HOUR, %s), DATE_FORMAT(NOW(), %s)",
+                       (HOURS_SHOWN - 1, HOUR_FORMAT, HOUR_FORMAT))
+        first_hour, current_hour = cursor.fetchone()
+    except Error as e:
+        print(f"Erro ao ler dashboard_counters: {e}")
+        return None
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+    metrics = {}
+    for metric, bucket, value in rows:
+        metrics.setdefault(metric, {})[bucket] = int(value)
+    status = metrics.get('status', {})
+    top = lambda counts: sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:TOP_CITIES]
+    recent = lambda counts: sorted(item for item in counts.items() if first_hour <= item[0] <= current_hour)
+    return {
+        'total_packages': sum(status.values()),
+        'tracked': status.get('tracked', 0),
+        'untracked': status.get('untracked', 0),
+        'by_origin': top(metrics.get('origin', {})),
+        'by_destination': top(metrics.get('destination', {})),
+        'created_per_hour': recent(metrics.get('created_hour', {})),
+        'updated_per_hour': recent(metrics.get('updated_hour', {})),
+    }
+
+
+_TRUTH_QUERY = """
+    SELECT 'status', IF(is_tracked, 'tracked', 'untracked'), COUNT(*) FROM packages GROUP BY is_tracked
+    UNION ALL
+    SELECT 'origin', sender_city, COUNT(*) FROM packages GROUP BY sender_city
+    UNION ALL
+    SELECT 'destination', destination_city, COUNT(*) FROM packages GROUP BY destination_city
+    UNION ALL
+    SELECT 'created_hour', DATE_FORMAT(creation_date, %(hour_format)s), COUNT(*) FROM packages
+    WHERE creation_date >= %(cutoff)s GROUP BY 2
+    UNION ALL
+    SELECT 'updated_hour', DATE_FORMAT(timestamp, %(hour_format)s), COUNT(*) FROM tracking_info
+    WHERE timestamp >= %(cutoff)s GROUP BY 2
+"""
+
+
+def retention_cutoff(cursor, hours=HOURS_RETENTION):
+    """Primeiro bucket horário (relógio do MySQL) ainda dentro da janela de ``hours`` horas."""
+    cursor.execute("SELECT DATE_FORMAT(NOW() - INTERVAL %s HOUR, %s)", (hours, HOUR_FORMAT))
+    return cursor.fetchone()[0]
+
+
+def within_window(deltas, cutoff):
+    """Tira dos deltas os buckets horários anteriores a ``cutoff`` (já não existem nos contadores)."""
+    return Counter({(metric, bucket): n for (metric, bucket), n in deltas.items()
+                    if metric not in HOURLY_METRICS or (bucket is not None and bucket >= cutoff)})
+
+
+def reconcile(get_connection):
+    """Corrige os contadores com os valores recalculados das tabelas base, sem bloquear as escritas.
+
+    Os totais reais e os contadores atuais são lidos no mesmo snapshot
+    (leitura consistente, sem locks): cada escrita atualiza os contadores
+    na mesma transação que as tabelas base, por isso o snapshot vê as duas
+    coisas ou nenhuma e a diferença é exatamente o desvio. Essa diferença é
+    depois somada (como um incremento normal) numa transação curta por
+    bucket, o que não interfere com as escritas que entretanto chegaram.
+    Os buckets horários com mais de HOURS_RETENTION horas desaparecem.
+    Devolve True se reconciliou.
+    """
+    conn = get_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    try:
+        conn.start_transaction(consistent_snapshot=True, readonly=True)
+        cutoff = retention_cutoff(cursor)
+        cursor.execute(_TRUTH_QUERY, {'hour_format': HOUR_FORMAT, 'cutoff': cutoff})
+        truth = Counter({(metric, bucket): int(count) for metric, bucket, count in cursor.fetchall()
+                         if bucket is not None})
+        cursor.execute("""
+            SELECT metric, bucket, SUM(value) FROM dashboard_counters WHERE metric <> %s GROUP BY metric, bucket
+        """, (RECONCILED_METRIC,))
+        counters = Counter({(metric, bucket): int(value) for metric, bucket, value in cursor.fetchall()})
+        conn.commit()
+
+        drift = within_window(truth, cutoff)
+        drift.subtract(within_window(counters, cutoff))
+        for key, n in sorted(drift.items()):
+            if not n: continue
+            bump_counters(cursor, {key: n})
+            conn.commit()
+        cursor.execute("""
+            DELETE FROM dashboard_counters WHERE metric IN (%s, %s) AND bucket < %s
+        """, HOURLY_METRICS + (cutoff,))
+        cursor.execute("""
+            INSERT INTO dashboard_counters (metric, bucket, shard, value) VALUES (%s, '', 0, UNIX_TIMESTAMP())
+            ON DUPLICATE KEY UPDATE value = VALUES(value)
+        """, (RECONCILED_METRIC,))
+        conn.commit()
+        return True
+    except Error as e:
+        print(f"Erro ao reconciliar dashboard_counters: {e}")
+        conn.rollback()
+        return False
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+
+def prune_package_changes(get_connection, retention=PACKAGE_CHANGES_RETENTION):
+    """Apaga o registo de alterações já lido pelo WS1 (mais antigo do que ``retention`` segundos)."""
+    conn = get_connection()
+    if conn is None: return 0
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM package_changes WHERE changed_at < NOW(6) - INTERVAL %s SECOND", (retention,))
+        deleted = cursor.rowcount
+        conn.commit()
+        return deleted
+    except Error as e:
+        print(f"Erro ao limpar package_changes: {e}")
+        conn.rollback()
+        return 0
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+
+class DashboardReconciler:
+    """Thread que reconcilia os contadores a cada ``interval`` segundos.
+
+    Com vários workers/réplicas só um reconcilia de cada vez (GET_LOCK do
+    MySQL sem espera); os outros saltam essa volta, tal como quem encontra
+    uma reconciliação (de qualquer processo) com menos de meio intervalo.
+    A primeira volta é só ao fim de ``interval``: o arranque usa fill().
+    """
+
+    def __init__(self, get_connection, interval=RECONCILE_INTERVAL):
+        self._get_connection = get_connection
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        """Depois de um fork a thread do pai não existe no filho."""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {'runs': 0, 'skipped': 0, 'failures': 0, 'last_run': None, 'changes_pruned': 0}
+
+    def ensure_started(self):
+        if self._thread is not None or self.interval <= 0: return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='dashboard-reconciler', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once(min_age=self.interval / 2)
+
+    def fill(self):
+        """No arranque: reconcilia só se os contadores nunca foram reconciliados (base de dados nova)."""
+        return self.run_once(min_age=None)
+
+    def run_once(self, min_age=0):
+        """Reconcilia, com o lock, se a última reconciliação tiver pelo menos ``min_age`` segundos.
+
+        ``min_age=None``: só se nunca houve nenhuma. Devolve True se reconciliou.
+        """
+        conn = self._get_connection()
+        if conn is None:
+            self._count('failures')
+            return False
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (RECONCILE_LOCK,))
+            if cursor.fetchone()[0] != 1:
+                self._count('skipped')
+                return False
+            try:
+                if self._reconciled_recently(cursor, min_age):
+                    self._count('skipped')
+                    return False
+                ok = reconcile(self._get_connection)
+                pruned = prune_package_changes(self._get_connection)
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (RECONCILE_LOCK,))
+                cursor.fetchone()
+        except Error as e:
+            print(f"Erro no job de reconciliação do dashboard: {e}")
+            self._count('failures')
+            return False
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+        with self._lock:
+            self._stats['runs' if ok else 'failures'] += 1
+            self._stats['changes_pruned'] += pruned
+            self._stats['last_run'] = time.time()
+        return ok
+
+    @staticmethod
+    def _reconciled_recently(cursor, min_age):
+        cursor.execute("""
+            SELECT UNIX_TIMESTAMP() - value FROM dashboard_counters WHERE metric = %s AND bucket = '' AND shard = 0
+        """, (RECONCILED_METRIC,))
+        row = cursor.fetchone()
+        if row is None: return False
+        return min_age is None or row[0] < min_age
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,433 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import mysql.connector
+from mysql.connector import Error
+
+
+class PoolTimeout(Error):
+    """Nenhuma conexão ficou livre dentro do tempo de espera configurado."""
+
+
+class PooledConnection:
+    """Conexão emprestada pelo pool.
+
+    Delega tudo na conexão MySQL real; ``close()`` devolve-a ao pool em vez de
+    a fechar, por isso as funções de ``db_utils`` não precisam de mudar.
+    """
+
+    def __init__(self, pool, raw_conn, created_at):
+        self._pool = pool
+        self._raw = raw_conn
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def commit(self):
+        self._raw.commit()
+        if self._pool.on_commit is not None: self._pool.on_commit()
+
+    def close(self):
+        if self._released: return
+        self._released = True
+        self._pool._release(self._raw, self._created_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """Pool de conexões MySQL thread-safe com limite, timeout e reciclagem.
+
+    - ``size``: número máximo de conexões abertas (em uso + livres).
+    - ``timeout``: segundos que ``acquire()`` espera por uma conexão livre.
+    - ``recycle``: idade máxima (s) de uma conexão antes de ser reaberta.
+    - ``ping_interval``: conexões paradas há mais tempo do que isto são
+      verificadas com ``ping`` antes de serem emprestadas.
+    """
+
+    def __init__(self, config, size=10, timeout=5.0, recycle=1800, ping_interval=10):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        # Chamado depois de cada commit (ReplicaRouter: ler as próprias escritas)
+        self.on_commit = None
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at, last_used)
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._stats = {
+            'acquired': 0, 'created': 0, 'recycled': 0, 'discarded': 0,
+            'timeouts': 0, 'waits': 0, 'wait_time_total': 0.0, 'wait_time_max': 0.0,
+        }
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self.config)
+        self._count('created')
+        return conn, time.monotonic()
+
+    def _count(self, key):
+        with self._cond:
+            self._stats[key] += 1
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Empresta uma conexão viva; lança ``PoolTimeout`` se o pool estiver esgotado."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        candidate = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    candidate = self._idle.pop()  # LIFO: reutiliza as conexões mais "quentes"
+                    break
+                if self._open < self.size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(msg=f"Pool MySQL esgotado ({self.size} conexões em uso) após {self.timeout}s")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+            waited = time.monotonic() - started
+            self._stats['acquired'] += 1
+            if waited > 0.001:
+                self._stats['waits'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+
+        try:
+            conn, created_at = self._checkout(candidate)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn, created_at)
+
+    def _checkout(self, candidate):
+        """Valida (idade + ping) a conexão reservada ou abre uma nova."""
+        if candidate is None:
+            return self._connect()
+
+        conn, created_at, last_used = candidate
+        now = time.monotonic()
+        if self.recycle and now - created_at > self.recycle:
+            self._discard(conn)
+            self._count('recycled')
+            return self._connect()
+        if now - last_used > self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self._discard(conn)
+                self._count('discarded')
+                return self._connect()
+        return conn, created_at
+
+    def _release(self, conn, created_at):
+        """Termina qualquer transação pendente e devolve a conexão ao pool."""
+        healthy = True
+        try:
+            # Sem isto, uma leitura deixava o snapshot REPEATABLE READ aberto
+            # e o próximo pedido veria dados antigos.
+            conn.rollback()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((conn, created_at, time.monotonic()))
+            else:
+                self._open -= 1
+                self._stats['discarded'] += 1
+            self._cond.notify()
+
+        if not healthy:
+            self._discard(conn)
+
+    def reset(self):
+        """Esquece todas as conexões sem as fechar.
+
+        Para o processo filho depois de um fork (gunicorn com preload): os
+        sockets herdados pertencem ao processo pai e não podem ser usados
+        nem fechados aqui.
+        """
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+
+    def close_all(self):
+        """Fecha as conexões livres (as emprestadas fecham ao ser devolvidas)."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+            })
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['acquired'] if stats['acquired'] else 0.0
+        return stats
+
+
+def pool_from_env(config):
+    """Cria o pool com os limites definidos nas variáveis de ambiente DB_POOL_*."""
+    return ConnectionPool(
+        config,
+        size=int(os.environ.get("DB_POOL_SIZE", 10)),
+        timeout=float(os.environ.get("DB_POOL_TIMEOUT", 5)),
+        recycle=int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        ping_interval=float(os.environ.get("DB_POOL_PING_INTERVAL", 10)),
+    )
+
+
+# --- Réplicas de leitura ---
+
+# Estado do pedido atual para "ler as próprias escritas" (ver ReadYourWrites)
+_read_session = contextvars.ContextVar('db_read_session', default=None)
+
+
+class _ReadSession:
+    def __init__(self, primary_until):
+        self.primary_until = primary_until  # time.monotonic()
+        self.window = 0.0  # > 0 se o pedido escreveu
+
+
+class _Replica:
+    def __init__(self, name, pool, weight):
+        self.name = name
+        self.pool = pool
+        self.weight = weight
+        self.healthy = False  # até à primeira verificação
+        self.lag = None
+        self.reads = 0
+        self.failures = 0
+
+
+class ReplicaRouter:
+    """Envia as leituras para as réplicas e as escritas (e o resto) para o primário.
+
+    - Escolha ao acaso pesada por ``weight`` entre as réplicas saudáveis.
+    - Uma thread verifica cada réplica a cada ``check_interval`` segundos
+      (``SHOW REPLICA STATUS``); uma réplica que não responde, com a
+      replicação parada ou com mais de ``max_lag`` segundos de atraso deixa
+      de receber leituras até à verificação seguinte. Um servidor que não é
+      réplica (ex.: um segundo MySQL local) conta como atraso 0.
+    - Depois de um pedido escrever, as leituras dessa sessão vão para o
+      primário durante o atraso atual das réplicas mais ``margin`` segundos
+      (ver ``ReadYourWrites``).
+    - Sem réplicas, ou nenhuma disponível, tudo vai para o primário.
+    """
+
+    def __init__(self, primary, replicas=(), max_lag=5.0, check_interval=2.0, margin=1.0):
+        self.primary = primary
+        self.replicas = [_Replica(name, pool, weight) for name, pool, weight in replicas]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.margin = margin
+        primary.on_commit = self.note_write
+        self.reset()
+
+    def reset(self):
+        """Depois de um fork: pools e thread de verificação do pai não servem no filho."""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {'replica_reads': 0, 'primary_reads': 0, 'read_your_writes': 0, 'fallbacks': 0}
+        for replica in self.replicas:
+            replica.pool.reset()
+            replica.healthy, replica.lag = False, None
+
+    def ensure_started(self):
+        if self._thread is not None or not self.replicas: return
+        with self._lock:
+            if self._thread is None:
+                self.check_replicas()  # a primeira leitura já pode usar as réplicas
+                self._thread = threading.Thread(target=self._loop, name='replica-health', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.check_replicas()
+
+    def check_replicas(self):
+        for replica in self.replicas:
+            lag = self._replica_lag(replica)
+            replica.lag = lag
+            replica.healthy = lag is not None and lag <= self.max_lag
+
+    def _replica_lag(self, replica):
+        """Atraso da réplica em segundos; None se não responde ou a replicação está parada."""
+        try:
+            conn = replica.pool.acquire()
+        except Error as e:
+            print(f"Réplica {replica.name} indisponível: {e}")
+            return None
+        cursor = conn.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except Error:
+                cursor.execute("SHOW SLAVE STATUS")  # MySQL anterior a 8.0.22
+            rows = cursor.fetchall()
+        except Error as e:
+            print(f"Erro ao verificar a réplica {replica.name}: {e}")
+            return None
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+        if not rows: return 0.0
+        lag = rows[0].get('Seconds_Behind_Source', rows[0].get('Seconds_Behind_Master'))
+        return float(lag) if lag is not None else None
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def acquire_read(self):
+        """Conexão para uma leitura que tolera o atraso das réplicas."""
+        session = _read_session.get()
+        if session is not None and time.monotonic() < session.primary_until:
+            self._count('read_your_writes')
+            return self.primary.acquire()
+        self.ensure_started()
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self._count('primary_reads')
+            return self.primary.acquire()
+        replica = random.choices(healthy, weights=[replica.weight for replica in healthy])[0]
+        try:
+            conn = replica.pool.acquire()
+        except Error as e:
+            print(f"Réplica {replica.name} falhou, a ler do primário: {e}")
+            replica.healthy = False
+            replica.failures += 1
+            self._count('fallbacks')
+            return self.primary.acquire()
+        replica.reads += 1
+        self._count('replica_reads')
+        return conn
+
+    def lag_window(self):
+        """Quanto tempo uma escrita pode demorar a aparecer numa réplica que recebe leituras."""
+        if not self.replicas: return 0.0
+        lags = [replica.lag for replica in self.replicas if replica.healthy and replica.lag is not None]
+        return max(lags, default=0.0) + self.margin
+
+    def note_write(self):
+        session = _read_session.get()
+        if session is None: return
+        session.window = self.lag_window()
+        session.primary_until = max(session.primary_until, time.monotonic() + session.window)
+
+    def close_all(self):
+        for replica in self.replicas:
+            replica.pool.close_all()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['replicas'] = [{'name': replica.name, 'weight': replica.weight, 'healthy': replica.healthy,
+                              'lag': replica.lag, 'reads': replica.reads, 'failures': replica.failures,
+                              'pool': replica.pool.stats()} for replica in self.replicas]
+        return stats
+
+
+class ReadYourWrites:
+    """Middleware WSGI que liga as leituras de um pedido às escritas anteriores da mesma sessão.
+
+    O cliente envia ``X-Read-Primary-For: <segundos>`` (o que devolvemos na
+    última escrita, menos o tempo que já passou): até lá as leituras vão
+    para o primário. Um pedido que escreve devolve o mesmo cabeçalho com o
+    atraso atual das réplicas. Segundos relativos em vez de uma hora
+    absoluta: os relógios do cliente e do serviço não precisam de coincidir.
+    """
+
+    HEADER = 'X-Read-Primary-For'
+    MAX_WINDOW = 60.0
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        try:
+            remaining = min(float(environ.get('HTTP_X_READ_PRIMARY_FOR') or 0), self.MAX_WINDOW)
+        except ValueError:
+            remaining = 0.0
+        session = _ReadSession(time.monotonic() + remaining)
+        token = _read_session.set(session)
+
+        def _start_response(status, headers, exc_info=None):
+            if session.window > 0:
+                headers = list(headers) + [(self.HEADER, f"{session.window:.3f}")]
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.app(environ, _start_response)
+        finally:
+            _read_session.reset(token)
+
+
+def _parse_replicas(spec):
+    """``host[:port][*peso],...`` -> [(host, porta ou None, peso)]."""
+    replicas = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        address, _, weight = item.partition("*")
+        host, _, port = address.partition(":")
+        replicas.append((host, int(port) if port else None, float(weight) if weight else 1.0))
+    return replicas
+
+
+def router_from_env(config, primary):
+    """Réplicas de DB_REPLICAS (mesmo utilizador/base de dados do primário), cada uma com o seu pool."""
+    replicas = []
+    for host, port, weight in _parse_replicas(os.environ.get("DB_REPLICAS", "")):
+        replica_config = dict(config, host=host, port=port or config.get('port', 3306))
+        name = f"{host}:{replica_config['port']}"
+        pool = ConnectionPool(replica_config, size=primary.size, timeout=primary.timeout,
+                              recycle=primary.recycle, ping_interval=primary.ping_interval)
+        replicas.append((name, pool, weight))
+    return ReplicaRouter(
+        primary, replicas,
+        max_lag=float(os.environ.get("DB_REPLICA_MAX_LAG", 5)),
+        check_interval=float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", 2)),
+        margin=float(os.environ.get("DB_READ_YOUR_WRITES_MARGIN", 1)),
+    )
@@ -1,330 +1,925 @@
-import mysql.connector
-from mysql.connector import Error
-import os
-from argon2 import PasswordHasher
-from argon2.exceptions import VerifyMismatchError
-from datetime import datetime 
-# --- Configuração e Conexão BD ---
-DB_CONFIG = {
-    'user': os.environ.get("MYSQL_USER"),
-    'password': os.environ.get("MYSQL_PASSWORD"),
-    'host': os.environ.get("MYSQL_HOST"),
-    'database': os.environ.get("MYSQL_DATABASE"),
-    'port': os.environ.get("MYSQL_PORT", 3306)
-}
-
-def get_db_connection():
-    """Estabelece e retorna uma conexão MySQL."""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        return conn
-    except Error as e:
-        print(f"Erro ao conectar ao MySQL: {e}")
-        return None
-
-
-ph = PasswordHasher()
-
-def hash_password(password):
-    """Gera o hash de uma password usando Argon2."""
-    return ph.hash(password.encode('utf-8'))
-
-def check_password(hashed_password, plain_password):
-    """Verifica se a password fornecida corresponde ao hash Argon2."""
-    if not hashed_password or not plain_password:
-         return False
-    try:
-        ph.verify(hashed_password, plain_password.encode('utf-8'))
-        return True
-    except VerifyMismatchError:
-        return False
-    except Exception as e:
-        print(f"Erro ao verificar password com Argon2: {e}")
-        return False
-
-def check_password_needs_rehash(hashed_password):
-     """Verifica se o hash usa os parâmetros Argon2 atuais."""
-     if not hashed_password: return False
-     try:
-          return ph.check_needs_rehash(hashed_password)
-     except Exception:
-          return False 
-
-
-def db_user_login(username, password):
-    conn = get_db_connection()
-    if conn is None: return None
-    cursor = conn.cursor(dictionary=True)
-    user_info = None
-    try:
-        query = "SELECT id, password_hash, role FROM users WHERE username = %s"
-        cursor.execute(query, (username,))
-        user_record = cursor.fetchone()
-        if user_record and check_password(user_record['password_hash'], password):
-            user_info = {"user_id": user_record['id'], "role": user_record['role']}
-    except Error as e: print(f"Erro na query db_user_login: {e}")
-    except Exception as argon_e: print(f"Erro Argon2 em db_user_login: {argon_e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return user_info
-
-def db_user_register(username, password, email):
-    conn = get_db_connection()
-    if conn is None: return False
-    cursor = conn.cursor()
-    success = False
-    try:
-        check_query = "SELECT id FROM users WHERE username = %s OR email = %s"
-        cursor.execute(check_query, (username, email))
-        if cursor.fetchone():
-             print(f"Utilizador ou email já existe: {username}/{email}")
-             return False
-        hashed_pw = hash_password(password)
-        insert_query = """
-            INSERT INTO users (username, password_hash, email, role)
-            VALUES (%s, %s, %s, %s)
-        """
-        cursor.execute(insert_query, (username, hashed_pw, email, 'client'))
-        conn.commit()
-        success = cursor.rowcount > 0
-    except Error as e:
-        print(f"Erro na query db_user_register: {e}")
-        conn.rollback()
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return success
-
-def db_list_packages(user_id):
-    conn = get_db_connection()
-    if conn is None: return []
-    cursor = conn.cursor(dictionary=True)
-    packages = []
-    try:
-        query = """
-            SELECT id, name, description, sender_city, destination_city, is_tracked
-            FROM packages
-            WHERE sender_id = %s OR receiver_id = %s
-            ORDER BY creation_date DESC
-        """
-        cursor.execute(query, (user_id, user_id))
-        packages = cursor.fetchall()
-    except Error as e: print(f"Erro na query db_list_packages: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return packages
-
-def db_check_status(package_id):
-    conn = get_db_connection()
-    if conn is None: return []
-    cursor = conn.cursor(dictionary=True)
-    tracking_history = []
-    try:
-        query = """
-            SELECT city, timestamp
-            FROM tracking_info
-            WHERE package_id = %s
-            ORDER BY timestamp ASC
-        """
-        cursor.execute(query, (package_id,))
-        tracking_history = cursor.fetchall()
-        for entry in tracking_history:
-             if isinstance(entry['timestamp'], datetime):
-                 entry['timestamp'] = entry['timestamp'].isoformat()
-    except Error as e: print(f"Erro na query db_check_status: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return tracking_history
-
-def db_search_packages(user_id, search_term):
-    """Procura pacotes de um utilizador por um termo (nome ou descrição)."""
-    conn = get_db_connection()
-    if conn is None: return []
-    cursor = conn.cursor(dictionary=True)
-    packages = []
-    try:
-        term = f"%{search_term}%"
-        query = """
-            SELECT id, name, description, sender_city, destination_city, is_tracked
-            FROM packages
-            WHERE (sender_id = %s OR receiver_id = %s)
-              AND (name LIKE %s OR description LIKE %s)
-            ORDER BY creation_date DESC
-        """
-        cursor.execute(query, (user_id, user_id, term, term))
-        packages = cursor.fetchall()
-    except Error as e:
-        print(f"Erro na query db_search_packages: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return packages
-
-
-
-
-def db_add_package(sender_id, receiver_id, name, description, sender_city, dest_city):
-    conn = get_db_connection()
-    if conn is None: return None
-    cursor = conn.cursor()
-    new_package_id = None
-    try:
-        query = """
-            INSERT INTO packages (sender_id, receiver_id, name, description, sender_city, destination_city, is_tracked)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        cursor.execute(query, (sender_id, receiver_id, name, description, sender_city, dest_city, False))
-        conn.commit()
-        if cursor.lastrowid:
-             new_package_id = cursor.lastrowid
-    except Error as e:
-        print(f"Erro na query db_add_package: {e}")
-        conn.rollback()
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return new_package_id
-
-def db_remove_package(package_id):
-    conn = get_db_connection()
-    if conn is None: return False
-    cursor = conn.cursor()
-    success = False
-    try:
-         query = "DELETE FROM packages WHERE id = %s"
-         cursor.execute(query, (package_id,))
-         conn.commit()
-         success = cursor.rowcount > 0
-    except Error as e:
-         print(f"Erro na query db_remove_package: {e}")
-         conn.rollback()
-    finally:
-         if cursor: cursor.close()
-         if conn: conn.close()
-    return success
-
-def db_register_tracking(package_id, initial_city, initial_time_str):
-    """Marca pacote como rastreado e adiciona ponto inicial."""
-    conn = get_db_connection()
-    if conn is None: return False
-    cursor = conn.cursor()
-    success = False
-    try:
-        try:
-             initial_time = datetime.fromisoformat(initial_time_str)
-        except ValueError:
-             print(f"Formato de timestamp inválido: {initial_time_str}")
-             return False 
-
-        update_pkg_query = "UPDATE packages SET is_tracked = TRUE WHERE id = %s AND is_tracked = FALSE" # Evitar re-registar
-        cursor.execute(update_pkg_query, (package_id,))
-        updated_rows = cursor.rowcount
-
-        if updated_rows == 0:
-             check_query = "SELECT id FROM packages WHERE id = %s AND is_tracked = TRUE"
-             cursor.execute(check_query, (package_id,))
-             if cursor.fetchone():
-                  print(f"Pacote {package_id} já estava rastreado.")
-             else:
-                   print(f"Pacote {package_id} não encontrado para registar rastreio.")
-                   return False 
-
-        insert_track_query = """
-            INSERT INTO tracking_info (package_id, city, timestamp)
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE city = VALUES(city) -- Exemplo: se (package_id, timestamp) fosse unique
-            -- Se não houver constraint unique, apenas insere
-        """
-        cursor.execute(insert_track_query, (package_id, initial_city, initial_time))
-
-        conn.commit()
-        success = True
-    except Error as e:
-        print(f"Erro na query db_register_tracking: {e}")
-        conn.rollback()
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return success
-
-def db_update_package_status(package_id, city, time_str):
-    """Adiciona uma nova entrada de rastreamento."""
-    conn = get_db_connection()
-    if conn is None: return False
-    cursor = conn.cursor()
-    success = False
-    try:
-        check_pkg_query = "SELECT id FROM packages WHERE id = %s AND is_tracked = TRUE"
-        cursor.execute(check_pkg_query, (package_id,))
-        if not cursor.fetchone():
-            print(f"Pacote {package_id} não encontrado ou não está a ser rastreado.")
-            return False
-
-        try:
-             time_obj = datetime.fromisoformat(time_str)
-        except ValueError:
-             print(f"Formato de timestamp inválido: {time_str}")
-             return False
-
-        insert_query = """
-            INSERT INTO tracking_info (package_id, city, timestamp)
-            VALUES (%s, %s, %s)
-        """
-        cursor.execute(insert_query, (package_id, city, time_obj))
-        conn.commit()
-        success = cursor.rowcount > 0
-    except Error as e:
-        print(f"Erro na query db_update_package_status: {e}")
-        conn.rollback()
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return success
-
-def db_get_all_users():
-    conn = get_db_connection()
-    if conn is None: return []
-    cursor = conn.cursor(dictionary=True)
-    users = []
-    try:
-        query = "SELECT id, username FROM users ORDER BY username ASC"
-        cursor.execute(query)
-        users = cursor.fetchall()
-    except Error as e:
-        print(f"Erro na query db_get_all_users: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return users
-
-def db_get_all_packages():
-    conn = get_db_connection()
-    if conn is None: return []
-    cursor = conn.cursor(dictionary=True)
-    packages = []
-    try:
-        query = """
-            SELECT
-                p.id, p.name, p.description, p.sender_city, p.destination_city, p.is_tracked,
-                sender.username AS sender_username,
-                receiver.username AS receiver_username,
-                p.creation_date
-            FROM packages p
-            JOIN users sender ON p.sender_id = sender.id
-            JOIN users receiver ON p.receiver_id = receiver.id
-            ORDER BY p.creation_date DESC
-        """
-        cursor.execute(query)
-        packages = cursor.fetchall()
-        for pkg in packages:
-            if isinstance(pkg['creation_date'], datetime):
-                pkg['creation_date'] = pkg['creation_date'].isoformat()
-    except Error as e:
-        print(f"Erro na query db_get_all_packages: {e}")
-    finally:
-        if cursor: cursor.close()
-        if conn: conn.close()
-    return packages
\ No newline at end of file
+import mysql.connector
+from mysql.connector import Error
+import os
+import re
+import base64
+import json
+from datetime import datetime, timezone
+from db_pool import pool_from_env, router_from_env
+from password_pool import PasswordPoolBusy, make_hasher, password_pool_from_env
+from write_behind import WriteBehindFull, write_behind_from_env
+from dashboard_stats import (
+    HOUR_FORMAT, DashboardReconciler, bump_counters, package_deltas, tracking_deltas, read_stats,
+    retention_cutoff, within_window
+)
+from tracking_archive import TrackingArchiver, archived_history
+from user_directory import UserDirectory
+# --- Configuração e Conexão BD ---
+DB_CONFIG = {
+    'user': os.environ.get("MYSQL_USER"),
+    'password': os.environ.get("MYSQL_PASSWORD"),
+    'host': os.environ.get("MYSQL_HOST"),
+    'database': os.environ.get("MYSQL_DATABASE"),
+    'port': os.environ.get("MYSQL_PORT", 3306),
+}
+
+# Driver em Python puro: com workers gevent os sockets cedem ao event loop
+# (a extensão C bloqueia o processo inteiro em cada query). Sem a variável o
+# conector escolhe sozinho (use_pure=False falha se a extensão C não existir).
+if os.environ.get("MYSQL_USE_PURE", "0") == "1":
+    DB_CONFIG['use_pure'] = True
+
+_pool = pool_from_env(DB_CONFIG)
+# Réplicas de leitura (DB_REPLICAS); sem réplicas as leituras usam o pool acima
+_router = router_from_env(DB_CONFIG, _pool)
+
+def get_db_connection():
+    """Empresta uma conexão do pool MySQL (``conn.close()`` devolve-a ao pool)."""
+    try:
+        conn = _pool.acquire()
+        return conn
+    except Error as e:
+        print(f"Erro ao conectar ao MySQL: {e}")
+        return None
+
+def get_read_connection():
+    """Conexão para leituras que toleram o atraso de uma réplica (ver ReplicaRouter)."""
+    try:
+        return _router.acquire_read()
+    except Error as e:
+        print(f"Erro ao conectar ao MySQL: {e}")
+        return None
+
+def get_replica_stats():
+    """Leituras por réplica, atraso e estado de cada uma, e leituras desviadas para o primário."""
+    return _router.stats()
+
+def get_pool_stats():
+    """Estatísticas do pool (em uso, livres, tempos de espera) para dimensionamento."""
+    return _pool.stats()
+
+def reset_after_fork():
+    """Chamado em cada worker do gunicorn: conexões e processos do pai não são partilháveis."""
+    _pool.reset()
+    _router.reset()
+    _password_pool.reset()
+    if _write_behind is not None: _write_behind.reset()
+    _dashboard_reconciler.reset()
+    _tracking_archiver.reset()
+    _user_directory.reset()
+
+def close_connections():
+    """Grava o write-behind pendente e fecha as conexões livres (fim de um worker)."""
+    if _write_behind is not None: _write_behind.close()
+    _pool.close_all()
+    _router.close_all()
+
+
+# --- Paginação por keyset ---
+
+# Conversores dos valores guardados em cada tipo de cursor
+DATE_CURSOR = (datetime.fromisoformat, int)   # (creation_date, id)
+SEARCH_CURSOR = (int, int)                    # (relevance * RELEVANCE_SCALE, id)
+
+def encode_cursor(*values):
+    """Codifica a posição da última linha de uma página num token opaco."""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(token, converters=DATE_CURSOR):
+    """Devolve a posição codificada no token; ValueError se for inválido."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        if len(values) != len(converters): raise ValueError(token)
+        return tuple(convert(value) for convert, value in zip(converters, values))
+    except Exception:
+        raise ValueError(f"Cursor inválido: {token}")
+
+def _keyset_clause(after, alias=""):
+    """Condição SQL (e parâmetros) para começar depois da posição ``after``."""
+    if after is None: return "", ()
+    creation_date, package_id = after
+    clause = f" AND ({alias}creation_date < %s OR ({alias}creation_date = %s AND {alias}id < %s))"
+    return clause, (creation_date, creation_date, package_id)
+
+def _limit_clause(limit):
+    if limit is None: return "", ()
+    return " LIMIT %s", (limit,)
+
+
+# Argon2 corre num pool de processos limitado (password_pool.py); ``ph`` só
+# é usado para operações baratas, como ler os parâmetros de um hash.
+_password_pool = password_pool_from_env()
+ph = make_hasher()
+
+def hash_password(password):
+    """Gera o hash de uma password usando Argon2 (lança PasswordPoolBusy se o pool estiver cheio)."""
+    return _password_pool.hash(password)
+
+def check_password(hashed_password, plain_password):
+    """Verifica se a password fornecida corresponde ao hash Argon2."""
+    if not hashed_password or not plain_password:
+         return False
+    return _password_pool.verify(hashed_password, plain_password)
+
+def check_password_needs_rehash(hashed_password):
+     """Verifica se o hash usa os parâmetros Argon2 atuais."""
+     if not hashed_password: return False
+     try:
+          return ph.check_needs_rehash(hashed_password)
+     except Exception:
+          return False 
+
+def get_password_pool_stats():
+    return _password_pool.stats()
+
+
+def _update_password_hash(user_id, old_hash, new_hash):
+    """Substitui o hash só se ainda for o mesmo (outro login pode já o ter feito)."""
+    conn = get_db_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    success = False
+    try:
+        query = "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s"
+        cursor.execute(query, (new_hash, user_id, old_hash))
+        conn.commit()
+        success = cursor.rowcount > 0
+    except Error as e:
+        print(f"Erro na query _update_password_hash: {e}")
+        conn.rollback()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return success
+
+def db_user_login(username, password):
+    """Autentica o utilizador; lança PasswordPoolBusy se o pool de Argon2 estiver cheio.
+
+    A conexão é devolvida ao pool antes de verificar a password, e hashes
+    com parâmetros antigos são atualizados depois de um login correto.
+    """
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor(dictionary=True)
+    user_record = None
+    try:
+        query = "SELECT id, password_hash, role FROM users WHERE username = %s"
+        cursor.execute(query, (username,))
+        user_record = cursor.fetchone()
+    except Error as e: print(f"Erro na query db_user_login: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+    if not user_record or not check_password(user_record['password_hash'], password):
+        return None
+    if check_password_needs_rehash(user_record['password_hash']):
+        try:
+            _update_password_hash(user_record['id'], user_record['password_hash'], hash_password(password))
+        except PasswordPoolBusy:
+            pass  # fica para o próximo login
+    return {"user_id": user_record['id'], "role": user_record['role']}
+
+def db_user_register(username, password, email):
+    # O hash é calculado antes de pedir a conexão, para não a prender durante o Argon2
+    hashed_pw = hash_password(password)
+    conn = get_db_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    success = False
+    try:
+        check_query = "SELECT id FROM users WHERE username = %s OR email = %s"
+        cursor.execute(check_query, (username, email))
+        if cursor.fetchone():
+             print(f"Utilizador ou email já existe: {username}/{email}")
+             return False
+        insert_query = """
+            INSERT INTO users (username, password_hash, email, role)
+            VALUES (%s, %s, %s, %s)
+        """
+        cursor.execute(insert_query, (username, hashed_pw, email, 'client'))
+        conn.commit()
+        success = cursor.rowcount > 0
+    except Error as e:
+        print(f"Erro na query db_user_register: {e}")
+        conn.rollback()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return success
+
+_PACKAGE_COLUMNS = ("id, name, description, sender_city, destination_city, is_tracked, creation_date, "
+                    "current_city, last_update, hop_count")
+_PACKAGE_DATE_KEYS = ('creation_date', 'last_update')
+
+def _dates_to_iso(row, keys=_PACKAGE_DATE_KEYS):
+    """Converte as datas de uma linha para ISO 8601 (os modelos SOAP usam Unicode)."""
+    for key in keys:
+        if isinstance(row.get(key), datetime):
+            row[key] = row[key].isoformat()
+    return row
+
+_TRACKING_HISTORY_QUERY = """
+            SELECT city, timestamp
+            FROM tracking_info
+            WHERE package_id = %s
+            ORDER BY timestamp ASC
+        """
+
+def _list_packages_query(user_id, limit=None, after=None):
+    """Listagem do utilizador como UNION ALL de dois acessos por índice.
+
+    ``sender_id = %s OR receiver_id = %s`` não pode usar nenhum índice; cada
+    ramo usa o seu (sender_id/receiver_id, creation_date, id), já sai
+    ordenado e lê no máximo ``limit`` linhas.
+    """
+    keyset, keyset_params = _keyset_clause(after)
+    limit_sql, limit_params = _limit_clause(limit)
+    query = f"""
+            (SELECT {_PACKAGE_COLUMNS} FROM packages
+             WHERE sender_id = %s{keyset}
+             ORDER BY creation_date DESC, id DESC{limit_sql})
+            UNION ALL
+            (SELECT {_PACKAGE_COLUMNS} FROM packages
+             WHERE receiver_id = %s AND sender_id <> %s{keyset}
+             ORDER BY creation_date DESC, id DESC{limit_sql})
+            ORDER BY creation_date DESC, id DESC{limit_sql}
+        """
+    params = ((user_id,) + keyset_params + limit_params
+              + (user_id, user_id) + keyset_params + limit_params
+              + limit_params)
+    return query, params
+
+def db_list_packages(user_id, limit=None, after=None):
+    """Pacotes enviados/recebidos pelo utilizador, mais recentes primeiro.
+
+    ``limit`` e ``after`` (posição devolvida por ``decode_cursor``) permitem
+    paginar por keyset em vez de devolver tudo.
+    """
+    conn = get_read_connection()
+    if conn is None: return []
+    cursor = conn.cursor(dictionary=True)
+    packages = []
+    try:
+        query, params = _list_packages_query(user_id, limit, after)
+        cursor.execute(query, params)
+        packages = cursor.fetchall()
+        for pkg in packages:
+            _dates_to_iso(pkg)
+    except Error as e: print(f"Erro na query db_list_packages: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return packages
+
+def db_check_status(package_id):
+    conn = get_read_connection()
+    if conn is None: return []
+    cursor = conn.cursor(dictionary=True)
+    tracking_history = []
+    try:
+        cursor.execute(_TRACKING_HISTORY_QUERY, (package_id,))
+        tracking_history = cursor.fetchall()
+        for entry in tracking_history:
+             if isinstance(entry['timestamp'], datetime):
+                 entry['timestamp'] = entry['timestamp'].isoformat()
+        # Mesma transação (REPEATABLE READ): as duas leituras veem o mesmo
+        # snapshot, mesmo que o arquivo mova as entradas entre elas
+        archived = archived_history(cursor, package_id)
+        if archived:
+            tracking_history = sorted(archived + tracking_history, key=lambda entry: entry['timestamp'])
+    except Error as e: print(f"Erro na query db_check_status: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return tracking_history
+
+# Tamanho mínimo de palavra indexada pelo FULLTEXT do InnoDB (innodb_ft_min_token_size)
+FT_MIN_TOKEN_SIZE = int(os.environ.get("FT_MIN_TOKEN_SIZE", 3))
+
+def _fulltext_query(search_term):
+    """Converte o termo numa pesquisa booleana (todas as palavras, por prefixo).
+
+    Devolve None quando o FULLTEXT não serve (termo vazio ou palavras mais
+    curtas do que o tamanho mínimo indexado) e deve usar-se o LIKE.
+    """
+    words = re.findall(r"\w+", search_term or "")
+    if not words or any(len(w) < FT_MIN_TOKEN_SIZE for w in words):
+        return None
+    return " ".join(f"+{w}*" for w in words)
+
+# A relevância do MATCH é um float: vai para o cursor e volta a ser comparada
+# com "=", por isso é arredondada a um inteiro (escala fixa) no próprio SELECT
+RELEVANCE_SCALE = 1000000
+
+def _search_packages_query(user_id, search_term, limit=None, after=None):
+    """Pesquisa do utilizador: FULLTEXT (ou LIKE) em cada ramo do UNION ALL.
+
+    Como em _list_packages_query, cada ramo aplica o keyset e ordena e
+    limita por si (lê no máximo ``limit`` linhas); o keyset usa a
+    relevância já arredondada (HAVING, sobre o alias), a mesma que vai no
+    cursor, por isso a comparação por igualdade é exata.
+    """
+    fulltext = _fulltext_query(search_term)
+    if fulltext:
+        relevance = f"CAST(ROUND(MATCH(name, description) AGAINST (%s IN BOOLEAN MODE) * {RELEVANCE_SCALE}) AS SIGNED)"
+        relevance_params = (fulltext,)
+        match_filter = "MATCH(name, description) AGAINST (%s IN BOOLEAN MODE)"
+        match_params = (fulltext,)
+    else:
+        term = f"%{search_term}%"
+        relevance, relevance_params = "0", ()
+        match_filter, match_params = "(name LIKE %s OR description LIKE %s)", (term, term)
+
+    keyset, keyset_params = "", ()
+    if after is not None:
+        keyset = " HAVING relevance < %s OR (relevance = %s AND id < %s)"
+        keyset_params = (after[0], after[0], after[1])
+    limit_sql, limit_params = _limit_clause(limit)
+    query = f"""
+            (SELECT {_PACKAGE_COLUMNS}, {relevance} AS relevance
+             FROM packages
+             WHERE sender_id = %s AND {match_filter}{keyset}
+             ORDER BY relevance DESC, id DESC{limit_sql})
+            UNION ALL
+            (SELECT {_PACKAGE_COLUMNS}, {relevance} AS relevance
+             FROM packages
+             WHERE receiver_id = %s AND sender_id <> %s AND {match_filter}{keyset}
+             ORDER BY relevance DESC, id DESC{limit_sql})
+            ORDER BY relevance DESC, id DESC{limit_sql}
+        """
+    params = (relevance_params + (user_id,) + match_params + keyset_params + limit_params
+              + relevance_params + (user_id, user_id) + match_params + keyset_params + limit_params
+              + limit_params)
+    return query, params
+
+def db_search_packages(user_id, search_term, limit=None, after=None):
+    """Procura pacotes de um utilizador por um termo (nome ou descrição).
+
+    Usa o índice FULLTEXT (name, description) com resultados ordenados por
+    relevância; ``after`` é uma posição (relevance, id) de ``SEARCH_CURSOR``.
+    """
+    conn = get_read_connection()
+    if conn is None: return []
+    cursor = conn.cursor(dictionary=True)
+    packages = []
+    try:
+        query, params = _search_packages_query(user_id, search_term, limit, after)
+        cursor.execute(query, params)
+        packages = cursor.fetchall()
+        for pkg in packages:
+            _dates_to_iso(pkg)
+    except Error as e:
+        print(f"Erro na query db_search_packages: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return packages
+
+
+
+
+def _log_package_change(cursor, package_id):
+    """Regista a escrita na mesma transação para o WS1 invalidar a sua cache."""
+    cursor.execute("INSERT INTO package_changes (package_id) VALUES (%s)", (package_id,))
+
+# Localização atual desnormalizada em packages, atualizada na mesma transação
+# que cada entrada de tracking_info. As atribuições do SET são avaliadas por
+# ordem, por isso current_city compara com o last_update ainda por atualizar;
+# uma entrada mais antiga do que a última (chegou fora de ordem) só conta hops.
+_CURRENT_LOCATION_UPDATE = """
+    UPDATE packages SET
+        current_city = IF(last_update IS NULL OR %s >= last_update, %s, current_city),
+        last_update = IF(last_update IS NULL OR %s >= last_update, %s, last_update),
+        hop_count = hop_count + %s
+    WHERE id = %s AND is_tracked = TRUE
+"""
+
+def _current_location_params(package_id, city, time_obj, hops=1):
+    return (time_obj, city, time_obj, time_obj, hops, package_id)
+
+# Limites de tracking_info: city VARCHAR(100) e o intervalo de um TIMESTAMP
+# do MySQL (com um dia de margem para o fuso horário da sessão)
+_TRACKING_CITY_MAX_LENGTH = 100
+_TIMESTAMP_MIN = datetime(1970, 1, 2)
+_TIMESTAMP_MAX = datetime(2038, 1, 18)
+
+def _parse_tracking_entry(city, time_str):
+    """Valida uma entrada de rastreio antes de a gravar: devolve (datetime, None) ou (None, erro).
+
+    Uma hora com fuso horário passa a UTC sem fuso (como o datetime.utcnow
+    da GUI), para não se misturar com as outras nas comparações.
+    """
+    try:
+        time_obj = datetime.fromisoformat(time_str)
+        if time_obj.tzinfo is not None:
+            time_obj = time_obj.astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError, OverflowError):
+        return None, f"Invalid timestamp: {time_str}"
+    if not city:
+        return None, "City is required."
+    if len(city) > _TRACKING_CITY_MAX_LENGTH:
+        return None, f"Value too long: city (maximum {_TRACKING_CITY_MAX_LENGTH} characters)."
+    if not _TIMESTAMP_MIN <= time_obj <= _TIMESTAMP_MAX:
+        return None, f"Timestamp out of range: {time_str}"
+    return time_obj, None
+
+def _package_counter_rows(cursor, package_id, lock=False):
+    """(origem, destino, rastreado, hora de criação) do pacote, para os contadores do dashboard."""
+    cursor.execute(f"""
+        SELECT sender_city, destination_city, is_tracked, DATE_FORMAT(creation_date, %s)
+        FROM packages WHERE id = %s{' FOR UPDATE' if lock else ''}
+    """, (HOUR_FORMAT, package_id))
+    return cursor.fetchall()
+
+def db_add_package(sender_id, receiver_id, name, description, sender_city, dest_city):
+    conn = get_db_connection()
+    if conn is None: return None
+    cursor = conn.cursor()
+    new_package_id = None
+    try:
+        query = """
+            INSERT INTO packages (sender_id, receiver_id, name, description, sender_city, destination_city, is_tracked)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        cursor.execute(query, (sender_id, receiver_id, name, description, sender_city, dest_city, False))
+        if cursor.lastrowid:
+             new_package_id = cursor.lastrowid
+             bump_counters(cursor, package_deltas(_package_counter_rows(cursor, new_package_id)))
+        conn.commit()
+    except Error as e:
+        print(f"Erro na query db_add_package: {e}")
+        conn.rollback()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return new_package_id
+
+def db_remove_package(package_id):
+    conn = get_db_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    success = False
+    try:
+         package = _package_counter_rows(cursor, package_id, lock=True)
+         cursor.execute("SELECT timestamp FROM tracking_info WHERE package_id = %s", (package_id,))
+         history = [row[0] for row in cursor.fetchall()]
+         query = "DELETE FROM packages WHERE id = %s"
+         cursor.execute(query, (package_id,))
+         success = cursor.rowcount > 0
+         if success:
+             # Sem FK (não há CASCADE): o histórico arquivado sai aqui
+             cursor.execute("DELETE FROM tracking_archive WHERE package_id = %s", (package_id,))
+             deltas = package_deltas(package, sign=-1)
+             deltas.update(tracking_deltas(history, sign=-1))
+             # Os buckets horários fora da retenção já foram apagados: não os recriar negativos
+             bump_counters(cursor, within_window(deltas, retention_cutoff(cursor)))
+             _log_package_change(cursor, package_id)
+         conn.commit()
+    except Error as e:
+         print(f"Erro na query db_remove_package: {e}")
+         conn.rollback()
+    finally:
+         if cursor: cursor.close()
+         if conn: conn.close()
+    return success
+
+def db_register_tracking(package_id, initial_city, initial_time_str):
+    """Marca pacote como rastreado e adiciona ponto inicial."""
+    conn = get_db_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    success = False
+    try:
+        try:
+             initial_time = datetime.fromisoformat(initial_time_str)
+        except ValueError:
+             print(f"Formato de timestamp inválido: {initial_time_str}")
+             return False 
+
+        update_pkg_query = "UPDATE packages SET is_tracked = TRUE WHERE id = %s AND is_tracked = FALSE" # Evitar re-registar
+        cursor.execute(update_pkg_query, (package_id,))
+        updated_rows = cursor.rowcount
+
+        if updated_rows == 0:
+             # FOR UPDATE: o INSERT em tracking_info só pediria um lock partilhado
+             # (FK) e o UPDATE da localização teria de o promover (deadlock com
+             # outra transação no mesmo pacote; ver _tracked_package_ids)
+             check_query = "SELECT id FROM packages WHERE id = %s AND is_tracked = TRUE FOR UPDATE"
+             cursor.execute(check_query, (package_id,))
+             if cursor.fetchone():
+                  print(f"Pacote {package_id} já estava rastreado.")
+             else:
+                   print(f"Pacote {package_id} não encontrado para registar rastreio.")
+                   return False 
+
+        insert_track_query = """
+            INSERT INTO tracking_info (package_id, city, timestamp)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE city = VALUES(city) -- Exemplo: se (package_id, timestamp) fosse unique
+            -- Se não houver constraint unique, apenas insere
+        """
+        cursor.execute(insert_track_query, (package_id, initial_city, initial_time))
+        cursor.execute(_CURRENT_LOCATION_UPDATE, _current_location_params(package_id, initial_city, initial_time))
+        deltas = tracking_deltas([initial_time])
+        if updated_rows:
+            deltas.update({('status', 'untracked'): -1, ('status', 'tracked'): 1})
+        bump_counters(cursor, deltas)
+        _log_package_change(cursor, package_id)
+
+        conn.commit()
+        success = True
+    except Error as e:
+        print(f"Erro na query db_register_tracking: {e}")
+        conn.rollback()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return success
+
+def db_update_package_status(package_id, city, time_str):
+    """Adiciona uma nova entrada de rastreamento."""
+    _tracking_archiver.ensure_started()
+    conn = get_db_connection()
+    if conn is None: return False
+    cursor = conn.cursor()
+    success = False
+    try:
+        try:
+             time_obj = datetime.fromisoformat(time_str)
+        except ValueError:
+             print(f"Formato de timestamp inválido: {time_str}")
+             return False
+
+        # o UPDATE da localização também valida o pacote (0 linhas = não existe ou não é rastreado)
+        cursor.execute(_CURRENT_LOCATION_UPDATE, _current_location_params(package_id, city, time_obj))
+        if cursor.rowcount == 0:
+            print(f"Pacote {package_id} não encontrado ou não está a ser rastreado.")
+            conn.rollback()
+            return False
+
+        insert_query = """
+            INSERT INTO tracking_info (package_id, city, timestamp)
+            VALUES (%s, %s, %s)
+        """
+        cursor.execute(insert_query, (package_id, city, time_obj))
+        success = cursor.rowcount > 0
+        bump_counters(cursor, tracking_deltas([time_obj]))
+        _log_package_change(cursor, package_id)
+        conn.commit()
+    except Error as e:
+        print(f"Erro na query db_update_package_status: {e}")
+        conn.rollback()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return success
+
+# Máximo de IDs por "IN (...)" na validação de db_bulk_update_package_status
+BULK_ID_CHUNK = 1000
+
+def _tracked_package_ids(cursor, package_ids):
+    """Dos IDs dados, devolve os que existem e estão a ser rastreados (uma query por bloco).
+
+    As linhas ficam bloqueadas (FOR UPDATE, por ordem de id) até ao fim da
+    transação, como no UPDATE do db_update_package_status: o INSERT em
+    tracking_info que se segue só pediria um lock partilhado (FK) e o UPDATE
+    da localização teria de o promover, o que dá deadlock com outra
+    transação a fazer o mesmo ao mesmo pacote.
+    """
+    package_ids = sorted(package_ids)
+    tracked = set()
+    for start in range(0, len(package_ids), BULK_ID_CHUNK):
+        chunk = package_ids[start:start + BULK_ID_CHUNK]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"""
+            SELECT id FROM packages WHERE is_tracked = TRUE AND id IN ({placeholders})
+            ORDER BY id FOR UPDATE
+        """, chunk)
+        tracked.update(row[0] for row in cursor.fetchall())
+    return tracked
+
+def _insert_tracking_updates(cursor, rows):
+    """Insere entradas (package_id, city, datetime) de pacotes rastreados, sem commit.
+
+    Devolve, pela mesma ordem, uma lista de erros (None = inserida). Usada
+    pelo bulk e pelos lotes do write-behind.
+    """
+    errors = [None] * len(rows)
+    tracked = _tracked_package_ids(cursor, {package_id for package_id, _, _ in rows})
+    valid = []
+    for i, (package_id, city, time_obj) in enumerate(rows):
+        if package_id in tracked:
+            valid.append((package_id, city, time_obj))
+        else:
+            errors[i] = f"Package {package_id} not found or not tracked."
+    if valid:
+        insert_query = """
+            INSERT INTO tracking_info (package_id, city, timestamp)
+            VALUES (%s, %s, %s)
+        """
+        cursor.executemany(insert_query, valid)  # o conector junta tudo num INSERT multi-linha
+        # um UPDATE por pacote: a entrada mais recente do lote e o total de hops
+        latest, hops = {}, {}
+        for package_id, city, time_obj in valid:
+            hops[package_id] = hops.get(package_id, 0) + 1
+            if package_id not in latest or time_obj >= latest[package_id][1]:
+                latest[package_id] = (city, time_obj)
+        cursor.executemany(_CURRENT_LOCATION_UPDATE,
+                           [_current_location_params(package_id, *latest[package_id], hops=hops[package_id])
+                            for package_id in sorted(latest)])
+        bump_counters(cursor, tracking_deltas([time_obj for _, _, time_obj in valid]))
+        cursor.executemany("INSERT INTO package_changes (package_id) VALUES (%s)",
+                           [(package_id,) for package_id in sorted(latest)])
+    return errors
+
+def db_bulk_update_package_status(updates):
+    """Adiciona várias entradas de rastreamento numa só transação.
+
+    ``updates`` é uma lista de (package_id, city, time_str). Devolve, pela
+    mesma ordem, uma lista de mensagens de erro (None = entrada inserida).
+    Cada entrada é validada antes (cidade, hora; ver _parse_tracking_entry)
+    para que uma entrada inválida não faça falhar o INSERT das outras;
+    todas as válidas são inseridas de uma vez com ``executemany``. Se a
+    base de dados falhar nenhuma fica inserida.
+    """
+    _tracking_archiver.ensure_started()
+    errors = [None] * len(updates)
+    rows = []
+    for i, (package_id, city, time_str) in enumerate(updates):
+        time_obj, errors[i] = _parse_tracking_entry(city, time_str)
+        if time_obj is not None:
+            rows.append((i, package_id, city, time_obj))
+    if not rows: return errors
+
+    conn = get_db_connection()
+    if conn is None:
+        return [error or "Database connection unavailable." for error in errors]
+    cursor = conn.cursor()
+    try:
+        row_errors = _insert_tracking_updates(cursor, [row[1:] for row in rows])
+        for (i, _, _, _), error in zip(rows, row_errors):
+            errors[i] = error
+        conn.commit()
+    except Error as e:
+        print(f"Erro na query db_bulk_update_package_status: {e}")
+        conn.rollback()
+        errors = [error or "Database error; no entries were saved." for error in errors]
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return errors
+
+
+# --- Write-behind (TRACKING_WRITE_BEHIND=1) ---
+
+_write_behind = write_behind_from_env(get_db_connection, _insert_tracking_updates)
+WRITE_BEHIND_WAIT_TIMEOUT = float(os.environ.get("TRACKING_FLUSH_WAIT_TIMEOUT", 5))
+
+def write_behind_enabled():
+    return _write_behind is not None
+
+def db_queue_package_status(package_id, city, time_str, wait=False):
+    """Aceita uma entrada de rastreamento no write-behind; devolve None ou a mensagem de erro.
+
+    Sem ``wait`` a entrada fica no journal e é gravada no próximo lote (a
+    validação do pacote acontece nessa altura; a da cidade e da hora já
+    aqui, para um evento inválido nunca chegar ao journal); com ``wait``
+    espera pela gravação e devolve o resultado dela. Lança
+    ``WriteBehindFull`` se houver demasiados eventos por gravar.
+    """
+    _tracking_archiver.ensure_started()
+    time_obj, error = _parse_tracking_entry(city, time_str)
+    if error: return error
+    # O commit é feito pela thread do write-behind, fora deste pedido
+    _router.note_write()
+    return _write_behind.submit(package_id, city, time_obj, wait=wait, timeout=WRITE_BEHIND_WAIT_TIMEOUT)
+
+def flush_tracking_updates(timeout=None):
+    """Barreira: espera que as entradas aceites por este processo estejam no MySQL."""
+    if _write_behind is None: return True
+    return _write_behind.flush(WRITE_BEHIND_WAIT_TIMEOUT if timeout is None else timeout)
+
+def recover_tracking_journals():
+    """Repõe os journals de write-behind deixados por processos que morreram."""
+    if _write_behind is None: return 0
+    return _write_behind.recover()
+
+def get_write_behind_stats():
+    """Contadores do write-behind (aceites, gravados, descartados, pendentes)."""
+    return _write_behind.stats() if _write_behind is not None else {'enabled': False}
+
+# Linhas por INSERT multi-linha em db_import_packages
+IMPORT_INSERT_CHUNK = int(os.environ.get("IMPORT_INSERT_CHUNK", 500))
+
+# Limites das colunas de packages, validados antes de inserir para que uma
+# linha demasiado longa não faça falhar o lote inteiro
+_IMPORT_MAX_LENGTHS = {'name': 100, 'sender_city': 100, 'destination_city': 100}
+_IMPORT_REQUIRED = ('sender_username', 'receiver_username', 'name', 'sender_city', 'destination_city')
+
+def _user_ids_by_username(cursor, usernames):
+    """Resolve usernames para IDs em blocos de ``BULK_ID_CHUNK`` (chave em minúsculas)."""
+    usernames = list(usernames)
+    user_ids = {}
+    for start in range(0, len(usernames), BULK_ID_CHUNK):
+        chunk = usernames[start:start + BULK_ID_CHUNK]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        cursor.execute(f"SELECT id, username FROM users WHERE username IN ({placeholders})", chunk)
+        user_ids.update((username.lower(), user_id) for user_id, username in cursor.fetchall())
+    return user_ids
+
+def db_import_packages(rows):
+    """Insere um lote de pacotes identificados por username.
+
+    ``rows`` é uma lista de dicts com sender_username, receiver_username,
+    name, description, sender_city e destination_city. Devolve, pela mesma
+    ordem, uma lista de mensagens de erro (None = pacote inserido). As
+    linhas válidas são inseridas em INSERTs multi-linha de
+    ``IMPORT_INSERT_CHUNK`` linhas, todas na mesma transação.
+    """
+    errors = [None] * len(rows)
+    candidates = []
+    for i, row in enumerate(rows):
+        missing = [field for field in _IMPORT_REQUIRED if not row.get(field)]
+        too_long = [field for field, size in _IMPORT_MAX_LENGTHS.items() if len(row.get(field) or '') > size]
+        if missing:
+            errors[i] = f"Missing required fields: {', '.join(missing)}."
+        elif too_long:
+            errors[i] = f"Value too long: {', '.join(too_long)}."
+        else:
+            candidates.append(i)
+    if not candidates: return errors
+
+    conn = get_db_connection()
+    if conn is None:
+        return [error or "Database connection unavailable." for error in errors]
+    cursor = conn.cursor()
+    try:
+        usernames = {rows[i][key].lower() for i in candidates for key in ('sender_username', 'receiver_username')}
+        user_ids = _user_ids_by_username(cursor, usernames)
+        values = []
+        for i in candidates:
+            row = rows[i]
+            sender_id = user_ids.get(row['sender_username'].lower())
+            receiver_id = user_ids.get(row['receiver_username'].lower())
+            if sender_id is None or receiver_id is None:
+                unknown = row['sender_username'] if sender_id is None else row['receiver_username']
+                errors[i] = f"Unknown user: {unknown}."
+                continue
+            values.append((sender_id, receiver_id, row['name'], row.get('description'),
+                           row['sender_city'], row['destination_city'], False))
+
+        insert_query = """
+            INSERT INTO packages (sender_id, receiver_id, name, description, sender_city, destination_city, is_tracked)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        for start in range(0, len(values), IMPORT_INSERT_CHUNK):
+            cursor.executemany(insert_query, values[start:start + IMPORT_INSERT_CHUNK])
+        if values:
+            # hora de criação dada pelo servidor, como o DEFAULT de creation_date
+            cursor.execute("SELECT DATE_FORMAT(NOW(), %s)", (HOUR_FORMAT,))
+            created_hour = cursor.fetchone()[0]
+            bump_counters(cursor, package_deltas((value[4], value[5], value[6], created_hour) for value in values))
+        conn.commit()
+    except Error as e:
+        print(f"Erro na query db_import_packages: {e}")
+        conn.rollback()
+        errors = [error or "Database error; no packages from this batch were saved." for error in errors]
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return errors
+
+_user_directory = UserDirectory(get_db_connection)
+
+def db_search_users(prefix, limit):
+    """Utilizadores cujo nome começa por ``prefix`` (índice em memória); None se indisponível."""
+    return _user_directory.search(prefix, limit)
+
+def get_user_directory_stats():
+    """Tamanho do diretório de utilizadores e número de pesquisas/atualizações neste processo."""
+    return _user_directory.stats()
+
+def db_get_all_users():
+    conn = get_read_connection()
+    if conn is None: return []
+    cursor = conn.cursor(dictionary=True)
+    users = []
+    try:
+        query = "SELECT id, username FROM users ORDER BY username ASC"
+        cursor.execute(query)
+        users = cursor.fetchall()
+    except Error as e:
+        print(f"Erro na query db_get_all_users: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return users
+
+def _all_packages_query(limit=None, after=None):
+    keyset, keyset_params = _keyset_clause(after, alias="p.")
+    limit_sql, limit_params = _limit_clause(limit)
+    query = f"""
+            SELECT
+                p.id, p.name, p.description, p.sender_city, p.destination_city, p.is_tracked,
+                sender.username AS sender_username,
+                receiver.username AS receiver_username,
+                p.creation_date, p.current_city, p.last_update, p.hop_count
+            FROM packages p
+            JOIN users sender ON p.sender_id = sender.id
+            JOIN users receiver ON p.receiver_id = receiver.id
+            WHERE TRUE{keyset}
+            ORDER BY p.creation_date DESC, p.id DESC{limit_sql}
+        """
+    return query, keyset_params + limit_params
+
+def db_get_all_packages(limit=None, after=None):
+    conn = get_read_connection()
+    if conn is None: return []
+    cursor = conn.cursor(dictionary=True)
+    packages = []
+    try:
+        query, params = _all_packages_query(limit, after)
+        cursor.execute(query, params)
+        packages = cursor.fetchall()
+        for pkg in packages:
+            _dates_to_iso(pkg)
+    except Error as e:
+        print(f"Erro na query db_get_all_packages: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return packages
+
+
+# --- Dashboard ---
+
+_dashboard_reconciler = DashboardReconciler(get_db_connection)
+
+def db_get_dashboard_stats():
+    """Totais do dashboard lidos de dashboard_counters (ou None); arranca a reconciliação periódica."""
+    _dashboard_reconciler.ensure_started()
+    return read_stats(get_read_connection)
+
+def reconcile_dashboard_counters():
+    """Recalcula já os contadores a partir das tabelas base; devolve True se reconciliou."""
+    return _dashboard_reconciler.run_once()
+
+def fill_dashboard_counters():
+    """Preenche os contadores no arranque se nunca foram reconciliados (ver DashboardReconciler.fill)."""
+    return _dashboard_reconciler.fill()
+
+def get_dashboard_reconciler_stats():
+    """Execuções, falhas e última reconciliação dos contadores neste processo."""
+    return _dashboard_reconciler.stats()
+
+
+# --- Arquivo do histórico de rastreio ---
+
+# Os pacotes só são arquivados TRACKING_ARCHIVE_AFTER_DAYS depois da última
+# entrada; com DAYS * 24 acima de DASHBOARD_HOURS_RETENTION as entradas
+# arquivadas já não contam nos contadores horários do dashboard. O job
+# arranca com a primeira escrita de rastreio de cada worker.
+_tracking_archiver = TrackingArchiver(get_db_connection)
+
+def get_tracking_archiver_stats():
+    """Pacotes/entradas arquivados e bytes escritos por este processo."""
+    return _tracking_archiver.stats()
+
+
+# --- Leituras em streaming (cursor não-bufferizado) ---
+
+def _iter_unbuffered(name, query, params=(), date_keys=()):
+    """Gera as linhas uma a uma a partir de um cursor não-bufferizado.
+
+    A conexão fica emprestada até o gerador terminar ou ser fechado. Ao
+    contrário das outras funções, os erros são propagados: a resposta já
+    está a ser enviada e truncá-la em silêncio esconderia a falha.
+    """
+    conn = get_read_connection()
+    if conn is None: raise Error(msg=f"{name}: sem conexão à base de dados")
+    cursor = conn.cursor(dictionary=True, buffered=False)
+    try:
+        cursor.execute(query, params)
+        for row in cursor:
+            for key in date_keys:
+                if isinstance(row[key], datetime):
+                    row[key] = row[key].isoformat()
+            yield row
+    except Error as e:
+        print(f"Erro na query {name}: {e}")
+        raise
+    finally:
+        try:
+            cursor.close()
+        except Error:
+            pass  # resultados por ler (cliente desligou): o pool descarta a conexão
+        conn.close()
+
+def db_iter_all_packages():
+    return _iter_unbuffered('db_iter_all_packages', _all_packages_query()[0], date_keys=_PACKAGE_DATE_KEYS)
+
+def db_iter_all_users():
+    return _iter_unbuffered('db_iter_all_users', "SELECT id, username FROM users ORDER BY username ASC")
@@ -0,0 +1,46 @@
+"""Configuração do gunicorn para o WS2 em produção.
+
+    gunicorn -c gunicorn.conf.py ws2_admin_service:flask_app
+
+Tudo é configurável por variáveis GUNICORN_*. GUNICORN_WORKER_CLASS=gevent
+usa workers cooperativos (milhares de ligações por worker), com o driver
+MySQL em Python puro e o Argon2 em threads nativas. Com GUNICORN_PRELOAD=1 a
+aplicação (e as migrações) carregam uma vez no processo mestre; cada
+worker recomeça o pool MySQL e o pool de Argon2 em post_fork.
+"""
+import os
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    # Tem de acontecer antes de a aplicação ser importada (preload): o pool
+    # MySQL, as caches e o driver passam a usar sockets e locks cooperativos.
+    from gevent import monkey
+    monkey.patch_all()
+    os.environ.setdefault("MYSQL_USE_PURE", "1")
+    os.environ.setdefault("PASSWORD_POOL_MODE", "gevent")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5002)}"
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+# Ligações simultâneas por worker gevent
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+# Reinicia cada worker ao fim de N pedidos (0 = nunca), com jitter para não reiniciarem todos juntos
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 50))
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    from db_utils import reset_after_fork
+    reset_after_fork()
+
+
+def worker_exit(server, worker):
+    from db_utils import close_connections
+    close_connections()
@@ -0,0 +1,380 @@
+"""Migrações versionadas do esquema da base de dados.
+
+Aplicadas no arranque dos serviços (DB_AUTO_MIGRATE=1) ou pela linha de comandos:
+
+    python migrations.py             # aplica as migrações pendentes
+    python migrations.py --status    # lista as migrações aplicadas/pendentes
+    python migrations.py --explain   # falha se uma query crítica fizer full scan
+                                     # (os testes em tests/test_migrations.py verificam os índices usados)
+    python migrations.py --backfill-location   # recalcula a localização atual dos pacotes
+
+WS1 e WS2 têm cópias iguais deste ficheiro; um lock do MySQL (GET_LOCK)
+garante que só um processo aplica migrações de cada vez.
+"""
+import sys
+from datetime import datetime
+
+from mysql.connector import Error
+
+from db_utils import (
+    get_db_connection, _list_packages_query, _search_packages_query,
+    _TRACKING_HISTORY_QUERY
+)
+from tracking_archive import CANDIDATES_QUERY as _ARCHIVE_CANDIDATES_QUERY, decode_history
+try:
+    from db_utils import _all_packages_query  # só o WS2 serve o getAllPackages
+except ImportError:
+    _all_packages_query = None
+
+LOCK_NAME = 'tracking_schema_migrations'
+LOCK_TIMEOUT = 60
+BACKFILL_BATCH = 1000  # pacotes (intervalo de IDs) por UPDATE do backfill
+
+
+def _index_exists(cursor, table, index_name):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+    """, (table, index_name))
+    return cursor.fetchone() is not None
+
+
+def _table_exists(cursor, table):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+        LIMIT 1
+    """, (table,))
+    return cursor.fetchone() is not None
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        LIMIT 1
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def add_column(table, column, definition):
+    """Passo de migração que acrescenta uma coluna se ainda não existir."""
+    def step(conn, cursor):
+        if not _column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def _backfill_location_range(cursor, first_id, last_id, archive=True):
+    """Recalcula current_city, last_update e hop_count dos pacotes com ID no intervalo que têm rastreio.
+
+    Os pacotes com histórico em tracking_archive (``archive``: a tabela
+    existe) ficam de fora do UPDATE, que só vê tracking_info, e são
+    recalculados em _backfill_archived_range com as duas partes.
+    """
+    not_archived = ("AND NOT EXISTS (SELECT 1 FROM tracking_archive a WHERE a.package_id = p.id)"
+                    if archive else "")
+    cursor.execute(f"""
+        UPDATE packages p
+        JOIN (
+            SELECT package_id, COUNT(*) AS hops, MAX(timestamp) AS last_ts
+            FROM tracking_info
+            WHERE package_id BETWEEN %s AND %s
+            GROUP BY package_id
+        ) agg ON agg.package_id = p.id
+        SET p.current_city = (SELECT t.city FROM tracking_info t WHERE t.package_id = p.id
+                              ORDER BY t.timestamp DESC, t.id DESC LIMIT 1),
+            p.last_update = agg.last_ts,
+            p.hop_count = agg.hops
+        WHERE TRUE {not_archived}
+    """, (first_id, last_id))
+    updated = cursor.rowcount
+    if archive: updated += _backfill_archived_range(cursor, first_id, last_id)
+    return updated
+
+
+def _backfill_archived_range(cursor, first_id, last_id):
+    """Localização atual dos pacotes arquivados do intervalo: arquivo + entradas ativas."""
+    cursor.execute("SELECT package_id, history FROM tracking_archive WHERE package_id BETWEEN %s AND %s",
+                   (first_id, last_id))
+    histories = {package_id: [(city, datetime.fromisoformat(ts)) for city, ts in decode_history(blob)]
+                 for package_id, blob in cursor.fetchall()}
+    if not histories: return 0
+    cursor.execute("""
+        SELECT package_id, city, timestamp FROM tracking_info
+        WHERE package_id BETWEEN %s AND %s
+        ORDER BY package_id, timestamp, id
+    """, (first_id, last_id))
+    for package_id, city, timestamp in cursor.fetchall():
+        if package_id in histories: histories[package_id].append((city, timestamp))
+    rows = []
+    for package_id, entries in sorted(histories.items()):
+        # a última entrada com a hora mais alta, como o ORDER BY timestamp DESC, id DESC acima
+        city, last_ts = entries[0]
+        for entry_city, entry_ts in entries:
+            if entry_ts >= last_ts: city, last_ts = entry_city, entry_ts
+        rows.append((city, last_ts, len(entries), package_id))
+    cursor.executemany("UPDATE packages SET current_city = %s, last_update = %s, hop_count = %s WHERE id = %s",
+                       rows)
+    return len(rows)
+
+
+def _backfill_location(conn, cursor, batch_size):
+    """Percorre packages por intervalos de IDs, com um commit por intervalo.
+
+    Cada UPDATE só prende as linhas do seu intervalo e só até ao commit:
+    numa tabela grande as escritas dos serviços não ficam bloqueadas nem o
+    undo log cresce durante todo o backfill. Idempotente, por isso pode
+    recomeçar do início se falhar a meio.
+    """
+    archive = _table_exists(cursor, 'tracking_archive')  # a migração 4 corre antes da 6
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM packages")
+    max_id = cursor.fetchone()[0]
+    updated = 0
+    for first_id in range(1, max_id + 1, batch_size):
+        updated += _backfill_location_range(cursor, first_id, first_id + batch_size - 1, archive)
+        conn.commit()
+    return updated
+
+
+def backfill_location_step(conn, cursor):
+    """Passo de migração: preenche a localização atual de todos os pacotes existentes."""
+    _backfill_location(conn, cursor, BACKFILL_BATCH)
+
+
+def add_index(table, index_name, columns, kind="INDEX"):
+    """Passo de migração que cria um índice se ainda não existir (init.sql já o pode ter)."""
+    def step(conn, cursor):
+        if not _index_exists(cursor, table, index_name):
+            cursor.execute(f"ALTER TABLE {table} ADD {kind} {index_name} ({columns})")
+    return step
+
+
+def drop_index(table, index_name):
+    """Passo de migração que remove um índice se existir."""
+    def step(conn, cursor):
+        if _index_exists(cursor, table, index_name):
+            cursor.execute(f"ALTER TABLE {table} DROP INDEX {index_name}")
+    return step
+
+
+# (versão, descrição, passos) -- um passo é SQL ou uma função que recebe a conexão e o cursor.
+# Nunca alterar uma migração já publicada: acrescentar uma nova.
+MIGRATIONS = [
+    (1, "Índices para listagens, pesquisa e histórico de rastreio", [
+        add_index('packages', 'idx_packages_sender_created', 'sender_id, creation_date, id'),
+        add_index('packages', 'idx_packages_receiver_created', 'receiver_id, creation_date, id'),
+        add_index('packages', 'idx_packages_created', 'creation_date, id'),
+        add_index('packages', 'ft_packages_name_description', 'name, description', kind="FULLTEXT INDEX"),
+        add_index('tracking_info', 'idx_tracking_package_time', 'package_id, timestamp'),
+    ]),
+    (2, "Registo de alterações para invalidar as caches do WS1", [
+        """
+        CREATE TABLE IF NOT EXISTS package_changes (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            package_id INT NOT NULL,
+            changed_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+            INDEX idx_package_changes_time (changed_at)
+        )
+        """,
+    ]),
+    (3, "Checkpoints dos journals de write-behind do WS2", [
+        """
+        CREATE TABLE IF NOT EXISTS tracking_journal_checkpoints (
+            journal_id VARCHAR(64) PRIMARY KEY,
+            last_seq BIGINT NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (4, "Localização atual desnormalizada em packages (cidade, hora, hops)", [
+        add_column('packages', 'current_city', 'VARCHAR(100) NULL'),
+        add_column('packages', 'last_update', 'TIMESTAMP NULL'),
+        add_column('packages', 'hop_count', 'INT NOT NULL DEFAULT 0'),
+        backfill_location_step,
+    ]),
+    (5, "Contadores do dashboard de administração", [
+        """
+        CREATE TABLE IF NOT EXISTS dashboard_counters (
+            metric VARCHAR(20) NOT NULL,
+            bucket VARCHAR(100) NOT NULL,
+            shard TINYINT UNSIGNED NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (metric, bucket, shard)
+        )
+        """,
+        add_index('tracking_info', 'idx_tracking_time', 'timestamp'),
+    ]),
+    (6, "Arquivo do histórico de rastreio dos pacotes entregues", [
+        """
+        CREATE TABLE IF NOT EXISTS tracking_archive (
+            package_id INT PRIMARY KEY,
+            history MEDIUMBLOB NOT NULL,
+            entries INT NOT NULL,
+            archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (7, "Remove idx_packages_last_update (o arquivo já não o usa)", [
+        drop_index('packages', 'idx_packages_last_update'),
+    ]),
+]
+
+
+def _ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migrations():
+    """Aplica as migrações pendentes por ordem. Devolve as versões aplicadas."""
+    conn = get_db_connection()
+    if conn is None: return []
+    cursor = conn.cursor()
+    applied_now = []
+    locked = False
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, LOCK_TIMEOUT))
+        locked = cursor.fetchone()[0] == 1
+        if not locked:
+            print("Migrações: não foi possível obter o lock; outro processo está a aplicá-las.")
+            return []
+
+        _ensure_migrations_table(cursor)
+        applied = _applied_versions(cursor)
+        for version, description, steps in MIGRATIONS:
+            if version in applied: continue
+            print(f"Migração {version}: {description}")
+            for step in steps:
+                if callable(step): step(conn, cursor)
+                else: cursor.execute(step)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            conn.commit()
+            applied_now.append(version)
+    except Error as e:
+        print(f"Erro ao aplicar migrações: {e}")
+        conn.rollback()
+    finally:
+        if locked:
+            try:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchone()
+            except Error:
+                pass  # o lock é libertado de qualquer forma quando a sessão fecha
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return applied_now
+
+
+def migration_status():
+    """Lista (versão, descrição, aplicada?) de todas as migrações conhecidas."""
+    conn = get_db_connection()
+    if conn is None: return []
+    cursor = conn.cursor()
+    status = []
+    try:
+        _ensure_migrations_table(cursor)
+        applied = _applied_versions(cursor)
+        status = [(version, description, version in applied) for version, description, _ in MIGRATIONS]
+    except Error as e:
+        print(f"Erro ao ler schema_migrations: {e}")
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return status
+
+
+def backfill_current_location(batch_size=BACKFILL_BATCH):
+    """Recalcula a localização atual de todos os pacotes, um intervalo de IDs por transação.
+
+    Idempotente; serve para corrigir dados depois de escritas diretas em
+    tracking_info (restauros, scripts). Conta também o histórico já movido
+    para tracking_archive. Devolve o número de pacotes atualizados.
+    """
+    conn = get_db_connection()
+    if conn is None: return 0
+    cursor = conn.cursor()
+    updated = 0
+    try:
+        updated = _backfill_location(conn, cursor, batch_size)
+    except Error as e:
+        print(f"Erro no backfill da localização atual: {e}")
+        conn.rollback()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return updated
+
+
+def hot_queries():
+    """As queries críticas, com parâmetros representativos, para o EXPLAIN."""
+    after = (datetime(2100, 1, 1), 2 ** 31)
+    queries = [
+        ("listPackages", *_list_packages_query(1, limit=51)),
+        ("listPackages (página seguinte)", *_list_packages_query(1, limit=51, after=after)),
+        ("searchPackages (FULLTEXT)", *_search_packages_query(1, "caixa", limit=51)),
+        ("checkStatus", _TRACKING_HISTORY_QUERY, (1,)),
+        ("arquivo (candidatos)", _ARCHIVE_CANDIDATES_QUERY, (0, 5000, 30)),
+    ]
+    if _all_packages_query is not None:
+        queries += [
+            ("getAllPackagesPage", *_all_packages_query(limit=101)),
+            ("getAllPackagesPage (página seguinte)", *_all_packages_query(limit=101, after=after)),
+        ]
+    return queries
+
+
+def explain_plans():
+    """Corre EXPLAIN nas queries críticas; devolve {nome: linhas do EXPLAIN}."""
+    conn = get_db_connection()
+    if conn is None: raise Error(msg="Sem conexão à base de dados")
+    cursor = conn.cursor(dictionary=True)
+    plans = {}
+    try:
+        for name, query, params in hot_queries():
+            cursor.execute("EXPLAIN " + query, params)
+            plans[name] = cursor.fetchall()
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+    return plans
+
+
+def explain_full_scans():
+    """Devolve [(query, tabela)] das queries críticas que fazem full scan."""
+    full_scans = []
+    for name, rows in explain_plans().items():
+        for row in rows:
+            # tabelas derivadas (<union1,2>, <derived2>) são temporárias e pequenas
+            if row['type'] == 'ALL' and not row['table'].startswith('<'):
+                full_scans.append((name, row['table']))
+    return full_scans
+
+
+if __name__ == '__main__':
+    if '--status' in sys.argv:
+        for version, description, applied in migration_status():
+            print(f"{version:4d}  {'aplicada' if applied else 'PENDENTE':9s} {description}")
+    elif '--backfill-location' in sys.argv:
+        print(f"Localização atual recalculada em {backfill_current_location()} pacotes.")
+    elif '--explain' in sys.argv:
+        scans = explain_full_scans()
+        for name, table in scans:
+            print(f"FULL SCAN: {name} lê a tabela {table} inteira")
+        if scans: sys.exit(1)
+        print("EXPLAIN OK: nenhuma query crítica faz full scan.")
+    else:
+        applied = apply_migrations()
+        print(f"Migrações aplicadas: {applied or 'nenhuma (esquema atualizado)'}")
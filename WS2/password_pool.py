@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+
+
+class PasswordPoolBusy(Exception):
+    """A fila de hashing está cheia: o pedido é recusado em vez de ficar à espera."""
+
+
+def make_hasher():
+    """PasswordHasher com os parâmetros ARGON2_* (por omissão os da biblioteca: t=3, m=64MiB, p=4)."""
+    defaults = PasswordHasher()
+    return PasswordHasher(
+        time_cost=int(os.environ.get("ARGON2_TIME_COST", defaults.time_cost)),
+        memory_cost=int(os.environ.get("ARGON2_MEMORY_COST", defaults.memory_cost)),
+        parallelism=int(os.environ.get("ARGON2_PARALLELISM", defaults.parallelism)),
+    )
+
+
+# Cada processo (incluindo os workers do pool) cria o seu
+_hasher = make_hasher()
+
+
+def _hash(plain_password):
+    return _hasher.hash(plain_password.encode('utf-8'))
+
+
+def _verify(hashed_password, plain_password):
+    try:
+        _hasher.verify(hashed_password, plain_password.encode('utf-8'))
+        return True
+    except VerifyMismatchError:
+        return False
+    except Exception as e:
+        print(f"Erro ao verificar password com Argon2: {e}")
+        return False
+
+
+class PasswordPool:
+    """Pool de processos dedicado ao Argon2, com fila limitada.
+
+    O Argon2 ocupa CPU e 64MiB por operação; corrê-lo nas threads dos
+    pedidos deixava um pico de logins sem CPU para mais nada. Aqui há no
+    máximo ``workers`` operações em paralelo e ``queue_size`` à espera;
+    para lá disso ``acquire`` espera ``queue_timeout`` segundos e depois
+    lança ``PasswordPoolBusy``. Com ``workers=0`` corre tudo na thread
+    atual (sem processos).
+
+    ``mode`` escolhe onde corre o Argon2: ``process`` (pool de processos),
+    ``thread`` (threads; o argon2-cffi liberta o GIL) ou ``gevent`` (pool
+    de threads nativas do gevent, para não bloquear o event loop dos
+    workers cooperativos).
+
+    Os processos do pool nascem de um forkserver, não de um fork do worker:
+    o pool é criado no primeiro uso, num worker que já tem threads, e um
+    fork nesse estado pode herdar um lock preso e bloquear. Se um processo
+    do pool morrer (ex.: OOM) o pedido recebe ``PasswordPoolBusy``, como
+    com a fila cheia, e o pedido seguinte cria um pool novo.
+    """
+
+    def __init__(self, workers=2, queue_size=8, queue_timeout=2.0, mode='process'):
+        self.workers = workers
+        self.mode = mode
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max(1, workers) + queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {'submitted': 0, 'rejected': 0, 'in_flight': 0, 'restarts': 0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.mode == 'gevent':
+                    from gevent.threadpool import ThreadPool
+                    self._executor = ThreadPool(self.workers)
+                elif self.mode == 'thread':
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='argon2')
+                else:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                         mp_context=multiprocessing.get_context('forkserver'))
+            return self._executor
+
+    def _count(self, key, delta=1):
+        with self._lock:
+            self._stats[key] += delta
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('rejected')
+            raise PasswordPoolBusy(f"Fila de hashing cheia ({self.queue_size} pedidos à espera)")
+        self._count('submitted')
+        self._count('in_flight')
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            if self.mode == 'gevent':
+                return self._get_executor().apply(fn, args)
+            executor = self._get_executor()
+            try:
+                return executor.submit(fn, *args).result()
+            except BrokenProcessPool as e:
+                # um worker morreu (ex.: OOM); o próximo pedido cria um pool novo
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                        self._stats['restarts'] += 1
+                executor.shutdown(wait=False)
+                raise PasswordPoolBusy("Pool de hashing reiniciado (um processo terminou)") from e
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+
+    def hash(self, plain_password):
+        return self._run(_hash, plain_password)
+
+    def verify(self, hashed_password, plain_password):
+        return self._run(_verify, hashed_password, plain_password)
+
+    def reset(self):
+        """Esquece o pool de processos herdado num fork; o filho cria o seu no primeiro uso."""
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({'workers': self.workers, 'queue_size': self.queue_size, 'mode': self.mode})
+        return stats
+
+
+def password_pool_from_env():
+    """Cria o pool com a configuração PASSWORD_POOL_* (workers, fila, espera máxima, modo)."""
+    workers = int(os.environ.get("PASSWORD_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+    return PasswordPool(
+        workers=workers,
+        queue_size=int(os.environ.get("PASSWORD_POOL_QUEUE", max(1, workers) * 4)),
+        queue_timeout=float(os.environ.get("PASSWORD_POOL_QUEUE_TIMEOUT", 2)),
+        mode=os.environ.get("PASSWORD_POOL_MODE", "process"),
+    )
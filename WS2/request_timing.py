@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+from spyne.protocol.soap import Soap11
+
+# Modo de validação do SOAP recebido: lxml (XSD completo), soft (tipos e
+# restrições durante a desserialização) ou none (só para redes de confiança).
+VALIDATION_MODES = {'lxml': 'lxml', 'soft': 'soft', 'none': None}
+
+TIMING_ENABLED = os.environ.get("REQUEST_TIMING", "1") == "1"
+TIMING_LOG = os.environ.get("REQUEST_TIMING_LOG", "0") == "1"
+
+
+def soap_validator_from_env():
+    """Validador para o Soap11 de entrada, lido de SOAP_VALIDATION (por omissão lxml)."""
+    mode = os.environ.get("SOAP_VALIDATION", "lxml").lower()
+    if mode not in VALIDATION_MODES:
+        print(f"SOAP_VALIDATION inválido ({mode}); a usar 'lxml'.")
+        mode = 'lxml'
+    return VALIDATION_MODES[mode]
+
+
+class TimedSoap11(Soap11):
+    """Soap11 que mede o tempo gasto na validação do corpo do pedido.
+
+    O esquema XSD é compilado uma vez, quando a Application é criada, e
+    reutilizado em todos os pedidos.
+    """
+
+    def validate_body(self, ctx, message):
+        started = time.perf_counter()
+        try:
+            super().validate_body(ctx, message)
+        finally:
+            if isinstance(ctx.udc, _Timing):
+                ctx.udc.validate = (ctx.udc.validate or 0.0) + time.perf_counter() - started
+
+
+class _Timing:
+    __slots__ = ('marks', 'validate')
+
+    def __init__(self):
+        self.marks = {'start': time.perf_counter()}
+        self.validate = None  # só o TimedSoap11 mede a validação
+
+    def mark(self, name):
+        self.marks[name] = time.perf_counter()
+
+    def phases(self):
+        """Duração (ms) de cada fase já terminada."""
+        m = self.marks
+        spans = {
+            'parse': ('start', 'before_deserialize'),
+            'deserialize': ('before_deserialize', 'after_deserialize'),
+            'method': ('method_call', 'method_return'),
+            'serialize': ('before_serialize', 'after_serialize'),
+        }
+        phases = {}
+        for phase, (begin, end) in spans.items():
+            if begin in m and end in m:
+                phases[phase] = (m[end] - m[begin]) * 1000
+        if 'parse' in phases and self.validate is not None:
+            # a validação acontece durante o parse do envelope
+            phases['validate'] = self.validate * 1000
+            phases['parse'] -= phases['validate']
+        phases['total'] = (time.perf_counter() - m['start']) * 1000
+        return phases
+
+
+class RequestTiming:
+    """Tempo por fase de cada pedido Spyne: parse, validação, desserialização,
+    execução do método e serialização.
+
+    Cada resposta leva um cabeçalho ``Server-Timing`` e os tempos são
+    agregados por operação em ``stats()``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def install(self, wsgi_app, label):
+        """Mede os pedidos de ``wsgi_app``; ``label`` (ex.: soap, json) separa as estatísticas."""
+        if not TIMING_ENABLED: return
+        app = wsgi_app.app
+        wsgi_app.event_manager.add_listener('wsgi_call', self._on_call)
+        wsgi_app.event_manager.add_listener('wsgi_return', lambda ctx: self._on_return(ctx, label))
+        for event in ('before_deserialize', 'after_deserialize'):
+            app.in_protocol.event_manager.add_listener(event, self._marker(event))
+        for event in ('before_serialize', 'after_serialize'):
+            app.out_protocol.event_manager.add_listener(event, self._marker(event))
+        app.event_manager.add_listener('method_call', self._marker('method_call'))
+        app.event_manager.add_listener('method_return_object', self._marker('method_return'))
+
+    @staticmethod
+    def _on_call(ctx):
+        ctx.udc = _Timing()
+
+    @staticmethod
+    def _marker(name):
+        def mark(ctx):
+            if isinstance(ctx.udc, _Timing):
+                ctx.udc.mark(name)
+        return mark
+
+    def _on_return(self, ctx, label):
+        if not isinstance(ctx.udc, _Timing): return
+        phases = ctx.udc.phases()
+        ctx.transport.resp_headers['Server-Timing'] = ", ".join(
+            f"{phase};dur={duration:.2f}" for phase, duration in phases.items())
+        operation = ctx.descriptor.name if ctx.descriptor else ctx.method_request_string
+        self._record(label, operation, phases)
+        if TIMING_LOG:
+            print(f"{label} {operation}: " + " ".join(f"{phase}={duration:.2f}ms" for phase, duration in phases.items()))
+
+    def _record(self, label, operation, phases):
+        with self._lock:
+            entry = self._stats.setdefault(label, {}).setdefault(operation, {'count': 0, 'total_ms': {}})
+            entry['count'] += 1
+            for phase, duration in phases.items():
+                entry['total_ms'][phase] = entry['total_ms'].get(phase, 0.0) + duration
+
+    def stats(self):
+        """Média (ms) de cada fase, por protocolo e operação."""
+        with self._lock:
+            return {
+                label: {
+                    operation: {
+                        'count': entry['count'],
+                        'avg_ms': {phase: total / entry['count'] for phase, total in entry['total_ms'].items()},
+                    }
+                    for operation, entry in operations.items()
+                }
+                for label, operations in self._stats.items()
+            }
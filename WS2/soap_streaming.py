@@ -0,0 +1,72 @@
+import os
+from io import BytesIO
+from itertools import chain
+
+from lxml import etree
+from spyne import Fault
+from spyne.protocol.soap import Soap11
+
+# Com SOAP_STREAMING=1 as operações em massa serializam as linhas à medida que
+# saem do cursor MySQL, em vez de montar a lista, os objetos e a árvore XML.
+STREAMING_ENABLED = os.environ.get("SOAP_STREAMING", "0") == "1"
+FLUSH_EVERY = int(os.environ.get("SOAP_STREAMING_FLUSH_ROWS", 200))
+
+
+def _result_element(ctx):
+    """Nome do elemento de resultado e classe dos itens do Iterable devolvido."""
+    out_message = ctx.descriptor.out_message
+    result_name, result_cls = next(iter(out_message._type_info.items()))
+    item_name, item_cls = next(iter(result_cls._type_info.items()))
+    return out_message, result_name, item_name, item_cls
+
+
+def _serialize(ctx, rows):
+    """Gera o envelope SOAP em blocos de bytes, ``FLUSH_EVERY`` linhas de cada vez."""
+    protocol = ctx.out_protocol
+    out_message, result_name, item_name, item_cls = _result_element(ctx)
+    tns = out_message.get_namespace()
+    soap_env = protocol.ns_soap_env
+    interface = ctx.app.interface
+    item_ns = item_cls.get_namespace()
+    nsmap = {interface.get_namespace_prefix(ns): ns for ns in (soap_env, tns, item_ns)}
+    item_nsmap = {interface.get_namespace_prefix(item_ns): item_ns}
+    # o Iterable guarda uma cópia "customizada" da classe; instanciamos a original
+    make_item = item_cls.__orig__ or item_cls
+    buf = BytesIO()
+
+    with etree.xmlfile(buf, encoding='UTF-8') as xf:
+        xf.write_declaration()
+        with xf.element('{%s}Envelope' % soap_env, nsmap=nsmap):
+            with xf.element('{%s}Body' % soap_env):
+                with xf.element('{%s}%s' % (tns, out_message.get_type_name())):
+                    with xf.element('{%s}%s' % (tns, result_name)):
+                        for count, row in enumerate(rows, 1):
+                            holder = etree.Element('holder', nsmap=item_nsmap)
+                            protocol.to_parent(ctx, item_cls, make_item(**row), holder, item_ns, item_name)
+                            xf.write(holder[0])
+                            if count % FLUSH_EVERY == 0:
+                                xf.flush()
+                                yield buf.getvalue()
+                                buf.seek(0)
+                                buf.truncate()
+    yield buf.getvalue()
+
+
+def stream_response(ctx, rows):
+    """Envia ``rows`` (dicts) diretamente como resposta SOAP da operação atual.
+
+    Devolve False se o protocolo de saída não for SOAP (o chamador responde
+    normalmente). A primeira linha é lida já aqui para que uma falha na base
+    de dados ainda resulte num Fault e não numa resposta 200 truncada.
+    """
+    if not isinstance(ctx.out_protocol, Soap11):
+        return False
+    rows = iter(rows)
+    try:
+        first = next(rows, None)
+    except Exception as e:
+        raise Fault(faultcode='Server', faultstring=f'Database error: {e}')
+    if first is not None:
+        rows = chain((first,), rows)
+    ctx.out_string = _serialize(ctx, rows)
+    return True
@@ -0,0 +1,224 @@
+"""Arquivo do histórico de rastreio dos pacotes entregues.
+
+tracking_info guarda só o histórico "ativo". Quando um pacote chega ao
+destino (current_city = destination_city) e não tem movimento há
+TRACKING_ARCHIVE_AFTER_DAYS dias, o ``TrackingArchiver`` (no WS2) move o
+seu histórico para uma única linha de tracking_archive: as entradas em JSON
+comprimido com zlib. ``archived_history`` lê essa linha e o checkStatus
+junta-a às entradas ativas, por isso quem consulta não precisa de saber
+onde está cada entrada (uma entrada que chegue depois do arquivo fica em
+tracking_info e é junta ao arquivo quando o pacote voltar a estar parado
+há TRACKING_ARCHIVE_AFTER_DAYS dias: logo na passagem seguinte, se a
+hora da entrada for antiga).
+
+WS1 e WS2 têm cópias iguais deste ficheiro.
+"""
+import json
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from mysql.connector import Error
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get("TRACKING_ARCHIVE_AFTER_DAYS", 30))
+ARCHIVE_BATCH = int(os.environ.get("TRACKING_ARCHIVE_BATCH", 500))
+ARCHIVE_INTERVAL = float(os.environ.get("TRACKING_ARCHIVE_INTERVAL", 600))
+ARCHIVE_MAX_PER_RUN = int(os.environ.get("TRACKING_ARCHIVE_MAX_PER_RUN", 50000))
+# IDs de packages examinados por query de candidatos
+ARCHIVE_SCAN = int(os.environ.get("TRACKING_ARCHIVE_SCAN", 5000))
+
+ARCHIVE_LOCK = 'tracking_archive_job'
+
+# Candidatos num intervalo de IDs: range na chave primária de packages e,
+# para os que passam o filtro, uma procura no índice (package_id, timestamp)
+# de tracking_info. last_update é a hora da entrada mais recente do pacote.
+CANDIDATES_QUERY = """
+    SELECT p.id FROM packages p
+    WHERE p.id > %s AND p.id <= %s
+      AND p.is_tracked = TRUE AND p.current_city = p.destination_city
+      AND p.last_update < NOW() - INTERVAL %s DAY
+      AND EXISTS (SELECT 1 FROM tracking_info t WHERE t.package_id = p.id)
+    ORDER BY p.id
+"""
+
+
+def encode_history(entries):
+    """Comprime [(city, timestamp)] (datetime ou ISO) para guardar em tracking_archive.history."""
+    payload = [[city, ts.isoformat() if isinstance(ts, datetime) else ts] for city, ts in entries]
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_history(blob):
+    """Inverso de ``encode_history``: [(city, timestamp ISO)] por ordem cronológica."""
+    return [(city, ts) for city, ts in json.loads(zlib.decompress(blob).decode('utf-8'))]
+
+
+def archived_history(cursor, package_id):
+    """Entradas arquivadas de um pacote, como as do histórico ativo ({city, timestamp ISO})."""
+    cursor.execute("SELECT history FROM tracking_archive WHERE package_id = %s", (package_id,))
+    row = cursor.fetchone()
+    if not row: return []
+    blob = row['history'] if isinstance(row, dict) else row[0]
+    return [{'city': city, 'timestamp': ts} for city, ts in decode_history(blob)]
+
+
+class TrackingArchiver:
+    """Job periódico que arquiva o histórico dos pacotes entregues, ``batch`` pacotes por transação.
+
+    Cada passagem percorre packages por intervalos de ``scan`` IDs (chave
+    primária, sem watermark entre passagens) e escolhe os pacotes entregues
+    sem movimento há ``after_days`` dias que ainda têm entradas ativas
+    (CANDIDATES_QUERY): uma entrada que chegue a um pacote já arquivado
+    torna-o candidato outra vez. Nenhuma query lê tracking_info inteiro.
+    Com vários workers só um corre de cada vez (GET_LOCK do MySQL).
+    """
+
+    def __init__(self, get_connection, after_days=ARCHIVE_AFTER_DAYS, batch=ARCHIVE_BATCH,
+                 interval=ARCHIVE_INTERVAL, max_per_run=ARCHIVE_MAX_PER_RUN, scan=ARCHIVE_SCAN):
+        self._get_connection = get_connection
+        self.after_days = after_days
+        self.batch = batch
+        self.interval = interval
+        self.max_per_run = max_per_run
+        self.scan = scan
+        self.reset()
+
+    def reset(self):
+        """Depois de um fork a thread do pai não existe no filho."""
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {'runs': 0, 'skipped': 0, 'failures': 0, 'packages_archived': 0,
+                       'entries_archived': 0, 'bytes_written': 0, 'last_run': None}
+
+    def ensure_started(self):
+        if self._thread is not None or self.after_days <= 0 or self.interval <= 0: return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='tracking-archiver', daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Uma passagem completa; devolve o número de pacotes arquivados (None se não correu)."""
+        conn = self._get_connection()
+        if conn is None:
+            self._count('failures')
+            return None
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (ARCHIVE_LOCK,))
+            if cursor.fetchone()[0] != 1:
+                self._count('skipped')
+                return None
+            try:
+                archived = self._run()
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (ARCHIVE_LOCK,))
+                cursor.fetchone()
+        except Error as e:
+            print(f"Erro no job de arquivo do rastreio: {e}")
+            self._count('failures')
+            return None
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['last_run'] = time.time()
+        return archived
+
+    def _run(self):
+        archived = 0
+        max_id = self._max_package_id()
+        for after_id in range(0, max_id, self.scan):
+            candidates = self._candidates(after_id, after_id + self.scan)
+            for start in range(0, len(candidates), self.batch):
+                if archived >= self.max_per_run: return archived
+                chunk = candidates[start:start + self.batch]
+                if not self._archive(chunk):
+                    return archived
+                archived += len(chunk)
+        return archived
+
+    def _query(self, query, params=()):
+        conn = self._get_connection()
+        if conn is None: raise Error(msg="Sem conexão à base de dados")
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def _max_package_id(self):
+        return self._query("SELECT COALESCE(MAX(id), 0) FROM packages")[0][0]
+
+    def _candidates(self, after_id, last_id):
+        """Pacotes com id em ]after_id, last_id] prontos a arquivar, por ordem de id."""
+        return [row[0] for row in self._query(CANDIDATES_QUERY, (after_id, last_id, self.after_days))]
+
+    def _archive(self, package_ids):
+        """Move o histórico ativo dos pacotes para tracking_archive numa só transação."""
+        conn = self._get_connection()
+        if conn is None: return False
+        cursor = conn.cursor()
+        placeholders = ", ".join(["%s"] * len(package_ids))
+        try:
+            cursor.execute(f"""
+                SELECT package_id, city, timestamp FROM tracking_info
+                WHERE package_id IN ({placeholders})
+                ORDER BY package_id, timestamp, id
+                FOR UPDATE
+            """, package_ids)
+            histories = {}
+            for package_id, city, timestamp in cursor.fetchall():
+                histories.setdefault(package_id, []).append((city, timestamp))
+            if not histories:
+                conn.rollback()
+                return True
+            cursor.execute(f"""
+                SELECT package_id, history FROM tracking_archive
+                WHERE package_id IN ({placeholders}) FOR UPDATE
+            """, package_ids)
+            previous = {package_id: decode_history(blob) for package_id, blob in cursor.fetchall()}
+
+            rows = []
+            for package_id, entries in sorted(histories.items()):
+                entries = [(city, ts.isoformat() if isinstance(ts, datetime) else ts) for city, ts in entries]
+                merged = sorted(previous.get(package_id, []) + entries, key=lambda entry: entry[1])
+                rows.append((package_id, encode_history(merged), len(merged)))
+            cursor.executemany("""
+                INSERT INTO tracking_archive (package_id, history, entries) VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE history = VALUES(history), entries = VALUES(entries),
+                                        archived_at = CURRENT_TIMESTAMP
+            """, rows)
+            cursor.execute(f"DELETE FROM tracking_info WHERE package_id IN ({placeholders})", package_ids)
+            conn.commit()
+        except Error as e:
+            print(f"Erro ao arquivar histórico de rastreio: {e}")
+            conn.rollback()
+            self._count('failures')
+            return False
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+        with self._lock:
+            self._stats['packages_archived'] += len(rows)
+            self._stats['entries_archived'] += sum(len(entries) for entries in histories.values())
+            self._stats['bytes_written'] += sum(len(blob) for _, blob, _ in rows)
+        return True
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,122 @@
+"""Diretório de utilizadores em memória para a pesquisa por prefixo (searchUsers).
+
+Os nomes ficam numa lista ordenada (sem distinguir maiúsculas, como a
+colação da coluna); uma pesquisa é uma bisseção seguida de ``limit``
+elementos, sem ir à base de dados. Os registos são feitos no WS1, por isso
+o diretório vai buscar os utilizadores novos (``id`` acima do maior já
+visto) quando passam USER_DIRECTORY_TTL segundos desde a última
+atualização, e recarrega tudo a cada USER_DIRECTORY_RELOAD segundos
+(apanha utilizadores apagados ou renomeados diretamente na BD).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+from mysql.connector import Error
+
+DIRECTORY_TTL = float(os.environ.get("USER_DIRECTORY_TTL", 30))
+DIRECTORY_RELOAD = float(os.environ.get("USER_DIRECTORY_RELOAD", 3600))
+
+
+class UserDirectory:
+    """Índice ordenado (username em minúsculas, username, id), thread-safe."""
+
+    def __init__(self, get_connection, ttl=DIRECTORY_TTL, reload_interval=DIRECTORY_RELOAD):
+        self._get_connection = get_connection
+        self.ttl = ttl
+        self.reload_interval = reload_interval
+        self.reset()
+
+    def reset(self):
+        """Depois de um fork cada worker recomeça (o lock pode ter ficado preso no pai)."""
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._entries = []  # [(username.lower(), username, id)], ordenada
+        self._max_id = 0
+        self._loaded_at = None
+        self._refreshed_at = 0.0
+        self._stats = {'searches': 0, 'reloads': 0, 'refreshes': 0, 'added': 0, 'failures': 0}
+
+    def search(self, prefix, limit):
+        """Até ``limit`` utilizadores cujo nome começa por ``prefix``, por ordem alfabética.
+
+        Devolve None se o diretório não pôde ser carregado.
+        """
+        self._maybe_refresh()
+        key = (prefix or "").lower()
+        with self._lock:
+            self._stats['searches'] += 1
+            if self._loaded_at is None: return None
+            entries = self._entries
+            matches = []
+            for i in range(bisect_left(entries, (key,)), len(entries)):
+                lowered, username, user_id = entries[i]
+                if not lowered.startswith(key) or len(matches) >= limit: break
+                matches.append({'id': user_id, 'username': username})
+        return matches
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._refreshed_at < self.ttl: return
+        # Só um pedido atualiza; os outros usam o índice que já existe
+        if not self._refresh_lock.acquire(blocking=self._loaded_at is None): return
+        try:
+            if self._loaded_at is not None and time.monotonic() - self._refreshed_at < self.ttl: return
+            if self._loaded_at is None or now - self._loaded_at >= self.reload_interval:
+                self._reload()
+            else:
+                self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def _fetch(self, after_id):
+        conn = self._get_connection()
+        if conn is None: raise Error(msg="Sem conexão à base de dados")
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT id, username FROM users WHERE id > %s ORDER BY id", (after_id,))
+            return cursor.fetchall()
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def _reload(self):
+        try:
+            rows = self._fetch(0)
+        except Error as e:
+            print(f"Erro ao carregar o diretório de utilizadores: {e}")
+            with self._lock:
+                self._stats['failures'] += 1
+                if self._loaded_at is not None: self._refreshed_at = time.monotonic()
+            return
+        entries = sorted((username.lower(), username, user_id) for user_id, username in rows)
+        now = time.monotonic()
+        with self._lock:
+            self._entries = entries
+            self._max_id = max((user_id for user_id, _ in rows), default=0)
+            self._loaded_at = self._refreshed_at = now
+            self._stats['reloads'] += 1
+
+    def _refresh(self):
+        try:
+            rows = self._fetch(self._max_id)
+        except Error as e:
+            print(f"Erro ao atualizar o diretório de utilizadores: {e}")
+            with self._lock: self._stats['failures'] += 1
+            rows = []
+        with self._lock:
+            for user_id, username in rows:
+                insort(self._entries, (username.lower(), username, user_id))
+                self._max_id = max(self._max_id, user_id)
+            # Também em caso de erro: volta a tentar só depois do TTL
+            self._refreshed_at = time.monotonic()
+            self._stats['refreshes'] += 1
+            self._stats['added'] += len(rows)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+            stats['max_id'] = self._max_id
+        return stats
@@ -0,0 +1,423 @@
+"""Write-behind das entradas de rastreio (updatePackageStatus).
+
+Com TRACKING_WRITE_BEHIND=1 cada evento deixa de ser uma transação no
+MySQL: é acrescentado a um journal local (append-only, com fsync em grupo)
+e uma thread grava os eventos pendentes em lotes, quando há
+TRACKING_FLUSH_BATCH eventos ou passou TRACKING_FLUSH_INTERVAL segundos.
+
+Cada processo escreve o seu journal em TRACKING_JOURNAL_DIR e mantém-no
+bloqueado (flock) enquanto está vivo. Um journal sem lock é de um processo
+que morreu e é reposto no arranque. Cada lote atualiza, na mesma transação,
+a última sequência gravada desse journal (tracking_journal_checkpoints),
+por isso a reposição nunca grava um evento duas vezes.
+
+Um lote que o MySQL rejeita pelos dados (ex.: cidade demasiado longa) é
+partido ao meio até isolar as linhas culpadas, que são descartadas (com o
+checkpoint a avançar por cima delas); só as falhas da base de dados
+(ligação, lock, ...) fazem repetir o lote.
+"""
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from mysql.connector import DataError, Error, IntegrityError
+
+JOURNAL_SUFFIX = '.journal'
+
+
+class WriteBehindFull(Exception):
+    """Demasiados eventos por gravar (MySQL em baixo ou lento): o pedido é recusado."""
+
+
+class _RejectedBatch(Exception):
+    """O MySQL (ou o insert_fn) rejeitou os dados do lote: repetir não adianta."""
+
+
+class _Journal:
+    """Ficheiro append-only de um processo, bloqueado com flock enquanto aberto."""
+
+    def __init__(self, directory):
+        self.journal_id = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self.path = os.path.join(directory, self.journal_id + JOURNAL_SUFFIX)
+        # bloqueia antes de dar o nome final, para a reposição nunca apanhar um journal novo
+        tmp_path = self.path + '.tmp'
+        self.fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.rename(tmp_path, self.path)
+        self.size = 0
+
+    def append(self, entry):
+        line = (json.dumps(entry) + "\n").encode('utf-8')
+        os.write(self.fd, line)
+        self.size += len(line)
+
+    def close(self):
+        os.close(self.fd)  # liberta o lock
+
+
+def _read_journal(path):
+    """Eventos de um journal; uma última linha incompleta (queda a meio da escrita) é ignorada."""
+    entries = []
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+    return entries
+
+
+class WriteBehindBuffer:
+    """Journal local + gravação em lotes no MySQL.
+
+    ``insert_fn(cursor, rows)`` insere uma lista de (package_id, city,
+    datetime) sem fazer commit e devolve, pela mesma ordem, uma lista de
+    erros (None = inserido); os eventos rejeitados (ex.: pacote que deixou
+    de ser rastreado) são descartados e contados em ``dropped``.
+    """
+
+    def __init__(self, directory, get_connection, insert_fn, batch_size=500, flush_interval=0.05,
+                 fsync=True, max_pending=100000, max_journal_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self._get_connection = get_connection
+        self._insert_fn = insert_fn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_pending = max_pending
+        self.max_journal_bytes = max_journal_bytes
+        self.reset()
+
+    def reset(self):
+        """Estado novo (também usado depois de um fork: o journal e a thread do pai não passam)."""
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._sync_lock = threading.Lock()
+        self._journal = None
+        self._thread = None
+        self._stopping = False
+        self._urgent_seq = 0        # há quem espere pela gravação até esta sequência
+        self._pending = []          # [(seq, package_id, city, datetime)]
+        self._next_seq = 1
+        self._synced_seq = 0
+        self._flushed_seq = 0
+        self._results = {}          # seq -> erro, só para quem espera pela gravação
+        self._stats = {'accepted': 0, 'flushed': 0, 'dropped': 0, 'batches': 0,
+                       'flush_errors': 0, 'rejected': 0, 'replayed': 0, 'fsyncs': 0}
+
+    # --- Escrita ---
+
+    def submit(self, package_id, city, time_obj, wait=False, timeout=None):
+        """Aceita um evento; devolve None se ficou no journal (ou gravado, com ``wait``).
+
+        Com ``wait=True`` espera que o lote do evento chegue ao MySQL e
+        devolve o erro dessa gravação (None = inserido), ou uma mensagem se
+        o prazo ``timeout`` passar antes disso.
+        """
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise WriteBehindFull(f"{len(self._pending)} eventos de rastreio por gravar")
+            self._start()
+            seq = self._next_seq
+            self._next_seq += 1
+            self._journal.append({'seq': seq, 'package_id': package_id, 'city': city,
+                                  'time': time_obj.isoformat()})
+            self._pending.append((seq, package_id, city, time_obj))
+            self._stats['accepted'] += 1
+            if wait:
+                self._results[seq] = None
+                self._urgent_seq = max(self._urgent_seq, seq)
+            if wait or len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        if self.fsync:
+            self._sync(seq)
+        if not wait:
+            return None
+        return self._wait(seq, timeout)
+
+    def _sync(self, seq):
+        # fsync em grupo: quem chega enquanto outro sincroniza aproveita o fsync seguinte
+        with self._sync_lock:
+            if self._synced_seq >= seq: return
+            with self._lock:
+                target = self._next_seq - 1
+                fd = self._journal.fd
+            os.fsync(fd)
+            self._synced_seq = target
+            self._stats['fsyncs'] += 1
+
+    def _wait(self, seq, timeout):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._flushed_seq < seq:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._results.pop(seq, None)
+                    return "Tracking update accepted but not yet written to the database."
+                self._cond.wait(remaining)
+            return self._results.pop(seq, None)
+
+    def flush(self, timeout=None):
+        """Barreira: espera que tudo o que foi aceite até agora esteja no MySQL. Devolve True se ficou."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            target = self._next_seq - 1
+            self._urgent_seq = max(self._urgent_seq, target)
+            self._cond.notify_all()
+            while self._flushed_seq < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                if self._thread is None: return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=10):
+        """Grava o que falta e pára a thread (fim de um worker); o que não couber no prazo fica no journal."""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._sync_lock, self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                if flushed and not self._pending:
+                    self._discard(self._journal.journal_id, self._journal.path)
+                self._journal = None
+                self._thread = None
+
+    # --- Gravação no MySQL ---
+
+    def _start(self):
+        # chamado com o lock; o primeiro evento do processo cria o journal e a thread
+        if self._thread is not None: return
+        os.makedirs(self.directory, exist_ok=True)
+        self._journal = _Journal(self.directory)
+        self._thread = threading.Thread(target=self._run, name='tracking-write-behind', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.recover()
+        except Exception as e:
+            print(f"Erro ao repor os journals do write-behind: {type(e).__name__} - {e}")
+        retry_delay = self.flush_interval
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if not self._pending: return
+                urgent = self._pending[0][0] <= self._urgent_seq
+                if len(self._pending) < self.batch_size and not urgent and not self._stopping:
+                    # junta mais eventos até encher o lote ou passar o intervalo
+                    self._cond.wait(self.flush_interval)
+                batch = self._pending[:self.batch_size]
+                journal_id = self._journal.journal_id
+
+            # Nada pode matar a thread: sem ela os eventos ficam pendentes para sempre
+            try:
+                errors = self._write(journal_id, batch) or []
+                if errors:
+                    self._done(batch[:len(errors)], errors)
+                if len(errors) == len(batch):
+                    retry_delay = self.flush_interval
+                    if not self._pending and self._journal.size > self.max_journal_bytes:
+                        self._rotate()
+                    continue
+            except Exception as e:
+                print(f"Erro inesperado no write-behind: {type(e).__name__} - {e}")
+            with self._cond:
+                self._stats['flush_errors'] += 1
+                if self._stopping: return
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 5.0)
+
+    def _done(self, batch, errors):
+        """Tira do pendente os eventos gravados (ou descartados) e acorda quem espera por eles."""
+        with self._cond:
+            del self._pending[:len(batch)]
+            self._flushed_seq = batch[-1][0]
+            for (seq, package_id, _, _), error in zip(batch, errors):
+                if seq in self._results:
+                    self._results[seq] = error
+                if error is not None:
+                    print(f"Write-behind: evento {seq} do pacote {package_id} descartado: {error}")
+            dropped = sum(1 for error in errors if error is not None)
+            self._stats['batches'] += 1
+            self._stats['flushed'] += len(batch) - dropped
+            self._stats['dropped'] += dropped
+            self._cond.notify_all()
+
+    def _write(self, journal_id, batch):
+        """Grava o lote; devolve os erros de um prefixo do lote (o que ficou gravado), ou None.
+
+        Se o lote é rejeitado pelos dados, grava cada metade à parte até
+        isolar os eventos rejeitados, que ficam com o erro e não são
+        inseridos. Um prefixo mais curto que o lote (ou None) quer dizer
+        que a base de dados falhou a meio: o resto fica para repetir.
+        """
+        try:
+            return self._write_once(journal_id, batch)
+        except _RejectedBatch as e:
+            if len(batch) == 1:
+                # só o checkpoint: o evento não volta a ser tentado, nem na reposição
+                if self._write_once(journal_id, batch, insert=False) is None: return None
+                return [f"Invalid data: {e}"]
+            middle = len(batch) // 2
+            first = self._write(journal_id, batch[:middle])
+            if first is None or len(first) < middle: return first
+            return first + (self._write(journal_id, batch[middle:]) or [])
+
+    def _write_once(self, journal_id, batch, insert=True):
+        """Um lote numa transação, com o checkpoint do journal. Devolve os erros, ou None se falhou."""
+        conn = self._get_connection()
+        if conn is None: return None
+        cursor = conn.cursor()
+        try:
+            errors = [None] * len(batch)
+            if insert:
+                errors = self._insert_fn(cursor, [(package_id, city, time_obj)
+                                                  for _, package_id, city, time_obj in batch])
+            cursor.execute("""
+                INSERT INTO tracking_journal_checkpoints (journal_id, last_seq) VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE last_seq = VALUES(last_seq)
+            """, (journal_id, batch[-1][0]))
+            conn.commit()
+            return errors
+        except (DataError, IntegrityError, TypeError, ValueError) as e:
+            conn.rollback()
+            raise _RejectedBatch(f"{type(e).__name__} - {e}")
+        except Exception as e:
+            print(f"Erro ao gravar lote do write-behind: {type(e).__name__} - {e}")
+            conn.rollback()
+            return None
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def _rotate(self):
+        """Troca por um journal vazio quando o atual já foi todo gravado e cresceu demasiado."""
+        with self._sync_lock, self._lock:
+            if self._pending: return
+            old = self._journal
+            self._journal = _Journal(self.directory)
+            self._synced_seq = self._next_seq - 1
+        old.close()
+        self._discard(old.journal_id, old.path)
+
+    def _discard(self, journal_id, path):
+        # o ficheiro sai primeiro: um checkpoint órfão é inofensivo, um journal sem checkpoint não
+        try:
+            os.unlink(path)
+        except OSError as e:
+            print(f"Write-behind: não foi possível apagar {path}: {e}")
+            return
+        self._forget_checkpoint(journal_id)
+
+    def _forget_checkpoint(self, journal_id):
+        conn = self._get_connection()
+        if conn is None: return
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM tracking_journal_checkpoints WHERE journal_id = %s", (journal_id,))
+            conn.commit()
+        except Error as e:
+            print(f"Erro ao apagar checkpoint do journal {journal_id}: {e}")
+            conn.rollback()
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    def _checkpoint(self, journal_id):
+        conn = self._get_connection()
+        if conn is None: return None
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT last_seq FROM tracking_journal_checkpoints WHERE journal_id = %s", (journal_id,))
+            row = cursor.fetchone()
+            return row[0] if row else 0
+        except Error as e:
+            print(f"Erro ao ler checkpoint do journal {journal_id}: {e}")
+            return None
+        finally:
+            if cursor: cursor.close()
+            if conn: conn.close()
+
+    # --- Recuperação ---
+
+    def recover(self):
+        """Repõe os journals de processos que morreram. Devolve o número de eventos gravados."""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(JOURNAL_SUFFIX)]
+        except OSError:
+            return 0
+        replayed = 0
+        for name in sorted(names):
+            path = os.path.join(self.directory, name)
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue  # outro processo já o repôs
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # journal de um processo vivo
+                if not os.path.exists(path): continue
+                count = self._replay(name[:-len(JOURNAL_SUFFIX)], path)
+                if count is None: continue
+                replayed += count
+            finally:
+                os.close(fd)
+        if replayed:
+            with self._lock:
+                self._stats['replayed'] += replayed
+            print(f"Write-behind: {replayed} eventos de rastreio repostos a partir do journal.")
+        return replayed
+
+    def _replay(self, journal_id, path):
+        last_seq = self._checkpoint(journal_id)
+        if last_seq is None: return None  # sem base de dados: fica para a próxima
+        entries = [entry for entry in _read_journal(path) if entry['seq'] > last_seq]
+        for start in range(0, len(entries), self.batch_size):
+            chunk = entries[start:start + self.batch_size]
+            batch = [(entry['seq'], entry['package_id'], entry['city'], datetime.fromisoformat(entry['time']))
+                     for entry in chunk]
+            errors = self._write(journal_id, batch) or []
+            for entry, error in zip(chunk, errors):
+                if error is not None:
+                    print(f"Write-behind: evento reposto do pacote {entry['package_id']} descartado: {error}")
+            if len(errors) < len(batch): return None
+        self._discard(journal_id, path)
+        return len(entries)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'pending': len(self._pending), 'flushed_seq': self._flushed_seq,
+                          'journal': self._journal.path if self._journal else None,
+                          'journal_bytes': self._journal.size if self._journal else 0})
+        return stats
+
+
+def write_behind_from_env(get_connection, insert_fn):
+    """Cria o buffer com a configuração TRACKING_* ou devolve None se TRACKING_WRITE_BEHIND != 1."""
+    if os.environ.get("TRACKING_WRITE_BEHIND", "0") != "1": return None
+    return WriteBehindBuffer(
+        os.environ.get("TRACKING_JOURNAL_DIR", os.path.join(tempfile.gettempdir(), "ws2_tracking_journal")),
+        get_connection, insert_fn,
+        batch_size=int(os.environ.get("TRACKING_FLUSH_BATCH", 500)),
+        flush_interval=float(os.environ.get("TRACKING_FLUSH_INTERVAL", 0.05)),
+        fsync=os.environ.get("TRACKING_JOURNAL_FSYNC", "1") == "1",
+        max_pending=int(os.environ.get("TRACKING_WRITE_BEHIND_MAX_PENDING", 100000)),
+        max_journal_bytes=int(float(os.environ.get("TRACKING_JOURNAL_MAX_MB", 64)) * 1024 * 1024),
+    )
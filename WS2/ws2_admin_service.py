@@ -1,119 +1,375 @@
-from flask import Flask 
-from spyne import Application, rpc, ServiceBase, Unicode, Integer, Boolean, Iterable, ComplexModel, Fault, DateTime
-from spyne.protocol.soap import Soap11
-from spyne.server.wsgi import WsgiApplication 
-from werkzeug.middleware.dispatcher import DispatcherMiddleware 
-import os
-from datetime import datetime
-
-
-from db_utils import (
-    db_add_package, db_remove_package, db_register_tracking,
-    db_update_package_status, db_get_all_users, db_get_all_packages
-)
-
-
-class PackageInfoAdmin(ComplexModel): 
-    _type_info = [
-        ('id', Integer),
-        ('name', Unicode),
-        ('description', Unicode),
-        ('sender_city', Unicode),
-        ('destination_city', Unicode),
-        ('is_tracked', Boolean),
-        ('sender_username', Unicode),
-        ('receiver_username', Unicode),
-        ('creation_date', Unicode), 
-    ]
-
-class UserSelectionInfo(ComplexModel): 
-     _type_info = [
-         ('id', Integer),
-         ('username', Unicode),
-     ]
-
-class AdminService(ServiceBase):
-
-    @rpc(_returns=Iterable(UserSelectionInfo))
-    def getAllUsers(ctx):
-         """Retorna lista de utilizadores para seleção."""
-         users_data = db_get_all_users()
-         return [UserSelectionInfo(**user) for user in users_data]
-
-    @rpc(_returns=Iterable(PackageInfoAdmin))
-    def getAllPackages(ctx):
-         """Retorna lista de todos os pacotes no sistema."""
-         packages_data = db_get_all_packages()
-         return [PackageInfoAdmin(**pkg) for pkg in packages_data]
-
-    @rpc(Integer, Integer, Unicode, Unicode, Unicode, Unicode, _returns=Integer)
-    def addPackage(ctx, sender_id, receiver_id, name, description, sender_city, destination_city):
-        """Adiciona um novo pacote. Retorna o ID do novo pacote ou Fault."""
-        if not all([sender_id, receiver_id, name, sender_city, destination_city]):
-            raise Fault(faultcode='Client', faultstring='Missing required package information (sender_id, receiver_id, name, sender_city, destination_city).')
-        new_id = db_add_package(sender_id, receiver_id, name, description, sender_city, destination_city)
-        if new_id is None:
-            raise Fault(faultcode='Server', faultstring='Failed to add package. Please check user IDs and database connection.')
-        return new_id
-
-    @rpc(Integer, _returns=Boolean)
-    def removePackage(ctx, package_id):
-        """Remove um pacote pelo ID."""
-        if package_id is None or package_id <= 0:
-             raise Fault(faultcode='Client', faultstring='A valid Package ID is required.')
-        success = db_remove_package(package_id)
-        if not success:
-             raise Fault(faultcode='Client', faultstring=f'Failed to remove package {package_id}. It might not exist.')
-        return success
-
-    @rpc(Integer, Unicode, DateTime, _returns=Boolean)
-    def registerPackageTracking(ctx, package_id, initial_city, initial_time):
-        """Marca um pacote como rastreado e adiciona o ponto inicial."""
-        if not all([package_id, initial_city, initial_time]):
-             raise Fault(faultcode='Client', faultstring='Package ID, initial city, and initial time (DateTime) are required.')
-        if package_id <= 0:
-             raise Fault(faultcode='Client', faultstring='Invalid Package ID.')
-
-        success = db_register_tracking(package_id, initial_city, initial_time.isoformat())
-        if not success:
-             raise Fault(faultcode='Server', faultstring=f'Failed to register tracking for package {package_id}. Package might not exist or is already tracked.')
-        return success
-
-    @rpc(Integer, Unicode, DateTime, _returns=Boolean)
-    def updatePackageStatus(ctx, package_id, city, time):
-        """Adiciona uma nova entrada de rastreamento a um pacote."""
-        if not all([package_id, city, time]):
-            raise Fault(faultcode='Client', faultstring='Package ID, city, and time (DateTime) are required.')
-        if package_id <= 0:
-             raise Fault(faultcode='Client', faultstring='Invalid Package ID.')
-
-        success = db_update_package_status(package_id, city, time.isoformat())
-        if not success:
-            raise Fault(faultcode='Server', faultstring=f'Failed to update status for package {package_id}. Package might not exist or is not tracked.')
-        return success
-
-
-flask_app = Flask(__name__) 
-
-
-spyne_app = Application([AdminService],
-    tns='sds.lab.admin.v1', 
-    in_protocol=Soap11(validator='lxml'),
-    out_protocol=Soap11()
-)
-
-
-spyne_wsgi_app = WsgiApplication(spyne_app)
-
-
-flask_app.wsgi_app = DispatcherMiddleware(flask_app.wsgi_app, {
-    '/ws2': spyne_wsgi_app
-})
-
-@flask_app.route('/health')
-def health_check():
-    return "WS2 OK", 200
-
-if __name__ == '__main__':
-    debug_mode = os.environ.get("FLASK_DEBUG", "0") == "1"
+from flask import Flask, jsonify
+from spyne import Application, rpc, ServiceBase, Unicode, Integer, Boolean, Iterable, Array, ComplexModel, Fault, DateTime
+from spyne.protocol.soap import Soap11
+from spyne.protocol.json import JsonDocument
+from spyne.protocol.msgpack import MessagePackDocument
+from spyne.server.wsgi import WsgiApplication 
+from werkzeug.middleware.dispatcher import DispatcherMiddleware 
+import os
+from datetime import datetime
+
+
+from db_utils import (
+    db_add_package, db_remove_package, db_register_tracking,
+    db_update_package_status, db_bulk_update_package_status, db_import_packages, db_get_all_users, db_get_all_packages,
+    get_pool_stats, get_replica_stats, encode_cursor, decode_cursor,
+    db_iter_all_packages, db_iter_all_users,
+    write_behind_enabled, db_queue_package_status, recover_tracking_journals, get_write_behind_stats,
+    WriteBehindFull, db_get_dashboard_stats, fill_dashboard_counters, get_dashboard_reconciler_stats,
+    get_tracking_archiver_stats, db_search_users, get_user_directory_stats
+)
+from soap_streaming import STREAMING_ENABLED, stream_response
+from migrations import apply_migrations
+from db_pool import ReadYourWrites
+from compression import CompressionMiddleware
+from request_timing import TimedSoap11, RequestTiming, soap_validator_from_env
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_BULK_UPDATES = int(os.environ.get("MAX_BULK_UPDATES", 5000))
+MAX_IMPORT_ROWS = int(os.environ.get("MAX_IMPORT_ROWS", 5000))
+DEFAULT_USER_SEARCH_LIMIT = 20
+MAX_USER_SEARCH_LIMIT = 100
+
+if os.environ.get("DB_AUTO_MIGRATE", "0") == "1":
+    apply_migrations()
+
+# Eventos de rastreio aceites antes de uma queda e ainda não gravados
+recover_tracking_journals()
+
+# Contadores do dashboard preenchidos no primeiro arranque (base de dados nova);
+# depois só o job periódico os reconcilia, não cada worker ao arrancar
+fill_dashboard_counters()
+
+
+class PackageInfoAdmin(ComplexModel): 
+    _type_info = [
+        ('id', Integer),
+        ('name', Unicode),
+        ('description', Unicode),
+        ('sender_city', Unicode),
+        ('destination_city', Unicode),
+        ('is_tracked', Boolean),
+        ('sender_username', Unicode),
+        ('receiver_username', Unicode),
+        ('creation_date', Unicode), 
+        # localização atual (última entrada de rastreio), mantida pelo WS2 em cada escrita
+        ('current_city', Unicode),
+        ('last_update', Unicode),
+        ('hop_count', Integer),
+    ]
+
+class UserSelectionInfo(ComplexModel): 
+     _type_info = [
+         ('id', Integer),
+         ('username', Unicode),
+     ]
+
+class PackageInfoAdminPage(ComplexModel):
+     _type_info = [
+         ('packages', Array(PackageInfoAdmin)),
+         ('next_cursor', Unicode),
+     ]
+
+class TrackingUpdate(ComplexModel):
+     _type_info = [
+         ('package_id', Integer),
+         ('city', Unicode),
+         ('time', DateTime),
+     ]
+
+class TrackingUpdateResult(ComplexModel):
+     _type_info = [
+         ('package_id', Integer),
+         ('success', Boolean),
+         ('error', Unicode),
+     ]
+
+class PackageImportRow(ComplexModel):
+     _type_info = [
+         ('sender_username', Unicode),
+         ('receiver_username', Unicode),
+         ('name', Unicode),
+         ('description', Unicode),
+         ('sender_city', Unicode),
+         ('destination_city', Unicode),
+     ]
+
+class PackageImportError(ComplexModel):
+     _type_info = [
+         ('row', Integer),  # posição da linha no pedido, a começar em 0
+         ('error', Unicode),
+     ]
+
+class PackageImportResult(ComplexModel):
+     _type_info = [
+         ('imported', Integer),
+         ('errors', Array(PackageImportError)),
+     ]
+
+class CountItem(ComplexModel):
+     _type_info = [
+         ('key', Unicode),   # cidade ou hora ('2024-01-01 10:00')
+         ('count', Integer),
+     ]
+
+class DashboardStats(ComplexModel):
+     _type_info = [
+         ('total_packages', Integer),
+         ('tracked', Integer),
+         ('untracked', Integer),
+         ('by_origin', Array(CountItem)),
+         ('by_destination', Array(CountItem)),
+         ('created_per_hour', Array(CountItem)),
+         ('updated_per_hour', Array(CountItem)),
+     ]
+
+class AdminService(ServiceBase):
+
+    @rpc(_returns=DashboardStats)
+    def getDashboardStats(ctx):
+         """Totais para o dashboard de administração, mantidos a cada escrita (sem ler todos os pacotes)."""
+         stats = db_get_dashboard_stats()
+         if stats is None:
+              raise Fault(faultcode='Server', faultstring='Dashboard statistics are unavailable.')
+         counts = lambda items: [CountItem(key=key, count=count) for key, count in items]
+         return DashboardStats(
+              total_packages=stats['total_packages'], tracked=stats['tracked'], untracked=stats['untracked'],
+              by_origin=counts(stats['by_origin']), by_destination=counts(stats['by_destination']),
+              created_per_hour=counts(stats['created_per_hour']),
+              updated_per_hour=counts(stats['updated_per_hour']))
+
+    @rpc(_returns=Iterable(UserSelectionInfo))
+    def getAllUsers(ctx):
+         """Retorna lista de utilizadores para seleção."""
+         if STREAMING_ENABLED:
+              rows = db_iter_all_users()
+              if stream_response(ctx, rows): return None
+              return (UserSelectionInfo(**user) for user in rows)
+         users_data = db_get_all_users()
+         return [UserSelectionInfo(**user) for user in users_data]
+
+    @rpc(Unicode, Integer, _returns=Array(UserSelectionInfo))
+    def searchUsers(ctx, prefix, limit):
+         """Utilizadores cujo nome começa por ``prefix`` (para preencher um campo à medida que se escreve)."""
+         if limit is None or limit <= 0: limit = DEFAULT_USER_SEARCH_LIMIT
+         users_data = db_search_users(prefix or "", min(limit, MAX_USER_SEARCH_LIMIT))
+         if users_data is None:
+              raise Fault(faultcode='Server', faultstring='User directory is unavailable.')
+         return [UserSelectionInfo(**user) for user in users_data]
+
+    @rpc(_returns=Iterable(PackageInfoAdmin))
+    def getAllPackages(ctx):
+         """Retorna lista de todos os pacotes no sistema."""
+         if STREAMING_ENABLED:
+              rows = db_iter_all_packages()
+              if stream_response(ctx, rows): return None
+              return (PackageInfoAdmin(**pkg) for pkg in rows)
+         packages_data = db_get_all_packages()
+         return [PackageInfoAdmin(**pkg) for pkg in packages_data]
+
+    @rpc(Integer, Unicode, _returns=PackageInfoAdminPage)
+    def getAllPackagesPage(ctx, page_size, cursor):
+         """Uma página de getAllPackages; passar next_cursor para obter a seguinte."""
+         if page_size is None or page_size <= 0: page_size = DEFAULT_PAGE_SIZE
+         page_size = min(page_size, MAX_PAGE_SIZE)
+         try:
+              after = decode_cursor(cursor) if cursor else None
+         except ValueError:
+              raise Fault(faultcode='Client', faultstring='Invalid pagination cursor.')
+
+         packages_data = db_get_all_packages(limit=page_size + 1, after=after)
+         next_cursor = None
+         if len(packages_data) > page_size:
+              packages_data = packages_data[:page_size]
+              last = packages_data[-1]
+              next_cursor = encode_cursor(last['creation_date'], last['id'])
+         return PackageInfoAdminPage(packages=[PackageInfoAdmin(**pkg) for pkg in packages_data],
+                                     next_cursor=next_cursor)
+
+    @rpc(Integer, Integer, Unicode, Unicode, Unicode, Unicode, _returns=Integer)
+    def addPackage(ctx, sender_id, receiver_id, name, description, sender_city, destination_city):
+        """Adiciona um novo pacote. Retorna o ID do novo pacote ou Fault."""
+        if not all([sender_id, receiver_id, name, sender_city, destination_city]):
+            raise Fault(faultcode='Client', faultstring='Missing required package information (sender_id, receiver_id, name, sender_city, destination_city).')
+        new_id = db_add_package(sender_id, receiver_id, name, description, sender_city, destination_city)
+        if new_id is None:
+            raise Fault(faultcode='Server', faultstring='Failed to add package. Please check user IDs and database connection.')
+        return new_id
+
+    @rpc(Integer, _returns=Boolean)
+    def removePackage(ctx, package_id):
+        """Remove um pacote pelo ID."""
+        if package_id is None or package_id <= 0:
+             raise Fault(faultcode='Client', faultstring='A valid Package ID is required.')
+        success = db_remove_package(package_id)
+        if not success:
+             raise Fault(faultcode='Client', faultstring=f'Failed to remove package {package_id}. It might not exist.')
+        return success
+
+    @rpc(Integer, Unicode, DateTime, _returns=Boolean)
+    def registerPackageTracking(ctx, package_id, initial_city, initial_time):
+        """Marca um pacote como rastreado e adiciona o ponto inicial."""
+        if not all([package_id, initial_city, initial_time]):
+             raise Fault(faultcode='Client', faultstring='Package ID, initial city, and initial time (DateTime) are required.')
+        if package_id <= 0:
+             raise Fault(faultcode='Client', faultstring='Invalid Package ID.')
+
+        success = db_register_tracking(package_id, initial_city, initial_time.isoformat())
+        if not success:
+             raise Fault(faultcode='Server', faultstring=f'Failed to register tracking for package {package_id}. Package might not exist or is already tracked.')
+        return success
+
+    @rpc(Integer, Unicode, DateTime, Boolean, _returns=Boolean)
+    def updatePackageStatus(ctx, package_id, city, time, wait):
+        """Adiciona uma nova entrada de rastreamento a um pacote.
+
+        Com o write-behind ativo a entrada é aceite assim que fica no journal
+        e gravada no MySQL no lote seguinte; ``wait=true`` espera por essa
+        gravação (para quem vai ler o histórico logo a seguir).
+        """
+        if not all([package_id, city, time]):
+            raise Fault(faultcode='Client', faultstring='Package ID, city, and time (DateTime) are required.')
+        if package_id <= 0:
+             raise Fault(faultcode='Client', faultstring='Invalid Package ID.')
+
+        if write_behind_enabled():
+            try:
+                error = db_queue_package_status(package_id, city, time.isoformat(), wait=bool(wait))
+            except WriteBehindFull:
+                raise Fault(faultcode='Server.Busy', faultstring='Too many pending tracking updates, please retry.')
+            if error is not None:
+                raise Fault(faultcode='Server', faultstring=f'Failed to update status for package {package_id}: {error}')
+            return True
+
+        success = db_update_package_status(package_id, city, time.isoformat())
+        if not success:
+            raise Fault(faultcode='Server', faultstring=f'Failed to update status for package {package_id}. Package might not exist or is not tracked.')
+        return success
+
+    @rpc(Array(TrackingUpdate), _returns=Array(TrackingUpdateResult))
+    def bulkUpdatePackageStatus(ctx, updates):
+        """Adiciona várias entradas de rastreamento numa só chamada e transação.
+
+        Devolve um resultado por entrada, pela mesma ordem; uma entrada
+        inválida não impede as restantes de serem inseridas.
+        """
+        updates = updates or []
+        if len(updates) > MAX_BULK_UPDATES:
+            raise Fault(faultcode='Client', faultstring=f'Too many updates in one call (maximum {MAX_BULK_UPDATES}).')
+
+        errors = [None] * len(updates)
+        batch, positions = [], []
+        for i, update in enumerate(updates):
+            if update is None or not all([update.package_id, update.city, update.time]):
+                errors[i] = 'Package ID, city, and time (DateTime) are required.'
+            elif update.package_id <= 0:
+                errors[i] = 'Invalid Package ID.'
+            else:
+                batch.append((update.package_id, update.city, update.time.isoformat()))
+                positions.append(i)
+
+        for i, error in zip(positions, db_bulk_update_package_status(batch)):
+            errors[i] = error
+        return [TrackingUpdateResult(package_id=update.package_id if update is not None else None,
+                                     success=error is None, error=error)
+                for update, error in zip(updates, errors)]
+
+    @rpc(Array(PackageImportRow), _returns=PackageImportResult)
+    def importPackages(ctx, rows):
+        """Importa um lote de pacotes (remetente/destinatário por username).
+
+        Pensado para ser chamado repetidamente com blocos de um ficheiro
+        grande; cada chamada é uma transação. Devolve o número de pacotes
+        inseridos e os erros das linhas rejeitadas.
+        """
+        rows = rows or []
+        if len(rows) > MAX_IMPORT_ROWS:
+            raise Fault(faultcode='Client', faultstring=f'Too many rows in one call (maximum {MAX_IMPORT_ROWS}).')
+
+        fields = list(PackageImportRow._type_info.keys())
+        errors = db_import_packages([{field: getattr(row, field, None) for field in fields} if row is not None else {}
+                                     for row in rows])
+        return PackageImportResult(
+            imported=sum(1 for error in errors if error is None),
+            errors=[PackageImportError(row=i, error=error) for i, error in enumerate(errors) if error is not None])
+
+
+flask_app = Flask(__name__) 
+
+
+spyne_app = Application([AdminService],
+    tns='sds.lab.admin.v1', 
+    in_protocol=TimedSoap11(validator=soap_validator_from_env()),
+    out_protocol=Soap11()
+)
+
+# Mesmo serviço em protocolos compactos para o tráfego interno da GUI
+# (sem envelope nem validação XML): /ws2/json e /ws2/msgpack.
+json_app = Application([AdminService],
+    tns='sds.lab.admin.v1',
+    in_protocol=JsonDocument(validator='soft'),
+    out_protocol=JsonDocument(ignore_wrappers=True)
+)
+
+msgpack_app = Application([AdminService],
+    tns='sds.lab.admin.v1',
+    in_protocol=MessagePackDocument(validator='soft'),
+    out_protocol=MessagePackDocument(ignore_wrappers=True)
+)
+
+spyne_wsgi_app = WsgiApplication(spyne_app)
+json_wsgi_app = WsgiApplication(json_app)
+msgpack_wsgi_app = WsgiApplication(msgpack_app)
+
+request_timing = RequestTiming()
+request_timing.install(spyne_wsgi_app, 'soap')
+request_timing.install(json_wsgi_app, 'json')
+request_timing.install(msgpack_wsgi_app, 'msgpack')
+
+
+flask_app.wsgi_app = DispatcherMiddleware(flask_app.wsgi_app, {
+    '/ws2': spyne_wsgi_app,
+    '/ws2/json': json_wsgi_app,
+    '/ws2/msgpack': msgpack_wsgi_app,
+})
+# Leituras logo a seguir a uma escrita da mesma sessão vão para o primário
+flask_app.wsgi_app = ReadYourWrites(flask_app.wsgi_app)
+# Respostas (e pedidos) comprimidos com gzip/deflate quando o cliente aceita
+flask_app.wsgi_app = CompressionMiddleware(flask_app.wsgi_app)
+
+@flask_app.route('/health')
+def health_check():
+    return "WS2 OK", 200
+
+@flask_app.route('/health/pool')
+def pool_stats():
+    return jsonify(get_pool_stats()), 200
+
+@flask_app.route('/health/replicas')
+def replica_stats():
+    return jsonify(get_replica_stats()), 200
+
+@flask_app.route('/health/timing')
+def timing_stats():
+    return jsonify(request_timing.stats()), 200
+
+@flask_app.route('/health/dashboard')
+def dashboard_reconciler_stats():
+    return jsonify(get_dashboard_reconciler_stats()), 200
+
+@flask_app.route('/health/archive')
+def tracking_archiver_stats():
+    return jsonify(get_tracking_archiver_stats()), 200
+
+@flask_app.route('/health/users')
+def user_directory_stats():
+    return jsonify(get_user_directory_stats()), 200
+
+@flask_app.route('/health/write-behind')
+def write_behind_stats():
+    return jsonify(get_write_behind_stats()), 200
+
+if __name__ == '__main__':
+    debug_mode = os.environ.get("FLASK_DEBUG", "0") == "1"
     flask_app.run(host='0.0.0.0', port=5002, debug=debug_mode)
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""Esquema MySQL próprio para os benchmarks que precisam de uma base de dados real.
+
+Usa o MySQL configurado (MYSQL_HOST, MYSQL_USER, ...) mas nunca a base de
+dados configurada: o esquema é MYSQL_BENCH_DATABASE (por omissão
+<MYSQL_DATABASE>_bench), criado com o db/init.sql. ``use()`` tem de ser
+chamado antes de importar o db_utils, para o pool abrir as conexões nele.
+
+    import bench_schema
+    conn = bench_schema.create()
+    bench_schema.use()
+    import db_utils
+    ...
+    bench_schema.drop(conn)
+"""
+import os
+
+import mysql.connector
+from mysql.connector import Error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGURED_DATABASE = os.environ.get("MYSQL_DATABASE")
+BENCH_DATABASE = os.environ.get("MYSQL_BENCH_DATABASE", f"{CONFIGURED_DATABASE or 'tracking_db'}_bench")
+
+
+def _init_sql():
+    """Instruções do db/init.sql, sem o CREATE DATABASE/USE."""
+    with open(os.path.join(ROOT, "db", "init.sql"), encoding="utf-8") as f:
+        lines = [line for line in f if not line.lstrip().startswith("--")]
+    statements = [statement.strip() for statement in "".join(lines).split(";")]
+    return [statement for statement in statements
+            if statement and not statement.upper().startswith(("CREATE DATABASE", "USE "))]
+
+
+def connect(database=None):
+    return mysql.connector.connect(user=os.environ.get("MYSQL_USER"), password=os.environ.get("MYSQL_PASSWORD"),
+                                   host=os.environ.get("MYSQL_HOST"), port=os.environ.get("MYSQL_PORT", 3306),
+                                   database=database)
+
+
+def create(reuse=False):
+    """Cria (ou, com ``reuse``, reabre) o esquema de benchmark; devolve uma conexão a ele."""
+    if not os.environ.get("MYSQL_HOST"):
+        raise SystemExit("este benchmark precisa do MySQL (MYSQL_HOST, MYSQL_USER, ...)")
+    if BENCH_DATABASE == CONFIGURED_DATABASE:
+        raise SystemExit("MYSQL_BENCH_DATABASE não pode ser a base de dados configurada")
+    try:
+        conn = connect(BENCH_DATABASE if reuse else None)
+    except Error as e:
+        raise SystemExit(f"sem ligação ao MySQL: {e}")
+    if reuse: return conn
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{BENCH_DATABASE}`")
+    cursor.execute(f"CREATE DATABASE `{BENCH_DATABASE}`")
+    cursor.execute(f"USE `{BENCH_DATABASE}`")
+    for statement in _init_sql():
+        cursor.execute(statement)
+    conn.commit()
+    cursor.close()
+    return conn
+
+
+def use():
+    """Aponta o db_utils (ainda por importar) para o esquema de benchmark, sem réplicas."""
+    os.environ["MYSQL_DATABASE"] = BENCH_DATABASE
+    os.environ["DB_REPLICAS"] = ""
+
+
+def insert_rows(conn, query, rows, batch_size=5000):
+    """Insere ``rows`` em lotes (o executemany de um INSERT é um só INSERT multi-linha)."""
+    cursor = conn.cursor()
+    batch, count = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            cursor.executemany(query, batch)
+            conn.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(query, batch)
+        conn.commit()
+        count += len(batch)
+    cursor.close()
+    return count
+
+
+def drop(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{BENCH_DATABASE}`")
+    cursor.close()
+    conn.close()
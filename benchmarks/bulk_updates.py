@@ -0,0 +1,109 @@
+"""Débito de updatePackageStatus (uma chamada por entrada) vs bulkUpdatePackageStatus.
+
+Chama a aplicação WSGI do WS2 diretamente (Spyne, validação e db_utils
+reais, sem a rede entre o cliente e o WS2) com ``--updates`` entradas de
+rastreio: no modo ``single`` uma chamada SOAP por entrada, no modo ``bulk``
+chamadas de ``--batch`` entradas. Por omissão o MySQL é simulado
+(simulated_mysql.py: cada ida e volta espera BENCH_DB_LATENCY segundos e
+é contada); com ``--mysql`` grava na base de dados configurada
+(MYSQL_HOST, ...), nos pacotes 1..``--packages``, que têm de existir e
+estar a ser rastreados.
+
+    python benchmarks/bulk_updates.py --updates 5000
+    BENCH_DB_LATENCY=0.002 python benchmarks/bulk_updates.py --updates 2000 --batch 500
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tns="sds.lab.admin.v1"
+ xmlns:s0="ws2_admin_service">
+<soapenv:Body>{}</soapenv:Body></soapenv:Envelope>"""
+
+_SINGLE = ("<tns:updatePackageStatus><tns:package_id>{}</tns:package_id><tns:city>{}</tns:city>"
+           "<tns:time>{}</tns:time></tns:updatePackageStatus>")
+# Os itens de TrackingUpdate estão no namespace do módulo (s0 no WSDL)
+_ITEM = ("<s0:TrackingUpdate><s0:package_id>{}</s0:package_id><s0:city>{}</s0:city>"
+         "<s0:time>{}</s0:time></s0:TrackingUpdate>")
+_CITIES = ['Lisboa', 'Porto', 'Coimbra', 'Braga', 'Faro', 'Évora', 'Leiria', 'Viseu']
+
+
+def _updates(count, packages):
+    start = datetime(2026, 1, 1, 8)
+    for i in range(count):
+        yield i % packages + 1, _CITIES[i % len(_CITIES)], (start + timedelta(seconds=i)).isoformat()
+
+
+def _call(ws2, builder, body, action):
+    environ = builder(path='/ws2', method='POST', data=_ENVELOPE.format(body).encode('utf-8'),
+                      headers={'Content-Type': 'text/xml; charset=utf-8',
+                               'SOAPAction': f'"{action}"'}).get_environ()
+    status = []
+    response = b''.join(ws2.flask_app.wsgi_app(environ, lambda s, h, exc_info=None: status.append(s)))
+    if not status[0].startswith('200') or b'Fault' in response:
+        raise SystemExit(f"{action}: {status[0]} {response[:300]!r}")
+
+
+def run(mode, updates, batch, packages):
+    import simulated_mysql
+    import ws2_admin_service as ws2
+    from werkzeug.test import EnvironBuilder
+
+    entries = list(_updates(updates, packages))
+    trips_before = simulated_mysql.round_trips
+    started = time.perf_counter()
+    calls = 0
+    if mode == 'single':
+        for package_id, city, time_str in entries:
+            _call(ws2, EnvironBuilder, _SINGLE.format(package_id, escape(city), time_str), 'updatePackageStatus')
+            calls += 1
+    else:
+        for first in range(0, len(entries), batch):
+            items = "".join(_ITEM.format(package_id, escape(city), time_str)
+                            for package_id, city, time_str in entries[first:first + batch])
+            _call(ws2, EnvironBuilder, f"<tns:bulkUpdatePackageStatus><tns:updates>{items}</tns:updates>"
+                                       "</tns:bulkUpdatePackageStatus>", 'bulkUpdatePackageStatus')
+            calls += 1
+    elapsed = time.perf_counter() - started
+    return {'mode': mode, 'calls': calls, 'seconds': elapsed, 'rate': updates / elapsed,
+            'round_trips': simulated_mysql.round_trips - trips_before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=1000, help='entradas por chamada no modo bulk')
+    parser.add_argument('--packages', type=int, default=1000, help='pacotes diferentes (IDs 1..N)')
+    parser.add_argument('--modes', nargs='+', default=['single', 'bulk'], choices=['single', 'bulk'])
+    parser.add_argument('--mysql', action='store_true', help='gravar na base de dados configurada')
+    args = parser.parse_args()
+
+    os.environ.setdefault('DASHBOARD_RECONCILE_INTERVAL', '0')
+    os.environ.setdefault('TRACKING_ARCHIVE_INTERVAL', '0')
+    os.environ['TRACKING_WRITE_BEHIND'] = '0'
+    sys.path.insert(0, os.path.join(ROOT, 'WS2'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(os.path.join(ROOT, 'WS2'))
+    import db_utils
+    import simulated_mysql
+    import ws2_admin_service  # noqa: F401 (o arranque do WS2 ainda com a conexão real)
+    if not args.mysql:
+        db_utils.get_db_connection = simulated_mysql.connect
+
+    latency = 'MySQL' if args.mysql else f'{simulated_mysql.DB_LATENCY * 1000:g} ms por ida e volta'
+    print(f"{args.updates} entradas em {args.packages} pacotes ({latency})")
+    print(f"{'modo':<8} {'chamadas':>9} {'tempo':>8} {'entradas/s':>11} {'idas à BD':>10}")
+    for mode in args.modes:
+        r = run(mode, args.updates, args.batch, args.packages)
+        trips = '-' if args.mysql else r['round_trips']
+        print(f"{r['mode']:<8} {r['calls']:>9} {r['seconds']:>7.2f}s {r['rate']:>11.0f} {trips:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Compressão das respostas SOAP do WS2: tamanho, CPU e tempo de transferência por codificação e nível.
+
+Chama a aplicação WSGI do WS2 diretamente (com o CompressionMiddleware
+real) para getAllPackagesPage (resposta com Content-Length, comprimida de
+uma vez) e getAllPackages em streaming (SOAP_STREAMING=1, comprimida bloco
+a bloco). As linhas são sintéticas mas variadas (nomes, cidades e datas
+ao acaso), para não favorecer a compressão como linhas todas iguais. Para
+cada codificação (``identity``, ``gzip``, ``deflate``) e nível
+(COMPRESSION_LEVEL) mede o corpo, o tempo do servidor por chamada (Spyne
+e compressão), só o da compressão (o corpo inteiro de uma vez), o de
+descomprimir no cliente e o tempo de transferência numa ligação de
+``--mbps`` Mbit/s. Mostra também o pedido de um bulkUpdatePackageStatus
+com ``--bulk`` entradas, que a GUI envia com gzip.
+
+    python benchmarks/compression_size.py --rows 5000 --levels 1 6 9
+    python benchmarks/compression_size.py --page-size 500 --mbps 10
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tns="sds.lab.admin.v1"
+ xmlns:s0="ws2_admin_service">
+<soapenv:Body>{}</soapenv:Body></soapenv:Envelope>"""
+_PAGE = "<tns:getAllPackagesPage><tns:page_size>{}</tns:page_size></tns:getAllPackagesPage>"
+_ALL = "<tns:getAllPackages/>"
+_ITEM = ("<s0:TrackingUpdate><s0:package_id>{}</s0:package_id><s0:city>{}</s0:city>"
+         "<s0:time>{}</s0:time></s0:TrackingUpdate>")
+_CITIES = ['Lisboa', 'Porto', 'Coimbra', 'Braga', 'Faro', 'Evora', 'Leiria', 'Viseu', 'Aveiro', 'Setubal',
+           'Guarda', 'Beja', 'Santarem', 'Tomar', 'Chaves', 'Lagos']
+_WORDS = ['caixa', 'fragil', 'livros', 'roupa', 'pecas', 'urgente', 'eletronica', 'documentos', 'vidro',
+          'amostras', 'ferramentas', 'brinquedos', 'calcado', 'cabos', 'tinteiros', 'medicamentos']
+_WBITS = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+def _rows(count):
+    rng = random.Random(7)
+    for i in range(count, 0, -1):
+        yield {'id': 200000 + i, 'name': f'{rng.choice(_WORDS).title()} {rng.randrange(10 ** 7)}',
+               'description': ' '.join(rng.choice(_WORDS) for _ in range(rng.randrange(3, 10))),
+               'sender_city': rng.choice(_CITIES), 'destination_city': rng.choice(_CITIES),
+               'is_tracked': rng.random() < 0.8, 'sender_username': f'user{rng.randrange(50000)}',
+               'receiver_username': f'user{rng.randrange(50000)}',
+               'creation_date': (f'2026-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}'
+                                 f'T{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}'),
+               'current_city': rng.choice(_CITIES),
+               'last_update': f'2026-12-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00',
+               'hop_count': rng.randrange(15)}
+
+
+def _call(ws2, builder, body, action, encoding, level):
+    headers = {'Content-Type': 'text/xml; charset=utf-8', 'SOAPAction': f'"{action}"',
+               'Accept-Encoding': encoding}
+    environ = builder(path='/ws2', method='POST', data=_ENVELOPE.format(body).encode(), headers=headers).get_environ()
+    started = time.perf_counter()
+    status = []
+    response = ws2.flask_app.wsgi_app(environ, lambda s, h, exc_info=None: status.append(s))
+    try:
+        data = b''.join(response)
+    finally:
+        if hasattr(response, 'close'): response.close()
+    server = time.perf_counter() - started
+    if not status[0].startswith('200'):
+        raise SystemExit(f"{action}: {status[0]}")
+    started = time.perf_counter()
+    plain = zlib.decompress(data, _WBITS[encoding]) if encoding in _WBITS else data
+    client = time.perf_counter() - started
+    if b'Fault' in plain[:2000]:
+        raise SystemExit(f"{action}: {plain[:300]!r}")
+    compress = 0.0
+    if encoding in _WBITS:
+        started = time.perf_counter()
+        compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+        compressor.compress(plain) + compressor.flush()
+        compress = time.perf_counter() - started
+    return len(data), len(plain), server, compress, client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000, help='pacotes no getAllPackages')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--levels', type=int, nargs='+', default=[1, 6, 9])
+    parser.add_argument('--encodings', nargs='+', default=['identity', 'gzip', 'deflate'],
+                        choices=['identity', 'gzip', 'deflate'])
+    parser.add_argument('--mbps', type=float, default=100, help='débito da ligação para o tempo de transferência')
+    parser.add_argument('--bulk', type=int, default=300, help='entradas do pedido bulkUpdatePackageStatus')
+    parser.add_argument('--repeat', type=int, default=3, help='chamadas por medição (conta a mediana)')
+    args = parser.parse_args()
+
+    os.environ['SOAP_STREAMING'] = '1'
+    os.environ.setdefault('DASHBOARD_RECONCILE_INTERVAL', '0')
+    sys.path.insert(0, os.path.join(ROOT, 'WS2'))
+    os.chdir(os.path.join(ROOT, 'WS2'))
+    import ws2_admin_service as ws2
+    from compression import CompressionMiddleware
+    from werkzeug.test import EnvironBuilder
+
+    ws2.db_get_all_packages = lambda limit=None, after=None: list(_rows(limit or args.rows))
+    ws2.db_iter_all_packages = lambda: _rows(args.rows)
+    middleware = ws2.flask_app.wsgi_app
+    while not isinstance(middleware, CompressionMiddleware):
+        middleware = middleware.app
+
+    operations = [(f'getAllPackagesPage ({args.page_size})', _PAGE.format(args.page_size), 'getAllPackagesPage'),
+                  (f'getAllPackages ({args.rows}, streaming)', _ALL, 'getAllPackages')]
+    print(f"{'operação':<34} {'codificação':<12} {'corpo':>10} {'razão':>6} {'servidor':>9} {'comprimir':>9} {'cliente':>8} "
+          f"{'rede ' + format(args.mbps, 'g') + ' Mbit/s':>16}")
+    for name, body, action in operations:
+        for encoding in args.encodings:
+            for level in ([None] if encoding == 'identity' else args.levels):
+                if level is not None: middleware.level = level
+                runs = sorted((_call(ws2, EnvironBuilder, body, action, encoding, level) for _ in range(args.repeat)),
+                              key=lambda run: run[2])
+                size, plain, server, compress, client = runs[len(runs) // 2]
+                label = encoding if level is None else f'{encoding} -{level}'
+                transfer = size * 8 / (args.mbps * 1e6)
+                print(f"{name:<34} {label:<12} {size / 1024:>7.0f} KB {plain / size:>5.1f}x {server * 1000:>7.0f}ms "
+                      f"{compress * 1000:>7.1f}ms {client * 1000:>6.1f}ms {transfer * 1000:>14.0f}ms")
+
+    rng = random.Random(3)
+    items = "".join(_ITEM.format(rng.randrange(1, 10 ** 6), rng.choice(_CITIES),
+                                 f'2026-03-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00')
+                    for _ in range(args.bulk))
+    request = _ENVELOPE.format(f"<tns:bulkUpdatePackageStatus><tns:updates>{items}</tns:updates>"
+                               "</tns:bulkUpdatePackageStatus>").encode()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _WBITS['gzip'])  # como o _gzip do soap_client da GUI
+    compressed = compressor.compress(request) + compressor.flush()
+    print(f"\npedido bulkUpdatePackageStatus ({args.bulk} entradas): {len(request) / 1024:.0f} KB, "
+          f"com gzip {len(compressed) / 1024:.0f} KB ({len(request) / len(compressed):.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
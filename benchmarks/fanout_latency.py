@@ -0,0 +1,113 @@
+"""Latência do dashboard de administração da GUI com as chamadas ao WS2 em paralelo (CallGroup) ou em série.
+
+A página /dashboard/admin faz duas chamadas independentes ao WS2:
+getDashboardStats e getAllPackagesPage. O WS2 real (Spyne, via HTTP) corre
+numa thread deste processo, com as funções da base de dados substituídas
+por uma espera de ``--latency`` segundos cada. A GUI usa os clientes zeep
+de sempre (ResilientClient). No modo ``sequential`` o CallGroup corre cada
+chamada no ``submit``, como antes do fan-out; no modo ``parallel`` é o
+CallGroup do fanout.py.
+
+    python benchmarks/fanout_latency.py --latency 0.2 --requests 50
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _rows(count):
+    return [{'id': i, 'name': f'Pacote {i}', 'description': 'Encomenda de teste', 'sender_city': 'Lisboa',
+             'destination_city': 'Porto', 'is_tracked': True, 'sender_username': 'ana',
+             'receiver_username': 'rui', 'creation_date': '2026-01-01T10:00:00', 'current_city': 'Coimbra',
+             'last_update': '2026-01-02T10:00:00', 'hop_count': 3} for i in range(count, 0, -1)]
+
+
+def _start_ws2(port, latency):
+    sys.path.insert(0, os.path.join(ROOT, 'WS2'))
+    os.chdir(os.path.join(ROOT, 'WS2'))
+    import ws2_admin_service as ws2
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    def stats():
+        time.sleep(latency)
+        return {'total_packages': 1200, 'tracked': 1000, 'untracked': 200,
+                'by_origin': [('Lisboa', 700), ('Porto', 500)], 'by_destination': [('Porto', 1200)],
+                'created_per_hour': [('2026-01-01 10:00', 12)], 'updated_per_hour': [('2026-01-01 10:00', 40)]}
+
+    def packages(limit=None, after=None):
+        time.sleep(latency)
+        return _rows(limit or 50)
+
+    ws2.db_get_dashboard_stats = stats
+    ws2.db_get_all_packages = packages
+    server = make_server('127.0.0.1', port, ws2.flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sys.path.remove(os.path.join(ROOT, 'WS2'))
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.2, help='espera de cada consulta do WS2 (s)')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--port', type=int, default=5992)
+    parser.add_argument('--modes', nargs='+', default=['sequential', 'parallel'], choices=['sequential', 'parallel'])
+    args = parser.parse_args()
+
+    os.environ.setdefault('DASHBOARD_RECONCILE_INTERVAL', '0')
+    os.environ['WSDL_WS2_URL'] = f'http://127.0.0.1:{args.port}/ws2?wsdl'
+    os.environ['WSDL_WS1_URL'] = 'http://127.0.0.1:9/ws1?wsdl'  # o dashboard só usa o WS2
+    os.environ['WSDL_CACHE_PATH'] = ''
+    os.environ['SOAP_PROTOCOL'] = 'soap'
+    _start_ws2(args.port, args.latency)
+
+    sys.path.insert(0, os.path.join(ROOT, 'GUI'))
+    os.chdir(os.path.join(ROOT, 'GUI'))
+    import fanout
+    import gui_app
+
+    class SequentialCallGroup(fanout.CallGroup):
+        """Sem paralelismo: cada chamada corre no submit, antes da seguinte."""
+
+        def submit(self, name, fn, *args, **kwargs):
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            self._calls[name] = (future, time.monotonic())
+
+    client = gui_app.app.test_client()
+    with client.session_transaction() as session:
+        session.update({'user_id': 1, 'username': 'admin', 'role': 'admin'})
+    client.get('/dashboard/admin')  # WSDL e ligações fora das medições
+
+    print(f"/dashboard/admin, {args.requests} pedidos, {args.latency * 1000:g} ms por consulta do WS2")
+    print(f"{'modo':<11} {'p50':>8} {'p95':>8} {'máx':>8}")
+    for mode in args.modes:
+        gui_app.CallGroup = SequentialCallGroup if mode == 'sequential' else fanout.CallGroup
+        times = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            response = client.get('/dashboard/admin')
+            times.append(time.perf_counter() - started)
+            if response.status_code != 200 or b'1200' not in response.data:
+                raise SystemExit(f"{mode}: resposta inesperada ({response.status_code})")
+        print(f"{mode:<11} {_percentile(times, 0.5) * 1000:>6.0f}ms {_percentile(times, 0.95) * 1000:>6.0f}ms "
+              f"{max(times) * 1000:>6.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
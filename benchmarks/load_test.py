@@ -0,0 +1,147 @@
+"""Teste de carga do WS1: muitos pedidos SOAP checkStatus em simultâneo.
+
+Mede quantas ligações o WS1 aguenta ao mesmo tempo com workers gthread
+(uma thread por pedido) e gevent (GUNICORN_WORKER_CLASS=gevent). O cliente
+é gevent: ``--concurrency`` pedidos ficam em curso ao mesmo tempo, cada um
+na sua ligação.
+
+Contra um WS1 já a correr (com MySQL):
+
+    python benchmarks/load_test.py --url http://localhost:5001/ws1 --concurrency 2000
+
+Ou arrancando o WS1 com o gunicorn e a base de dados simulada
+(ws1_simulated_db.py, cada consulta espera BENCH_DB_LATENCY segundos):
+
+    python benchmarks/load_test.py --spawn gevent --concurrency 2000
+    python benchmarks/load_test.py --spawn gthread --concurrency 2000
+
+``--spawn flask`` arranca o servidor de desenvolvimento do Flask (como o
+``python ws1_user_service.py`` de antes do gunicorn), para comparar o
+débito com o dos workers do gunicorn:
+
+    BENCH_DB_LATENCY=0.02 python benchmarks/load_test.py --spawn flask --concurrency 50 --requests 5000
+    BENCH_DB_LATENCY=0.02 python benchmarks/load_test.py --spawn gthread --concurrency 50 --requests 5000
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import os  # noqa: E402
+import socket  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+import requests  # noqa: E402
+from gevent.pool import Pool  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tns="sds.lab.user.v1">
+<soapenv:Body><tns:checkStatus><tns:package_id>{}</tns:package_id></tns:checkStatus></soapenv:Body>
+</soapenv:Envelope>"""
+
+
+def _spawn(worker_class, port, workers):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=worker_class, PORT=str(port), GUNICORN_WORKERS=str(workers),
+               GUNICORN_ACCESS_LOG="", GUNICORN_TIMEOUT="120")
+    if worker_class == 'flask':
+        command = [sys.executable, os.path.join(ROOT, 'benchmarks', 'ws1_simulated_db.py')]
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'WS1', 'gunicorn.conf.py'),
+                   '--chdir', os.path.join(ROOT, 'WS1'), '--pythonpath', os.path.join(ROOT, 'benchmarks'),
+                   'ws1_simulated_db:flask_app']
+    process = subprocess.Popen(command, env=env, cwd=os.path.join(ROOT, 'WS1'),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                break
+        except OSError:
+            time.sleep(0.1)
+    else:
+        process.kill()
+        raise SystemExit("o gunicorn não arrancou")
+    # Os workers só aceitam ligações depois de importar a aplicação
+    requests.get(f'http://127.0.0.1:{port}/health', timeout=30)
+    return process
+
+
+def _percentile(values, p):
+    if not values: return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(url, concurrency, total, timeout):
+    latencies, errors = [], {}
+    in_flight = [0, 0]  # atual, máximo
+
+    def one(i):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight[1], in_flight[0])
+        started = time.perf_counter()
+        try:
+            # Uma sessão por pedido: uma ligação TCP própria, como clientes independentes
+            response = requests.post(url, data=_ENVELOPE.format(i % 1000 + 1).encode(), timeout=timeout,
+                                     headers={'Content-Type': 'text/xml; charset=utf-8',
+                                              'SOAPAction': '"checkStatus"'})
+            if response.status_code == 200 and b'checkStatusResponse' in response.content:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors[f'HTTP {response.status_code}'] = errors.get(f'HTTP {response.status_code}', 0) + 1
+        except requests.RequestException as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        finally:
+            in_flight[0] -= 1
+
+    pool = Pool(concurrency)
+    started = time.perf_counter()
+    for i in range(total):
+        pool.spawn(one, i)
+    pool.join()
+    elapsed = time.perf_counter() - started
+    return {'ok': len(latencies), 'errors': errors, 'seconds': elapsed, 'max_in_flight': in_flight[1],
+            'rps': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': _percentile(latencies, 0.50), 'p95': _percentile(latencies, 0.95),
+            'p99': _percentile(latencies, 0.99), 'max': max(latencies, default=float('nan'))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='endpoint SOAP do WS1 (ex.: http://localhost:5001/ws1)')
+    parser.add_argument('--spawn', choices=['gevent', 'gthread', 'flask'],
+                        help='arranca o WS1 com a BD simulada')
+    parser.add_argument('--port', type=int, default=5991)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=2000)
+    parser.add_argument('--requests', type=int, help='total de pedidos (por omissão = concurrency)')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+    if not args.url and not args.spawn:
+        parser.error('indicar --url ou --spawn')
+
+    process = None
+    url = args.url
+    if args.spawn:
+        process = _spawn(args.spawn, args.port, args.workers)
+        url = f'http://127.0.0.1:{args.port}/ws1'
+    try:
+        total = args.requests or args.concurrency
+        result = run(url, args.concurrency, total, args.timeout)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    label = args.spawn or url
+    print(f"{label}: {total} pedidos, {args.concurrency} em simultâneo (máx. em curso {result['max_in_flight']})")
+    print(f"  ok {result['ok']}, erros {result['errors'] or 0}, {result['seconds']:.1f}s, "
+          f"{result['rps']:.0f} pedidos/s")
+    print(f"  latência p50 {result['p50']:.2f}s  p95 {result['p95']:.2f}s  "
+          f"p99 {result['p99']:.2f}s  máx {result['max']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Latência do login (p50/p99) com o Argon2 na thread do pedido, em threads ou no pool de processos.
+
+Um pico de ``--concurrency`` logins em simultâneo (threads, como as de um
+worker gthread) chama a operação SOAP login do WS1 diretamente (WSGI, sem
+rede). Ao mesmo tempo uma thread de sonda faz checkStatus seguidos, um
+pedido barato, para medir quanto o Argon2 atrasa os outros pedidos do
+worker. O utilizador vem de uma conexão simulada (o hash é um Argon2 real
+com os parâmetros ARGON2_*); o checkStatus não vai à base de dados.
+
+Modos (cada um num processo à parte):
+
+- ``inline``: PASSWORD_POOL_WORKERS=0 e uma fila do tamanho do pico, o
+  Argon2 corre na thread do pedido sem limite (o comportamento antes do
+  pool);
+- ``thread``: pool de ``--workers`` threads (PASSWORD_POOL_MODE=thread);
+- ``process``: pool de ``--workers`` processos (o padrão do WS1).
+
+Os logins recusados com Server.Busy (fila cheia durante mais do que
+PASSWORD_POOL_QUEUE_TIMEOUT) contam à parte e ficam fora das latências.
+
+    python benchmarks/login_latency.py --concurrency 32 --logins 256
+    python benchmarks/login_latency.py --modes inline process --workers 2
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ENVELOPE = """<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tns="sds.lab.user.v1">
+<soapenv:Body>{}</soapenv:Body></soapenv:Envelope>"""
+_LOGIN = "<tns:login><tns:username>ana</tns:username><tns:password>segredo-123</tns:password></tns:login>"
+_CHECK = "<tns:checkStatus><tns:package_id>1</tns:package_id></tns:checkStatus>"
+
+
+def _percentile(values, p):
+    if not values: return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class _UserConnection:
+    """Conexão simulada: o SELECT do db_user_login devolve sempre o mesmo utilizador."""
+
+    def __init__(self, user):
+        self.user = user
+
+    def cursor(self, *args, **kwargs):
+        return self
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchone(self):
+        return dict(self.user)
+
+    def close(self):
+        pass
+
+
+def run_mode(mode, concurrency, logins, workers):
+    """Corre num processo filho; imprime um JSON com os resultados."""
+    os.environ['PASSWORD_POOL_WORKERS'] = '0' if mode == 'inline' else str(workers)
+    os.environ['PASSWORD_POOL_MODE'] = 'thread' if mode == 'thread' else 'process'
+    if mode == 'inline': os.environ['PASSWORD_POOL_QUEUE'] = str(concurrency)
+    sys.path.insert(0, os.path.join(ROOT, 'WS1'))
+    os.chdir(os.path.join(ROOT, 'WS1'))
+    import db_utils
+    import ws1_user_service as ws1
+    from werkzeug.test import EnvironBuilder
+
+    user = {'id': 1, 'password_hash': db_utils.ph.hash('segredo-123'), 'role': 'client'}
+    db_utils.get_db_connection = lambda: _UserConnection(user)
+    ws1.db_check_status = lambda package_id: [{'city': 'Lisboa', 'timestamp': '2026-01-01T10:00:00'}]
+
+    def call(body, action):
+        environ = EnvironBuilder(path='/ws1', method='POST', data=_ENVELOPE.format(body).encode(),
+                                 headers={'Content-Type': 'text/xml; charset=utf-8',
+                                          'SOAPAction': f'"{action}"'}).get_environ()
+        started = time.perf_counter()
+        response = b''.join(ws1.flask_app.wsgi_app(environ, lambda s, h, exc_info=None: None))
+        return time.perf_counter() - started, response
+
+    call(_LOGIN, 'login')  # arranca o pool (forkserver) fora das medições
+
+    login_times, probe_times, rejected, failed = [], [], [0], [0]
+    remaining = [logins]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] == 0: return
+                remaining[0] -= 1
+            elapsed, response = call(_LOGIN, 'login')
+            with lock:
+                if b'loginResponse' in response: login_times.append(elapsed)
+                elif b'Server.Busy' in response: rejected[0] += 1
+                else: failed[0] += 1
+
+    def probe():
+        while not done.is_set():
+            elapsed, _ = call(_CHECK, 'checkStatus')
+            probe_times.append(elapsed)
+            time.sleep(0.01)
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients: thread.start()
+    for thread in clients: thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    prober.join()
+    print(json.dumps({'mode': mode, 'ok': len(login_times), 'rejected': rejected[0], 'failed': failed[0], 'seconds': round(elapsed, 2),
+                      'login_p50': _percentile(login_times, 0.5), 'login_p99': _percentile(login_times, 0.99),
+                      'probe_p50': _percentile(probe_times, 0.5), 'probe_p99': _percentile(probe_times, 0.99)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=32, help='logins em simultâneo')
+    parser.add_argument('--logins', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help='tamanho do pool')
+    parser.add_argument('--modes', nargs='+', default=['inline', 'thread', 'process'],
+                        choices=['inline', 'thread', 'process'])
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_mode(args.child, args.concurrency, args.logins, args.workers)
+        return
+
+    print(f"{args.logins} logins, {args.concurrency} em simultâneo, pool de {args.workers} "
+          f"({os.cpu_count()} CPU)")
+    print(f"{'modo':<8} {'ok':>5} {'Busy':>5} {'erros':>5} {'tempo':>7} {'login p50':>10} {'login p99':>10} "
+          f"{'outros p50':>11} {'outros p99':>11}")
+    for mode in args.modes:
+        command = [sys.executable, os.path.abspath(__file__), '--child', mode, '--concurrency', str(args.concurrency),
+                   '--logins', str(args.logins), '--workers', str(args.workers)]
+        done = subprocess.run(command, capture_output=True, text=True)
+        lines = [line for line in done.stdout.splitlines() if line.startswith('{')]
+        if done.returncode != 0 or not lines:
+            print(f"{mode:<8} falhou (código {done.returncode}) {done.stderr.strip()[-200:]}")
+            continue
+        r = json.loads(lines[-1])
+        print(f"{r['mode']:<8} {r['ok']:>5} {r['rejected']:>5} {r['failed']:>5} {r['seconds']:>6}s {r['login_p50'] * 1000:>8.0f}ms "
+              f"{r['login_p99'] * 1000:>8.0f}ms {r['probe_p50'] * 1000:>9.1f}ms {r['probe_p99'] * 1000:>9.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Tamanho das respostas e CPU por chamada: SOAP (zeep) vs endpoints JSON e MessagePack.
+
+O WS1 corre num processo à parte (servidor WSGI do werkzeug, uma thread,
+COMPRESSION=0 para medir o formato e não o gzip) com ``db_list_packages``
+a devolver linhas sintéticas. Este processo chama listPackagesPage
+``--calls`` vezes por protocolo com os clientes da GUI (soap_client.py):
+o zeep para ``soap`` e o CompactClient para ``json`` e ``msgpack``. Mede o
+corpo da resposta, o CPU do cliente (este processo) e o do servidor
+(/proc/<pid>/stat) por chamada, e a latência.
+
+    python benchmarks/payload_size.py --page-size 100 --calls 200
+    python benchmarks/payload_size.py --page-size 500 --protocols soap msgpack
+"""
+import argparse
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CITIES = ['Lisboa', 'Porto', 'Coimbra', 'Braga', 'Faro', 'Évora', 'Leiria', 'Viseu', 'Aveiro', 'Setúbal']
+
+
+def _rows(count):
+    rng = random.Random(42)
+    rows = []
+    for i in range(count, 0, -1):
+        rows.append({'id': 100000 + i, 'name': f'Encomenda {rng.randrange(10 ** 6)}',
+                     'description': ' '.join(rng.choice(['caixa', 'frágil', 'livros', 'roupa', 'peças', 'urgente',
+                                                         'eletrónica', 'documentos']) for _ in range(6)),
+                     'sender_city': rng.choice(_CITIES), 'destination_city': rng.choice(_CITIES),
+                     'is_tracked': rng.random() < 0.8,
+                     'creation_date': f'2026-01-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:00:00',
+                     'current_city': rng.choice(_CITIES),
+                     'last_update': f'2026-02-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:30:00',
+                     'hop_count': rng.randrange(12)})
+    return rows
+
+
+def serve(port, rows):
+    """Processo filho: o WS1 com a listagem sintética."""
+    os.environ['COMPRESSION'] = '0'
+    sys.path.insert(0, os.path.join(ROOT, 'WS1'))
+    os.chdir(os.path.join(ROOT, 'WS1'))
+    import logging
+    import ws1_user_service as ws1
+    from werkzeug.serving import make_server
+
+    data = _rows(rows)
+    ws1.db_list_packages = lambda user_id, limit=None, after=None: [dict(row) for row in data[:limit]]
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, ws1.flask_app).serve_forever()
+
+
+def _cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')  # utime + stime
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--page-size', type=int, default=100, help='pacotes por resposta (máximo 500)')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--port', type=int, default=5993)
+    parser.add_argument('--protocols', nargs='+', default=['soap', 'json', 'msgpack'],
+                        choices=['soap', 'json', 'msgpack'])
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        serve(args.port, args.page_size + 1)
+        return
+
+    os.environ['WSDL_CACHE_PATH'] = ''
+    os.environ['SOAP_REQUEST_COMPRESSION_MIN'] = '0'
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', '--port', str(args.port),
+                               '--page-size', str(args.page_size)])
+    try:
+        for _ in range(300):
+            try:
+                with socket.create_connection(('127.0.0.1', args.port), timeout=0.2):
+                    break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise SystemExit("o WS1 não arrancou")
+
+        sys.path.insert(0, os.path.join(ROOT, 'GUI'))
+        from zeep import Settings, Transport
+        from soap_client import CompactClient, LazyClient, make_session
+
+        wsdl = f'http://127.0.0.1:{args.port}/ws1?wsdl'
+        sizes = []
+        session = make_session()
+        session.headers['Accept-Encoding'] = 'identity'
+        session.hooks['response'].append(lambda response, *a, **kw: sizes.append(len(response.content)))
+        transport = Transport(session=session, timeout=10)
+
+        print(f"listPackagesPage com {args.page_size} pacotes, {args.calls} chamadas por protocolo")
+        print(f"{'protocolo':<10} {'resposta':>10} {'CPU cliente':>12} {'CPU servidor':>13} {'p50':>8} {'p95':>8}")
+        for protocol in args.protocols:
+            if protocol == 'soap':
+                client = LazyClient('WS1', wsdl, Settings(strict=False, xml_huge_tree=True), transport)
+            else:
+                client = CompactClient('WS1', wsdl.split('?')[0] + '/' + protocol, protocol, session)
+            page = client.service.listPackagesPage(user_id=1, page_size=args.page_size, cursor=None)
+            packages = page.packages.PackageInfo
+            assert len(packages) == args.page_size and packages[0].name, protocol
+
+            del sizes[:]
+            times = []
+            client_cpu, server_cpu = time.process_time(), _cpu_seconds(server.pid)
+            for _ in range(args.calls):
+                started = time.perf_counter()
+                client.service.listPackagesPage(user_id=1, page_size=args.page_size, cursor=None)
+                times.append(time.perf_counter() - started)
+            client_cpu = (time.process_time() - client_cpu) / args.calls
+            server_cpu = (_cpu_seconds(server.pid) - server_cpu) / args.calls
+            print(f"{protocol:<10} {sum(sizes) / len(sizes) / 1024:>7.1f} KB {client_cpu * 1000:>9.2f} ms "
+                  f"{server_cpu * 1000:>10.2f} ms {_percentile(times, 0.5) * 1000:>6.1f}ms "
+                  f"{_percentile(times, 0.95) * 1000:>6.1f}ms")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Pesquisa do WS1 (db_search_packages): índice FULLTEXT vs o LIKE '%termo%' de antes.
+
+Precisa do MySQL configurado (MYSQL_HOST, ...); corre num esquema próprio
+(ver bench_schema.py), criado com o db/init.sql e carregado com ``--packages``
+pacotes de ``--users`` utilizadores. O utilizador 1 é um cliente grande
+(remetente de ``--heavy-share`` dos pacotes); os restantes repartem o
+resto. Os nomes e descrições são palavras de um vocabulário com
+frequências desiguais (há termos comuns e raros) mais uma referência
+única por pacote.
+
+Para cada termo e utilizador chama db_search_packages com o FULLTEXT
+(MATCH ... AGAINST em modo booleano, por prefixo) e com o LIKE (o
+``_fulltext_query`` devolve None, o caminho de termos curtos). Mede a
+mediana de ``--repeat`` chamadas para a primeira página (``--page-size``)
+e para o resultado todo (searchPackages sem página) e mostra as linhas
+que o EXPLAIN estima ler. O LIKE encontra também o termo a meio de uma
+palavra, por isso as contagens podem diferir.
+
+    python benchmarks/search_fulltext.py --packages 1000000 --users 2000
+    python benchmarks/search_fulltext.py --reuse --terms caixa "eletr" "caixa fragil"
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_schema  # noqa: E402
+
+_WORDS = ['caixa', 'fragil', 'livros', 'roupa', 'pecas', 'urgente', 'eletronica', 'documentos', 'vidro',
+          'amostras', 'ferramentas', 'brinquedos', 'calcado', 'cabos', 'tinteiros', 'medicamentos', 'bicicleta',
+          'monitor', 'teclado', 'cadeira', 'lampada', 'panelas', 'tecidos', 'sementes', 'relogio', 'guitarra',
+          'telescopio', 'aquario', 'microscopio', 'harpa']
+_WEIGHTS = [1 / (rank + 1) for rank in range(len(_WORDS))]  # Zipf: 'caixa' é o mais comum, 'harpa' o mais raro
+_CITIES = ['Lisboa', 'Porto', 'Coimbra', 'Braga', 'Faro', 'Evora', 'Leiria', 'Viseu']
+_INSERT_USER = "INSERT INTO users (username, password_hash, email) VALUES (%s, 'x', %s)"
+_INSERT_PACKAGE = ("INSERT INTO packages (sender_id, receiver_id, name, description, sender_city, destination_city, "
+                   "is_tracked, creation_date) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)")
+
+
+def _packages(count, users, heavy_share):
+    rng = random.Random(5)
+    start = datetime(2025, 1, 1)
+    for i in range(count):
+        sender = 1 if rng.random() < heavy_share else rng.randrange(2, users + 1)
+        receiver = rng.randrange(2, users + 1)
+        if receiver == sender: receiver = 1
+        words = rng.choices(_WORDS, _WEIGHTS, k=rng.randrange(3, 12))
+        yield (sender, receiver, f'{words[0].title()} ref{i}', ' '.join(words), rng.choice(_CITIES),
+               rng.choice(_CITIES), True, start + timedelta(seconds=i * 30))
+
+
+def load(conn, packages, users, heavy_share):
+    cursor = conn.cursor()
+    bench_schema.insert_rows(conn, _INSERT_USER, ((f'user{i}', f'user{i}@example.com') for i in range(1, users + 1)))
+    # o índice FULLTEXT é criado no fim, de uma vez, em vez de linha a linha
+    cursor.execute("ALTER TABLE packages DROP INDEX ft_packages_name_description")
+    started = time.perf_counter()
+    bench_schema.insert_rows(conn, _INSERT_PACKAGE, _packages(packages, users, heavy_share))
+    loaded = time.perf_counter() - started
+    started = time.perf_counter()
+    cursor.execute("ALTER TABLE packages ADD FULLTEXT INDEX ft_packages_name_description (name, description)")
+    cursor.execute("ANALYZE TABLE packages")
+    cursor.fetchall()
+    print(f"{packages} pacotes carregados em {loaded:.0f}s, FULLTEXT criado em {time.perf_counter() - started:.0f}s")
+    cursor.close()
+
+
+def _explain_rows(conn, query, params):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("EXPLAIN " + query, params)
+    plan = cursor.fetchall()
+    cursor.close()
+    return sum(row['rows'] or 0 for row in plan), ','.join(sorted({row['key'] for row in plan if row['key']}))
+
+
+def _median(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return sorted(times)[len(times) // 2], result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packages', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--heavy-share', type=float, default=0.1, help='fração dos pacotes enviados pelo utilizador 1')
+    parser.add_argument('--terms', nargs='+', default=['caixa', 'medicamentos', 'harpa', 'eletr', 'caixa fragil'])
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--reuse', action='store_true', help='usar o esquema de uma execução anterior com --keep')
+    parser.add_argument('--keep', action='store_true', help='não apagar o esquema no fim')
+    args = parser.parse_args()
+
+    conn = bench_schema.create(reuse=args.reuse)
+    try:
+        if not args.reuse: load(conn, args.packages, args.users, args.heavy_share)
+        bench_schema.use()
+        sys.path.insert(0, os.path.join(ROOT, 'WS1'))
+        import db_utils
+        fulltext_query = db_utils._fulltext_query
+        typical = 2
+
+        print(f"{'modo':<9} {'utilizador':<10} {'termo':<14} {'encontrados':>11} {'página':>9} {'tudo':>9} "
+              f"{'EXPLAIN rows':>12}  índices")
+        for term in args.terms:
+            for user_id, label in ((1, 'grande'), (typical, 'típico')):
+                for mode in ('fulltext', 'like'):
+                    db_utils._fulltext_query = fulltext_query if mode == 'fulltext' else (lambda search_term: None)
+                    if mode == 'fulltext' and fulltext_query(term) is None:
+                        continue  # termo mais curto do que FT_MIN_TOKEN_SIZE: a pesquisa usa sempre o LIKE
+                    page, _ = _median(lambda: db_utils.db_search_packages(user_id, term, limit=args.page_size + 1),
+                                      args.repeat)
+                    everything, found = _median(lambda: db_utils.db_search_packages(user_id, term), args.repeat)
+                    rows, keys = _explain_rows(conn, *db_utils._search_packages_query(user_id, term,
+                                                                                       args.page_size + 1))
+                    print(f"{mode:<9} {label:<10} {term:<14} {len(found):>11} {page * 1000:>7.1f}ms "
+                          f"{everything * 1000:>7.1f}ms {rows:>12}  {keys}")
+        db_utils._fulltext_query = fulltext_query
+    finally:
+        if args.keep: conn.close()
+        else: bench_schema.drop(conn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Conexão MySQL simulada para os benchmarks de escrita sem base de dados.
+
+Cada ida e volta ao servidor (``execute``, ``commit``, ``rollback``) espera
+BENCH_DB_LATENCY segundos. Um ``executemany`` de um INSERT conta como uma
+(o conector junta as linhas num INSERT multi-linha); o de outras
+instruções conta uma por linha, como no mysql-connector. Os SELECT de
+pacotes devolvem todos os IDs pedidos (todos existem e estão a ser
+rastreados) e os UPDATE afetam uma linha.
+
+    import simulated_mysql
+    db_utils.get_db_connection = simulated_mysql.connect
+"""
+import os
+import threading
+import time
+
+DB_LATENCY = float(os.environ.get("BENCH_DB_LATENCY", 0.0005))
+
+_lock = threading.Lock()
+round_trips = 0
+
+
+def _round_trip(count=1):
+    global round_trips
+    with _lock:
+        round_trips += count
+    if DB_LATENCY: time.sleep(DB_LATENCY * count)
+
+
+def connect():
+    return SimulatedConnection()
+
+
+class SimulatedConnection:
+    def cursor(self, *args, **kwargs):
+        return SimulatedCursor()
+
+    def commit(self):
+        _round_trip()
+
+    def rollback(self):
+        _round_trip()
+
+    def close(self):
+        pass
+
+
+class SimulatedCursor:
+    def __init__(self):
+        self.rowcount = 0
+        self._rows = []
+
+    def execute(self, query, params=None):
+        _round_trip()
+        self.rowcount, self._rows = 1, []
+        if query.lstrip().startswith("SELECT id FROM packages"):
+            self._rows = [(package_id,) for package_id in params]
+            self.rowcount = len(self._rows)
+
+    def executemany(self, query, rows):
+        rows = list(rows)
+        _round_trip(1 if query.lstrip().startswith("INSERT") else len(rows))
+        self.rowcount = len(rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
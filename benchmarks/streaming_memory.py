@@ -0,0 +1,102 @@
+"""Memória de pico do getAllPackages do WS2: resposta montada em memória vs SOAP_STREAMING=1.
+
+Cada modo corre num processo à parte (o pico de RSS de um processo não
+desce) e chama a aplicação WSGI do WS2 diretamente, consumindo o corpo da
+resposta como faria o servidor. Por omissão as linhas vêm de um gerador
+sintético no lugar do MySQL (``db_get_all_packages`` devolve a lista toda,
+como o fetchall; ``db_iter_all_packages`` gera-as uma a uma, como o cursor
+não-bufferizado); com ``--mysql`` usa a base de dados configurada (MYSQL_HOST,
+...), que tem de ter pelo menos ``--rows`` pacotes.
+
+    python benchmarks/streaming_memory.py --rows 1000000
+    python benchmarks/streaming_memory.py --rows 200000 --modes buffered streaming
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ENVELOPE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:tns="sds.lab.admin.v1">
+<soapenv:Body><tns:getAllPackages/></soapenv:Body></soapenv:Envelope>"""
+
+
+def _rows(count):
+    for i in range(1, count + 1):
+        yield {'id': i, 'name': f'Pacote {i}', 'description': 'Encomenda de teste para o benchmark',
+               'sender_city': 'Lisboa', 'destination_city': 'Porto', 'is_tracked': True,
+               'sender_username': f'remetente{i % 1000}', 'receiver_username': f'destinatario{i % 997}',
+               'creation_date': '2026-01-01T10:00:00', 'current_city': 'Coimbra',
+               'last_update': '2026-01-02T10:00:00', 'hop_count': 3}
+
+
+def _max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB no Linux
+
+
+def run_mode(mode, rows, use_mysql):
+    """Corre num processo filho; imprime um JSON com os resultados."""
+    os.environ['SOAP_STREAMING'] = '1' if mode == 'streaming' else '0'
+    os.environ.setdefault('DASHBOARD_RECONCILE_INTERVAL', '0')
+    sys.path.insert(0, os.path.join(ROOT, 'WS2'))
+    os.chdir(os.path.join(ROOT, 'WS2'))
+    import ws2_admin_service as ws2
+    from werkzeug.test import EnvironBuilder
+
+    if not use_mysql:
+        ws2.db_get_all_packages = lambda limit=None, after=None: list(_rows(rows))
+        ws2.db_iter_all_packages = lambda: _rows(rows)
+    baseline = _max_rss_mb()
+
+    environ = EnvironBuilder(path='/ws2', method='POST', data=_ENVELOPE,
+                             headers={'Content-Type': 'text/xml; charset=utf-8',
+                                      'SOAPAction': '"getAllPackages"'}).get_environ()
+    status = []
+    started = time.perf_counter()
+    body = ws2.flask_app.wsgi_app(environ, lambda s, h, exc_info=None: status.append(s))
+    size = 0
+    try:
+        for chunk in body:
+            size += len(chunk)
+    finally:
+        if hasattr(body, 'close'): body.close()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'mode': mode, 'rows': rows, 'status': status[0] if status else None,
+                      'response_mb': round(size / 1e6, 1), 'seconds': round(elapsed, 1),
+                      'baseline_rss_mb': round(baseline, 1), 'peak_rss_mb': round(_max_rss_mb(), 1),
+                      'extra_mb': round(_max_rss_mb() - baseline, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--modes', nargs='+', default=['streaming', 'buffered'], choices=['streaming', 'buffered'])
+    parser.add_argument('--mysql', action='store_true', help='ler da base de dados configurada')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_mode(args.child, args.rows, args.mysql)
+        return
+
+    print(f"{'modo':<10} {'linhas':>9} {'status':<8} {'resposta':>10} {'tempo':>7} {'pico RSS':>10} {'acréscimo':>10}")
+    for mode in args.modes:
+        command = [sys.executable, os.path.abspath(__file__), '--child', mode, '--rows', str(args.rows)]
+        if args.mysql: command.append('--mysql')
+        done = subprocess.run(command, capture_output=True, text=True)
+        lines = [line for line in done.stdout.splitlines() if line.startswith('{')]
+        if done.returncode != 0 or not lines:
+            # ex.: morto pelo OOM killer (-9) no modo buffered
+            print(f"{mode:<10} {args.rows:>9} falhou (código {done.returncode}) {done.stderr.strip()[-200:]}")
+            continue
+        r = json.loads(lines[-1])
+        print(f"{r['mode']:<10} {r['rows']:>9} {r['status'][:3]:<8} {r['response_mb']:>8} MB {r['seconds']:>6}s "
+              f"{r['peak_rss_mb']:>7} MB {r['extra_mb']:>7} MB")
+
+
+if __name__ == '__main__':
+    main()
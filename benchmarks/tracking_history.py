@@ -0,0 +1,174 @@
+"""Latência do checkStatus e do removePackage com tracking_info grande, antes e depois do arquivo.
+
+Precisa do MySQL configurado (MYSQL_HOST, ...); corre num esquema próprio
+(ver bench_schema.py). Carrega ``--rows`` entradas de tracking_info
+(``--per-package`` por pacote, logo rows / per-package pacotes) com
+INSERT ... SELECT no próprio servidor, por intervalos de ``--chunk``
+pacotes. ``--delivered`` % dos pacotes estão entregues e parados há mais
+de 60 dias (candidatos do TrackingArchiver); os outros estão em trânsito.
+
+Mede, com as funções do WS2 (db_utils), a latência do checkStatus
+(db_check_status) para ``--samples`` pacotes entregues e em trânsito ao
+acaso e a do removePackage (db_remove_package, que apaga o histórico em
+cascata) para ``--removes`` pacotes entregues, e o tamanho das tabelas.
+Depois corre uma passagem completa do TrackingArchiver e repete as
+medições: os entregues passam a ler a linha comprimida de
+tracking_archive.
+
+    python benchmarks/tracking_history.py --rows 10000000
+    python benchmarks/tracking_history.py --rows 100000000 --chunk 200000 --keep
+    python benchmarks/tracking_history.py --reuse --rows 100000000 --no-archive
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_schema  # noqa: E402
+
+_CITIES = "'Lisboa', 'Porto', 'Coimbra', 'Braga', 'Faro', 'Evora', 'Leiria', 'Viseu'"
+
+
+def load(conn, packages, per_package, delivered, chunk):
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (username, password_hash, email) VALUES ('ana', 'x', 'ana@example.com'), "
+                   "('rui', 'x', 'rui@example.com')")
+    # seq: 0 .. chunk-1, a fonte de linhas dos INSERT ... SELECT
+    cursor.execute("CREATE TABLE seq (n INT PRIMARY KEY)")
+    cursor.execute("INSERT INTO seq VALUES (0), (1), (2), (3), (4), (5), (6), (7), (8), (9)")
+    size = 10
+    while size < max(chunk, per_package):
+        cursor.execute("INSERT INTO seq SELECT n + %s * d.k FROM seq, "
+                       "(SELECT 1 AS k UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4 UNION ALL SELECT 5 "
+                       "UNION ALL SELECT 6 UNION ALL SELECT 7 UNION ALL SELECT 8 UNION ALL SELECT 9) d", (size,))
+        size *= 10
+    conn.commit()
+
+    started = time.perf_counter()
+    for first in range(0, packages, chunk):
+        count = min(chunk, packages - first)
+        # Entregues: no destino, último movimento há 60 a 360 dias; os outros ainda em Coimbra, agora
+        cursor.execute("""
+            INSERT INTO packages (id, sender_id, receiver_id, name, description, sender_city, destination_city,
+                                  is_tracked, creation_date, current_city, last_update, hop_count)
+            SELECT id, 1, 2, CONCAT('Pacote ', id), 'Encomenda de teste', 'Lisboa', 'Porto', TRUE,
+                   last_update - INTERVAL %s HOUR, IF(entregue, 'Porto', 'Coimbra'), last_update, %s
+            FROM (SELECT %s + n + 1 AS id, MOD(%s + n, 100) < %s AS entregue,
+                         IF(MOD(%s + n, 100) < %s, NOW() - INTERVAL (60 + MOD(%s + n, 300)) DAY, NOW()) AS last_update
+                  FROM seq WHERE n < %s) s
+        """, (per_package, per_package, first, first, delivered, first, delivered, first, count))
+        cursor.execute(f"""
+            INSERT INTO tracking_info (package_id, city, timestamp)
+            SELECT p.id, ELT(1 + MOD(p.id + h.n, 8), {_CITIES}), p.last_update - INTERVAL (%s - 1 - h.n) HOUR
+            FROM packages p JOIN seq h ON h.n < %s
+            WHERE p.id > %s AND p.id <= %s
+        """, (per_package, per_package, first, first + count))
+        conn.commit()
+        done = first + count
+        elapsed = time.perf_counter() - started
+        print(f"  {done * per_package} entradas ({done} pacotes) em {elapsed:.0f}s", flush=True)
+    cursor.execute("DROP TABLE seq")
+    cursor.close()
+
+
+def table_sizes(conn):
+    cursor = conn.cursor()
+    for table in ('packages', 'tracking_info', 'tracking_archive'):
+        cursor.execute(f"ANALYZE TABLE {table}")
+        cursor.fetchall()
+    cursor.execute("""
+        SELECT table_name, table_rows, (data_length + index_length) / 1048576 FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name IN ('tracking_info', 'tracking_archive')
+        ORDER BY table_name DESC
+    """)
+    sizes = cursor.fetchall()
+    cursor.close()
+    return ", ".join(f"{name} ~{rows} linhas {float(mb):.0f} MB" for name, rows, mb in sizes)
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _timed(fn, ids):
+    times = []
+    for package_id in ids:
+        started = time.perf_counter()
+        result = fn(package_id)
+        times.append(time.perf_counter() - started)
+        if not result: raise SystemExit(f"{fn.__name__}({package_id}) não devolveu nada")
+    return times
+
+
+def measure(label, conn, db_utils, delivered_ids, transit_ids, remove_ids):
+    print(f"\n{label}: {table_sizes(conn)}")
+    print(f"{'operação':<34} {'p50':>8} {'p99':>8}")
+    for name, fn, ids in (('checkStatus (entregue)', db_utils.db_check_status, delivered_ids),
+                          ('checkStatus (em trânsito)', db_utils.db_check_status, transit_ids),
+                          ('removePackage (entregue)', db_utils.db_remove_package, remove_ids)):
+        if not ids: continue
+        times = _timed(fn, ids)
+        print(f"{name:<34} {_percentile(times, 0.5) * 1000:>6.1f}ms {_percentile(times, 0.99) * 1000:>6.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000, help='entradas de tracking_info')
+    parser.add_argument('--per-package', type=int, default=10, help='entradas por pacote')
+    parser.add_argument('--delivered', type=int, default=90, help='%% de pacotes entregues (arquiváveis)')
+    parser.add_argument('--chunk', type=int, default=100_000, help='pacotes por INSERT ... SELECT')
+    parser.add_argument('--samples', type=int, default=500, help='checkStatus por tipo de pacote')
+    parser.add_argument('--removes', type=int, default=50, help='removePackage por fase')
+    parser.add_argument('--no-archive', action='store_true', help='medir só sem arquivo')
+    parser.add_argument('--reuse', action='store_true', help='usar o esquema de uma execução anterior com --keep (e --no-archive)')
+    parser.add_argument('--keep', action='store_true', help='não apagar o esquema no fim')
+    args = parser.parse_args()
+
+    packages = args.rows // args.per_package
+    conn = bench_schema.create(reuse=args.reuse)
+    try:
+        if not args.reuse:
+            print(f"a carregar {packages * args.per_package} entradas de tracking_info ({packages} pacotes)")
+            load(conn, packages, args.per_package, args.delivered, args.chunk)
+        bench_schema.use()
+        os.environ['TRACKING_ARCHIVE_INTERVAL'] = '0'
+        sys.path.insert(0, os.path.join(ROOT, 'WS2'))
+        import db_utils
+        from tracking_archive import TrackingArchiver
+
+        # IDs ao acaso, distintos entre medições e remoções (os removidos deixam de existir)
+        rng = random.Random(11)
+        delivered = [i for i in rng.sample(range(1, packages + 1), min(packages, 20 * args.samples + 4 * args.removes))
+                     if (i - 1) % 100 < args.delivered]
+        transit = [i for i in rng.sample(range(1, packages + 1), min(packages, 20 * args.samples))
+                   if (i - 1) % 100 >= args.delivered][:args.samples]
+        checks, removes = delivered[:args.samples], delivered[args.samples:]
+        if args.reuse:  # os removidos numa execução anterior já não existem
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT id FROM packages WHERE id IN ({', '.join(['%s'] * len(removes))})", removes)
+            existing = {row[0] for row in cursor.fetchall()}
+            cursor.close()
+            removes = [package_id for package_id in removes if package_id in existing]
+        measure("sem arquivo", conn, db_utils, checks, transit, removes[:args.removes])
+
+        if not args.no_archive:
+            archiver = TrackingArchiver(db_utils.get_db_connection, after_days=30, max_per_run=packages)
+            started = time.perf_counter()
+            archived = archiver.run_once()
+            elapsed = time.perf_counter() - started
+            stats = archiver.stats()
+            print(f"\narquivo: {archived} pacotes, {stats['entries_archived']} entradas em {elapsed:.0f}s "
+                  f"({stats['bytes_written'] / 1048576:.0f} MB comprimidos)")
+            measure("com arquivo", conn, db_utils, checks, transit, removes[args.removes:2 * args.removes])
+    finally:
+        if args.keep: conn.close()
+        else: bench_schema.drop(conn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""WS1 com a base de dados simulada, para o load_test.py sem MySQL.
+
+``db_check_status`` espera BENCH_DB_LATENCY segundos (``time.sleep``, que o
+monkey-patching do gevent torna cooperativo, tal como os sockets do driver
+MySQL em Python puro) e devolve um histórico fixo. O resto é o WS1 real:
+Spyne, middlewares e configuração do gunicorn.
+
+    gunicorn -c WS1/gunicorn.conf.py --chdir WS1 --pythonpath benchmarks ws1_simulated_db:flask_app
+    cd WS1 && PORT=5001 python ../benchmarks/ws1_simulated_db.py   # servidor de desenvolvimento do Flask
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'WS1'))
+
+import ws1_user_service  # noqa: E402
+
+DB_LATENCY = float(os.environ.get("BENCH_DB_LATENCY", 0.1))
+HISTORY = [{'city': 'Lisboa', 'timestamp': '2026-01-01T10:00:00'},
+           {'city': 'Coimbra', 'timestamp': '2026-01-01T14:00:00'},
+           {'city': 'Porto', 'timestamp': '2026-01-02T09:00:00'}]
+
+
+def db_check_status(package_id):
+    time.sleep(DB_LATENCY)
+    return HISTORY
+
+
+ws1_user_service.db_check_status = db_check_status
+flask_app = ws1_user_service.flask_app
+
+if __name__ == '__main__':
+    flask_app.run(host='127.0.0.1', port=int(os.environ.get("PORT", 5001)))
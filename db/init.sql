@@ -1,39 +1,82 @@
-
-CREATE DATABASE IF NOT EXISTS tracking_db;
-USE tracking_db; 
-
-
-CREATE TABLE IF NOT EXISTS users (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    username VARCHAR(50) UNIQUE NOT NULL,
-    password_hash VARCHAR(255) NOT NULL, 
-    role VARCHAR(10) NOT NULL DEFAULT 'client', 
-    email VARCHAR(100) UNIQUE,
-    INDEX(username),
-    INDEX(email)
-);
-
-CREATE TABLE IF NOT EXISTS packages (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    sender_id INT NOT NULL,
-    receiver_id INT NOT NULL,
-    name VARCHAR(100) NOT NULL,
-    description TEXT,
-    sender_city VARCHAR(100) NOT NULL,
-    destination_city VARCHAR(100) NOT NULL,
-    is_tracked BOOLEAN NOT NULL DEFAULT FALSE,
-    creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (sender_id) REFERENCES users(id) ON DELETE CASCADE, 
-    FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE 
-);
-
-CREATE TABLE IF NOT EXISTS tracking_info (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    package_id INT NOT NULL,
-    city VARCHAR(100) NOT NULL,
-    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (package_id) REFERENCES packages(id) ON DELETE CASCADE 
-);
-
-INSERT IGNORE INTO users (username, password_hash, role, email) VALUES
+
+CREATE DATABASE IF NOT EXISTS tracking_db;
+USE tracking_db; 
+
+
+CREATE TABLE IF NOT EXISTS users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    password_hash VARCHAR(255) NOT NULL, 
+    role VARCHAR(10) NOT NULL DEFAULT 'client', 
+    email VARCHAR(100) UNIQUE,
+    INDEX(username),
+    INDEX(email)
+);
+
+CREATE TABLE IF NOT EXISTS packages (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    sender_id INT NOT NULL,
+    receiver_id INT NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    description TEXT,
+    sender_city VARCHAR(100) NOT NULL,
+    destination_city VARCHAR(100) NOT NULL,
+    is_tracked BOOLEAN NOT NULL DEFAULT FALSE,
+    creation_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- localização atual (última entrada de tracking_info), mantida pelo WS2
+    current_city VARCHAR(100) NULL,
+    last_update TIMESTAMP NULL,
+    hop_count INT NOT NULL DEFAULT 0,
+    FOREIGN KEY (sender_id) REFERENCES users(id) ON DELETE CASCADE, 
+    FOREIGN KEY (receiver_id) REFERENCES users(id) ON DELETE CASCADE,
+    INDEX idx_packages_sender_created (sender_id, creation_date, id),
+    INDEX idx_packages_receiver_created (receiver_id, creation_date, id),
+    INDEX idx_packages_created (creation_date, id),
+    FULLTEXT INDEX ft_packages_name_description (name, description)
+);
+
+CREATE TABLE IF NOT EXISTS tracking_info (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    package_id INT NOT NULL,
+    city VARCHAR(100) NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (package_id) REFERENCES packages(id) ON DELETE CASCADE,
+    INDEX idx_tracking_package_time (package_id, timestamp),
+    INDEX idx_tracking_time (timestamp)
+);
+
+-- Histórico dos pacotes entregues, movido de tracking_info pelo WS2
+-- (JSON [[cidade, timestamp ISO], ...] comprimido com zlib)
+CREATE TABLE IF NOT EXISTS tracking_archive (
+    package_id INT PRIMARY KEY,
+    history MEDIUMBLOB NOT NULL,
+    entries INT NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Escritas do WS2 (rastreio, remoção) registadas para invalidar as caches do WS1
+CREATE TABLE IF NOT EXISTS package_changes (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    package_id INT NOT NULL,
+    changed_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_package_changes_time (changed_at)
+);
+
+-- Totais do dashboard de administração (somar os shards de cada metric/bucket)
+CREATE TABLE IF NOT EXISTS dashboard_counters (
+    metric VARCHAR(20) NOT NULL,
+    bucket VARCHAR(100) NOT NULL,
+    shard TINYINT UNSIGNED NOT NULL,
+    value BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (metric, bucket, shard)
+);
+
+-- Última sequência gravada de cada journal de write-behind do WS2
+CREATE TABLE IF NOT EXISTS tracking_journal_checkpoints (
+    journal_id VARCHAR(64) PRIMARY KEY,
+    last_seq BIGINT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO users (username, password_hash, role, email) VALUES
 ('admin', '$argon2id$v=19$m=65536,t=3,p=4$kyXkt0snUsNCJsb2nD7DPw$mJ7BD6nRaExB9RtYlkkGbpz8NRxFCf7YbzEW/gdV7Qk', 'admin', 'admin@example.com');
\ No newline at end of file
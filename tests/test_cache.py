@@ -0,0 +1,100 @@
+"""Canal de invalidação da cache do WS1 (package_changes) com uma base de dados falsa.
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("cache_ws1", os.path.join(ROOT, "WS1", "cache.py"))
+cache = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(cache)
+
+
+class FakeChanges:
+    """package_changes: só as linhas já confirmadas são visíveis."""
+
+    def __init__(self):
+        self.committed = {}  # id -> package_id
+        self.queries = []
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, table):
+        self.table = table
+
+    def cursor(self):
+        return FakeCursor(self.table)
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, table):
+        self.table = table
+
+    def execute(self, query, params=None):
+        self.table.queries.append((query, params))
+        if "MAX(id)" in query:
+            self._rows = [(max(self.table.committed, default=0),)]
+        else:
+            last_id, gaps = params[0], set(params[1:])
+            self._rows = sorted((row_id, package_id) for row_id, package_id in self.table.committed.items()
+                                if row_id > last_id or row_id in gaps)
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+def test_first_poll_only_sets_the_cursor():
+    table = FakeChanges()
+    table.committed = {1: 10, 2: 11}
+    channel = cache.DbPollingInvalidationChannel(table.connect)
+    assert channel.poll() == set()
+    table.committed[3] = 12
+    assert channel.poll() == {12}
+    assert channel.poll() == set()
+
+
+def test_a_late_commit_below_the_cursor_is_still_seen():
+    table = FakeChanges()
+    channel = cache.DbPollingInvalidationChannel(table.connect)
+    channel.poll()
+    # id 1 é de uma transação longa (bulk) que ainda não fez commit; a 2 já fez
+    table.committed[2] = 20
+    assert channel.poll() == {20}
+    assert channel.poll() == set()
+    # commit muito depois do INSERT: o id 1 ficou em falta e é relido
+    table.committed[1] = 10
+    assert channel.poll() == {10}
+    assert channel._gaps == {}
+
+
+def test_gaps_of_rolled_back_transactions_expire(monkeypatch):
+    table = FakeChanges()
+    channel = cache.DbPollingInvalidationChannel(table.connect, gap_timeout=60)
+    channel.poll()
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    table.committed[3] = 30
+    channel.poll()
+    assert set(channel._gaps) == {1, 2}
+    now[0] += 61
+    channel.poll()
+    assert channel._gaps == {}
+    query, params = table.queries[-1]
+    assert "IN" in query and params == [3, 1, 2]  # a última leitura ainda os procurou
+    channel.poll()
+    query, params = table.queries[-1]
+    assert "IN" not in query and params == [3]
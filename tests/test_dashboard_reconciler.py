@@ -0,0 +1,99 @@
+"""Reconciliação dos contadores do dashboard (WS2): arranque e job periódico com vários workers.
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("dashboard_stats_ws2", os.path.join(ROOT, "WS2", "dashboard_stats.py"))
+dashboard_stats = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dashboard_stats)
+
+
+class FakeMySQL:
+    """GET_LOCK e a linha reconciled_at; ``now`` é o UNIX_TIMESTAMP() do servidor."""
+
+    def __init__(self):
+        self.now = 100000
+        self.reconciled_at = None
+        self.locked = False
+        self.scans = 0
+
+    def connect(self):
+        return FakeConnection(self)
+
+    def reconcile(self, get_connection):
+        self.scans += 1
+        self.reconciled_at = self.now
+        return True
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def close(self):
+        pass
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, params=None):
+        if "GET_LOCK" in query:
+            self._row = (0 if self.db.locked else 1,)
+            self.db.locked = True
+        elif "RELEASE_LOCK" in query:
+            self.db.locked = False
+            self._row = (1,)
+        else:
+            self._row = None if self.db.reconciled_at is None else (self.db.now - self.db.reconciled_at,)
+
+    def fetchone(self):
+        return self._row
+
+    def close(self):
+        pass
+
+
+def _reconciler(db, monkeypatch, interval=3600):
+    monkeypatch.setattr(dashboard_stats, "reconcile", db.reconcile)
+    monkeypatch.setattr(dashboard_stats, "prune_package_changes", lambda get_connection: 0)
+    return dashboard_stats.DashboardReconciler(db.connect, interval=interval)
+
+
+def test_startup_fills_only_a_database_never_reconciled(monkeypatch):
+    db = FakeMySQL()
+    workers = [_reconciler(db, monkeypatch) for _ in range(4)]
+    assert [worker.fill() for worker in workers] == [True, False, False, False]
+    db.now += 10 * 3600
+    # mesmo muito depois, um worker novo não volta a ler as tabelas ao arrancar
+    assert _reconciler(db, monkeypatch).fill() is False
+    assert db.scans == 1 and not db.locked
+
+
+def test_periodic_runs_are_shared_by_all_workers(monkeypatch):
+    db = FakeMySQL()
+    workers = [_reconciler(db, monkeypatch) for _ in range(4)]
+    workers[0].fill()
+    # cada worker acorda ao fim do seu intervalo, desfasados 7 minutos: só o primeiro lê as tabelas
+    for hour in range(1, 4):
+        for i, worker in enumerate(workers):
+            db.now = 100000 + hour * 3600 + i * 420
+            worker.run_once(min_age=worker.interval / 2)
+    assert db.scans == 1 + 3
+    assert sum(worker.stats()['skipped'] for worker in workers) == 3 * 3
+
+
+def test_a_held_lock_skips_the_run(monkeypatch):
+    db = FakeMySQL()
+    db.locked = True  # outro processo está a reconciliar
+    reconciler = _reconciler(db, monkeypatch)
+    assert reconciler.run_once() is False
+    assert db.scans == 0 and reconciler.stats()['skipped'] == 1
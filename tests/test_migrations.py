@@ -0,0 +1,220 @@
+"""Planos das queries críticas (EXPLAIN) e backfill por intervalos da migração 4.
+
+Os testes de EXPLAIN precisam do MySQL configurado (MYSQL_HOST, MYSQL_USER,
+...); sem base de dados são ignorados. Correm num esquema próprio
+(MYSQL_TEST_DATABASE, por omissão <MYSQL_DATABASE>_test), criado com o
+db/init.sql e as migrações e apagado no fim, nunca na base de dados
+configurada. Usam a cópia do WS2 de migrations.py, que tem também o
+getAllPackagesPage.
+
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime
+
+import mysql.connector
+import pytest
+from mysql.connector import Error
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "WS2"))
+
+import db_utils  # noqa: E402
+import migrations  # noqa: E402
+import tracking_archive  # noqa: E402
+
+
+TEST_DATABASE = os.environ.get("MYSQL_TEST_DATABASE", f"{db_utils.DB_CONFIG['database'] or 'tracking_db'}_test")
+
+# Algumas linhas para os planos não serem os de tabelas vazias
+_SEED = [
+    "INSERT INTO users (username, password_hash, email) VALUES ('ana', 'x', 'ana@example.com'), "
+    "('rui', 'x', 'rui@example.com')",
+    "INSERT INTO packages (sender_id, receiver_id, name, description, sender_city, destination_city, is_tracked) "
+    "SELECT s.id, r.id, CONCAT('caixa ', n.n), 'caixa de teste', 'Lisboa', 'Porto', TRUE "
+    "FROM users s JOIN users r ON r.id <> s.id "
+    "JOIN (SELECT 1 AS n UNION ALL SELECT 2 UNION ALL SELECT 3 UNION ALL SELECT 4) n",
+    "INSERT INTO tracking_info (package_id, city) SELECT id, 'Coimbra' FROM packages",
+]
+
+
+def _init_sql():
+    """Instruções do db/init.sql, sem o CREATE DATABASE/USE (correm no esquema de teste)."""
+    with open(os.path.join(ROOT, "db", "init.sql"), encoding="utf-8") as f:
+        lines = [line for line in f if not line.lstrip().startswith("--")]
+    statements = [statement.strip() for statement in "".join(lines).split(";")]
+    return [statement for statement in statements
+            if statement and not statement.upper().startswith(("CREATE DATABASE", "USE "))]
+
+
+@pytest.fixture(scope="module")
+def test_database():
+    """Cria o esquema de teste e aponta o pool do db_utils para ele; apaga-o no fim."""
+    configured = db_utils.DB_CONFIG['database']
+    if not db_utils.DB_CONFIG['host']: pytest.skip("sem MySQL (MYSQL_HOST, ...)")
+    if TEST_DATABASE == configured: pytest.fail("MYSQL_TEST_DATABASE não pode ser a base de dados configurada")
+    try:
+        admin = mysql.connector.connect(**dict(db_utils.DB_CONFIG, database=None))
+    except Error as e:
+        pytest.skip(f"sem MySQL (MYSQL_HOST, ...): {e}")
+    cursor = admin.cursor()
+    try:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{TEST_DATABASE}`")
+        cursor.execute(f"CREATE DATABASE `{TEST_DATABASE}`")
+        cursor.execute(f"USE `{TEST_DATABASE}`")
+        for statement in _init_sql() + _SEED:
+            cursor.execute(statement)
+        admin.commit()
+
+        # o pool guarda o próprio DB_CONFIG: as conexões novas abrem no esquema de teste
+        db_utils._pool.close_all()
+        db_utils.DB_CONFIG['database'] = TEST_DATABASE
+        yield TEST_DATABASE
+    finally:
+        db_utils._pool.close_all()
+        db_utils.DB_CONFIG['database'] = configured
+        cursor.execute(f"DROP DATABASE IF EXISTS `{TEST_DATABASE}`")
+        cursor.close()
+        admin.close()
+
+
+@pytest.fixture(scope="module")
+def plans(test_database):
+    migrations.apply_migrations()
+    return migrations.explain_plans()
+
+
+def _keys(rows, table):
+    return {row['key'] for row in rows if row['table'] == table}
+
+
+def test_hot_queries_include_get_all_packages_page():
+    names = [name for name, _, _ in migrations.hot_queries()]
+    assert "getAllPackagesPage" in names
+    assert "getAllPackagesPage (página seguinte)" in names
+
+
+def test_no_hot_query_reads_a_whole_table(plans):
+    for name, rows in plans.items():
+        for row in rows:
+            if row['table'].startswith('<'): continue  # tabela derivada
+            assert row['type'] != 'ALL', f"{name}: full scan de {row['table']}"
+            assert row['key'] is not None, f"{name}: {row['table']} sem índice"
+
+
+@pytest.mark.parametrize("name", ["listPackages", "listPackages (página seguinte)"])
+def test_list_packages_uses_one_index_per_branch(plans, name):
+    assert _keys(plans[name], 'packages') == {'idx_packages_sender_created', 'idx_packages_receiver_created'}
+
+
+def test_search_packages_uses_the_fulltext_index(plans):
+    assert 'ft_packages_name_description' in _keys(plans["searchPackages (FULLTEXT)"], 'packages')
+
+
+def test_check_status_uses_the_tracking_index(plans):
+    assert _keys(plans["checkStatus"], 'tracking_info') == {'idx_tracking_package_time'}
+
+
+def test_archive_candidates_scan_an_id_range(plans):
+    rows = plans["arquivo (candidatos)"]
+    assert _keys(rows, 'p') == {'PRIMARY'}
+    assert all(row['type'] == 'range' for row in rows if row['table'] == 'p')
+    assert _keys(rows, 't') == {'idx_tracking_package_time'}
+
+
+@pytest.mark.parametrize("name", ["getAllPackagesPage", "getAllPackagesPage (página seguinte)"])
+def test_get_all_packages_page_walks_the_creation_index(plans, name):
+    rows = plans[name]
+    assert _keys(rows, 'p') == {'idx_packages_created'}
+    # o índice já dá a ordem: sem filesort
+    assert not any('filesort' in (row.get('Extra') or '') for row in rows)
+    # os dois JOINs a users são pela chave primária
+    assert _keys(rows, 'sender') == _keys(rows, 'receiver') == {'PRIMARY'}
+
+
+class FakeCursor:
+    """Só o que o backfill usa; ``archive``: {package_id: [(city, timestamp ISO)]} em tracking_archive."""
+
+    def __init__(self, log, max_id, archive=None, active=()):
+        self.log = log
+        self.max_id = max_id
+        self.archive = archive
+        self.active = list(active)
+        self.rowcount = 0
+
+    def execute(self, query, params=None):
+        self._rows = []
+        if "information_schema.tables" in query:
+            self._rows = [(1,)] if self.archive is not None else []
+        elif "MAX(id)" in query:
+            self._rows = [(self.max_id,)]
+        elif "UPDATE packages p" in query:
+            self.log.append(('update', params))
+            self.rowcount = params[1] - params[0] + 1
+        elif "FROM tracking_archive" in query:
+            self._rows = [(package_id, tracking_archive.encode_history(entries))
+                          for package_id, entries in self.archive.items() if params[0] <= package_id <= params[1]]
+        elif "FROM tracking_info" in query:
+            self._rows = [row for row in self.active if params[0] <= row[0] <= params[1]]
+
+    def executemany(self, query, rows):
+        self.log.append(('archived', rows))
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, log):
+        self.log = log
+
+    def commit(self):
+        self.log.append(('commit',))
+
+
+def test_backfill_commits_after_each_range():
+    log = []
+    updated = migrations._backfill_location(FakeConnection(log), FakeCursor(log, 2500), batch_size=1000)
+    assert log == [('update', (1, 1000)), ('commit',),
+                   ('update', (1001, 2000)), ('commit',),
+                   ('update', (2001, 3000)), ('commit',)]
+    assert updated == 3000
+
+
+def test_migration_4_backfills_in_ranges(monkeypatch):
+    monkeypatch.setattr(migrations, "BACKFILL_BATCH", 10)
+    log = []
+    migrations.backfill_location_step(FakeConnection(log), FakeCursor(log, 25))
+    assert [entry for entry in log if entry[0] == 'commit'] == [('commit',)] * 3
+
+
+def test_empty_table_backfills_nothing():
+    log = []
+    assert migrations._backfill_location(FakeConnection(log), FakeCursor(log, 0), batch_size=1000) == 0
+    assert log == []
+
+
+def test_backfill_counts_the_archived_history():
+    log = []
+    archive = {3: [('Lisboa', '2026-01-01T10:00:00'), ('Porto', '2026-01-03T10:00:00')],
+               4: [('Faro', '2026-02-01T10:00:00')]}
+    # uma entrada chegada depois do arquivo (com hora antiga) e uma nova
+    active = [(3, 'Coimbra', datetime(2026, 1, 2, 10)), (4, 'Braga', datetime(2026, 2, 5, 10)),
+              (7, 'Leiria', datetime(2026, 3, 1))]
+    updated = migrations._backfill_location(FakeConnection(log), FakeCursor(log, 10, archive, active),
+                                            batch_size=1000)
+    assert log[0] == ('update', (1, 1000))
+    assert log[1] == ('archived', [('Porto', datetime(2026, 1, 3, 10), 3, 3),
+                                   ('Braga', datetime(2026, 2, 5, 10), 2, 4)])
+    assert log[2] == ('commit',)
+    assert updated == 1000 + 2
+
+
+def test_backfill_without_the_archive_table():
+    log = []
+    migrations._backfill_location(FakeConnection(log), FakeCursor(log, 10), batch_size=1000)
+    assert log == [('update', (1, 1000)), ('commit',)]
@@ -0,0 +1,44 @@
+"""Pool de Argon2: processos do forkserver e recuperação quando um processo do pool morre.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "WS1"))
+
+import password_pool  # noqa: E402
+
+
+@pytest.fixture
+def pool():
+    pool = password_pool.PasswordPool(workers=1, queue_size=2, queue_timeout=5, mode='process')
+    yield pool
+    if pool._executor is not None: pool._executor.shutdown()
+
+
+def test_hash_and_verify_in_forkserver_processes(pool):
+    # uma thread a correr, como num worker gthread/gevent, quando o pool é criado
+    stop = threading.Event()
+    threading.Thread(target=stop.wait, daemon=True).start()
+    try:
+        hashed = pool.hash("segredo")
+        assert pool.verify(hashed, "segredo") is True
+        assert pool.verify(hashed, "outro") is False
+    finally:
+        stop.set()
+    assert pool._executor._mp_context.get_start_method() == 'forkserver'
+
+
+def test_a_dead_pool_process_is_reported_as_busy_and_replaced(pool):
+    with pytest.raises(password_pool.PasswordPoolBusy):
+        pool._run(os._exit, 1)  # o processo do pool morre a meio do pedido
+    assert pool.stats()['restarts'] == 1
+    assert pool._executor is None
+    # o pedido seguinte usa um pool novo
+    assert pool.verify(pool.hash("segredo"), "segredo") is True
+    assert pool.stats()['in_flight'] == 0
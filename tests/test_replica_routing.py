@@ -0,0 +1,228 @@
+"""Encaminhamento leituras/escritas do ReplicaRouter com um primário e uma réplica falsos.
+
+O WS1 e o WS2 têm cópias iguais de db_pool.py: os testes correm contra as duas.
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+import time
+
+import pytest
+from mysql.connector import Error
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_db_pool(service):
+    spec = importlib.util.spec_from_file_location(f"db_pool_{service}", os.path.join(ROOT, service, "db_pool.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeServer:
+    """Um "MySQL": regista as queries que recebeu e pode estar em baixo ou atrasado."""
+
+    def __init__(self, name, lag=0, is_replica=True):
+        self.name = name
+        self.lag = lag
+        self.is_replica = is_replica
+        self.down = False
+        self.queries = []
+
+
+class FakeCursor:
+    def __init__(self, server):
+        self._server = server
+        self._rows = []
+
+    def execute(self, query, params=None):
+        if self._server.down: raise Error(msg=f"{self._server.name} em baixo")
+        self._server.queries.append(query)
+        self._rows = []
+        if query.startswith("SHOW REPLICA STATUS") and self._server.is_replica:
+            self._rows = [{'Seconds_Behind_Source': self._server.lag}]
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.server)
+
+    def ping(self, reconnect=False):
+        if self.server.down: raise Error(msg="ping")
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(params=["WS1", "WS2"])
+def db_pool(request, monkeypatch):
+    module = _load_db_pool(request.param)
+    servers = {}
+
+    def connect(**config):
+        server = servers[config['host']]
+        if server.down: raise Error(msg=f"Can't connect to {server.name}")
+        return FakeConnection(server)
+
+    monkeypatch.setattr(module.mysql.connector, "connect", connect)
+    module.servers = servers
+    return module
+
+
+@pytest.fixture
+def setup(db_pool):
+    primary_server = FakeServer('primary', is_replica=False)
+    replica_server = FakeServer('replica')
+    db_pool.servers.update(primary=primary_server, replica=replica_server)
+    primary = db_pool.ConnectionPool({'host': 'primary'}, size=4, timeout=0.5)
+    replica = db_pool.ConnectionPool({'host': 'replica'}, size=4, timeout=0.5)
+    # check_interval longo: os testes chamam check_replicas() quando querem
+    router = db_pool.ReplicaRouter(primary, [('replica', replica, 1.0)], max_lag=5.0,
+                                   check_interval=3600, margin=0.2)
+    return db_pool, router, primary_server, replica_server
+
+
+def _app(db_pool, router):
+    """WSGI mínimo: /read lê pelo router, /write escreve (e faz commit) no primário."""
+
+    def app(environ, start_response):
+        if environ['PATH_INFO'] == '/write':
+            conn = router.primary.acquire()
+            conn.cursor().execute("INSERT INTO t VALUES (1)")
+            conn.commit()
+            conn.close()
+        conn = router.acquire_read()
+        conn.cursor().execute("SELECT * FROM t")
+        served_by = conn.server.name
+        conn.close()
+        return Response(served_by)(environ, start_response)
+
+    return Client(db_pool.ReadYourWrites(app))
+
+
+def _reads(server):
+    return [query for query in server.queries if query.startswith("SELECT * FROM t")]
+
+
+def test_reads_go_to_the_replica(setup):
+    db_pool, router, primary_server, replica_server = setup
+    client = _app(db_pool, router)
+
+    for _ in range(5):
+        assert client.get('/read').get_data(as_text=True) == 'replica'
+    assert len(_reads(replica_server)) == 5
+    assert _reads(primary_server) == []
+    assert router.stats()['replica_reads'] == 5
+
+
+def test_writes_go_to_the_primary_and_announce_the_window(setup):
+    db_pool, router, primary_server, replica_server = setup
+    client = _app(db_pool, router)
+
+    response = client.get('/write')
+    assert "INSERT INTO t VALUES (1)" in primary_server.queries
+    assert not any(query.startswith("INSERT") for query in replica_server.queries)
+    # a leitura do próprio pedido que escreveu já vai ao primário
+    assert response.get_data(as_text=True) == 'primary'
+    assert float(response.headers[db_pool.ReadYourWrites.HEADER]) == pytest.approx(0.2)
+
+
+def test_reads_after_a_write_stick_to_the_primary_for_the_window(setup):
+    db_pool, router, primary_server, replica_server = setup
+    client = _app(db_pool, router)
+
+    window = client.get('/write').headers[db_pool.ReadYourWrites.HEADER]
+    sent_at = time.monotonic()
+    header = {db_pool.ReadYourWrites.HEADER: window}
+    assert client.get('/read', headers=header).get_data(as_text=True) == 'primary'
+    assert router.stats()['read_your_writes'] >= 1
+    # Pedidos de outras sessões (sem o cabeçalho) continuam a ir à réplica
+    assert client.get('/read').get_data(as_text=True) == 'replica'
+
+    # Passada a janela o cliente deixa de enviar o cabeçalho (ou envia o que resta, <= 0)
+    time.sleep(max(0.0, float(window) - (time.monotonic() - sent_at)) + 0.05)
+    remaining = float(window) - (time.monotonic() - sent_at)
+    assert client.get('/read', headers={db_pool.ReadYourWrites.HEADER: f"{remaining:.3f}"}) \
+        .get_data(as_text=True) == 'replica'
+
+
+def test_window_covers_the_current_replica_lag(setup):
+    db_pool, router, primary_server, replica_server = setup
+    replica_server.lag = 3
+    router.check_replicas()
+    response = _app(db_pool, router).get('/write')
+    assert float(response.headers[db_pool.ReadYourWrites.HEADER]) == pytest.approx(3.2)
+
+
+def test_falls_back_to_the_primary_when_the_replica_is_down(setup):
+    db_pool, router, primary_server, replica_server = setup
+    client = _app(db_pool, router)
+    assert client.get('/read').get_data(as_text=True) == 'replica'
+
+    # Em baixo entre verificações: a leitura falha na réplica e é servida pelo primário
+    replica_server.down = True
+    router.replicas[0].pool.close_all()
+    assert client.get('/read').get_data(as_text=True) == 'primary'
+    assert router.stats()['fallbacks'] == 1
+    assert router.replicas[0].healthy is False
+
+    # A verificação seguinte confirma; as leituras ficam no primário sem tentar a réplica
+    router.check_replicas()
+    assert client.get('/read').get_data(as_text=True) == 'primary'
+    assert router.stats()['fallbacks'] == 1
+
+    # De volta: a verificação seguinte reativa-a
+    replica_server.down = False
+    router.check_replicas()
+    assert client.get('/read').get_data(as_text=True) == 'replica'
+
+
+def test_lagging_replica_stops_receiving_reads(setup):
+    db_pool, router, primary_server, replica_server = setup
+    client = _app(db_pool, router)
+    replica_server.lag = 10
+    router.check_replicas()
+    assert client.get('/read').get_data(as_text=True) == 'primary'
+    replica_server.lag = 1
+    router.check_replicas()
+    assert client.get('/read').get_data(as_text=True) == 'replica'
+
+
+def test_without_replicas_everything_uses_the_primary(db_pool, monkeypatch):
+    db_pool.servers['primary'] = FakeServer('primary', is_replica=False)
+    monkeypatch.setenv("DB_REPLICAS", "")
+    primary = db_pool.ConnectionPool({'host': 'primary'}, size=2, timeout=0.5)
+    router = db_pool.router_from_env({'host': 'primary'}, primary)
+    client = _app(db_pool, router)
+    assert client.get('/read').get_data(as_text=True) == 'primary'
+    response = client.get('/write')
+    # Sem réplicas não há atraso: nada a anunciar
+    assert db_pool.ReadYourWrites.HEADER not in response.headers
+
+
+def test_db_replicas_spec(db_pool, monkeypatch):
+    monkeypatch.setenv("DB_REPLICAS", "replica-a, replica-b:3307*2")
+    primary = db_pool.ConnectionPool({'host': 'primary', 'port': 3306}, size=3)
+    router = db_pool.router_from_env({'host': 'primary', 'port': 3306}, primary)
+    assert [(replica.name, replica.weight) for replica in router.replicas] == \
+        [('replica-a:3306', 1.0), ('replica-b:3307', 2.0)]
+    assert all(replica.pool.size == 3 for replica in router.replicas)
@@ -0,0 +1,41 @@
+"""Query da pesquisa (searchPackages): relevância inteira no cursor e LIMIT em cada ramo do UNION ALL.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "WS2"))
+
+import db_utils  # noqa: E402
+
+
+def _branches(query):
+    return query.split("UNION ALL")
+
+
+def test_each_branch_applies_the_keyset_and_the_limit():
+    query, params = db_utils._search_packages_query(7, "caixa azul", limit=51, after=(1500000, 42))
+    assert query.count("%s") == len(params)
+    for branch in _branches(query):
+        assert "HAVING relevance < %s OR (relevance = %s AND id < %s)" in branch
+        assert "ORDER BY relevance DESC, id DESC LIMIT %s" in branch
+    # o LIMIT final, fora dos ramos
+    assert query.rstrip().endswith("ORDER BY relevance DESC, id DESC LIMIT %s")
+    assert params.count(51) == 3 and params.count(1500000) == 4
+
+
+def test_relevance_is_an_integer_in_the_select_and_the_cursor():
+    query, _ = db_utils._search_packages_query(7, "caixa", limit=51)
+    assert f"* {db_utils.RELEVANCE_SCALE}) AS SIGNED) AS relevance" in query
+    # a relevância da última linha volta intacta do cursor e compara por igualdade
+    token = db_utils.encode_cursor(2718282, 99)
+    assert db_utils.decode_cursor(token, db_utils.SEARCH_CURSOR) == (2718282, 99)
+
+
+def test_like_fallback_keeps_the_same_shape():
+    query, params = db_utils._search_packages_query(7, "ab", limit=11, after=(0, 5))
+    assert "LIKE" in query and "MATCH" not in query
+    assert query.count("%s") == len(params)
+    assert all("LIMIT %s" in branch for branch in _branches(query))
@@ -0,0 +1,60 @@
+"""TrackingArchiver: a passagem percorre packages por intervalos de IDs limitados.
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("tracking_archive_ws2", os.path.join(ROOT, "WS2", "tracking_archive.py"))
+tracking_archive = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(tracking_archive)
+
+
+class FakeArchiver(tracking_archive.TrackingArchiver):
+    """Sem MySQL: ``ready`` são os IDs que a CANDIDATES_QUERY devolveria."""
+
+    def __init__(self, max_id, ready, **kwargs):
+        super().__init__(None, **kwargs)
+        self.max_id = max_id
+        self.ready = ready
+        self.windows = []
+        self.archived = []
+
+    def _query(self, query, params=()):
+        if "MAX(id)" in query: return [(self.max_id,)]
+        assert query == tracking_archive.CANDIDATES_QUERY
+        after_id, last_id, _ = params
+        self.windows.append((after_id, last_id))
+        return [(package_id,) for package_id in self.ready if after_id < package_id <= last_id]
+
+    def _archive(self, package_ids):
+        self.archived.append(list(package_ids))
+        return True
+
+
+def test_each_query_covers_a_bounded_id_range():
+    archiver = FakeArchiver(12000, [3, 4999, 5000, 5001, 11999], scan=5000, batch=2)
+    assert archiver._run() == 5
+    assert archiver.windows == [(0, 5000), (5000, 10000), (10000, 15000)]
+    assert archiver.archived == [[3, 4999], [5000], [5001], [11999]]
+
+
+def test_no_packages_no_queries():
+    archiver = FakeArchiver(0, [])
+    assert archiver._run() == 0
+    assert archiver.windows == []
+
+
+def test_stops_at_max_per_run():
+    archiver = FakeArchiver(100, list(range(1, 101)), scan=50, batch=10, max_per_run=25)
+    assert archiver._run() == 30
+    assert archiver.windows == [(0, 50)]
+
+
+def test_a_failed_batch_ends_the_pass():
+    archiver = FakeArchiver(100, [1, 2, 60], scan=50, batch=1)
+    archiver._archive = lambda package_ids: False
+    assert archiver._run() == 0
+    assert archiver.windows == [(0, 50)]
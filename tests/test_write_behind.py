@@ -0,0 +1,152 @@
+"""Write-behind do WS2 com um MySQL falso: lotes com dados inválidos e falhas da base de dados.
+
+    python -m pytest tests
+"""
+import importlib.util
+import os
+from datetime import datetime, timezone
+
+import pytest
+from mysql.connector import DataError, OperationalError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+spec = importlib.util.spec_from_file_location("write_behind_ws2", os.path.join(ROOT, "WS2", "write_behind.py"))
+write_behind = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(write_behind)
+
+
+class FakeDB:
+    """tracking_info e checkpoints confirmados; cada conexão tem a sua transação."""
+
+    def __init__(self):
+        self.rows = []
+        self.checkpoints = {}
+        self.down = False
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._row = None
+
+    def execute(self, query, params=None):
+        if "INSERT INTO tracking_journal_checkpoints" in query:
+            self.conn.checkpoints[params[0]] = params[1]
+        elif "SELECT last_seq" in query:
+            seq = self.conn.db.checkpoints.get(params[0])
+            self._row = (seq,) if seq is not None else None
+        elif "DELETE FROM tracking_journal_checkpoints" in query:
+            self.conn.db.checkpoints.pop(params[0], None)
+
+    def fetchone(self):
+        return self._row
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.checkpoints = {}
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.db.rows += self.rows
+        self.db.checkpoints.update(self.checkpoints)
+
+    def rollback(self):
+        self.rows, self.checkpoints = [], {}
+
+    def close(self):
+        pass
+
+
+def insert_fn(cursor, rows):
+    """Como o MySQL em modo estrito: uma cidade com mais de 100 caracteres faz falhar o INSERT inteiro."""
+    if cursor.conn.db.down: raise OperationalError(msg="Lost connection")
+    if any(len(city) > 100 for _, city, _ in rows):
+        raise DataError(msg="Data too long for column 'city'")
+    # a comparação do db_utils (time_obj >= latest[...]) com horas com e sem fuso
+    times = [time_obj for _, _, time_obj in rows]
+    max(times)
+    cursor.conn.rows += rows
+    return [None] * len(rows)
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+@pytest.fixture
+def buffer(db, tmp_path):
+    def connect():
+        return None if db.down else FakeConnection(db)
+    buffer = write_behind.WriteBehindBuffer(str(tmp_path), connect, insert_fn, batch_size=8,
+                                            flush_interval=0.01, fsync=False)
+    yield buffer
+    buffer.close(timeout=2)
+
+
+def _submit(buffer, cities):
+    for i, city in enumerate(cities):
+        buffer.submit(i + 1, city, datetime(2026, 1, 1, 10, i))
+
+
+def test_a_bad_event_is_dropped_and_the_rest_is_written(buffer, db):
+    cities = [f"Cidade {i}" for i in range(8)]
+    cities[5] = "x" * 101
+    _submit(buffer, cities)
+    assert buffer.flush(timeout=5)
+
+    assert sorted(package_id for package_id, _, _ in db.rows) == [1, 2, 3, 4, 5, 7, 8]
+    stats = buffer.stats()
+    assert stats['dropped'] == 1 and stats['flushed'] == 7 and stats['pending'] == 0
+    # o checkpoint passou por cima do evento descartado
+    assert max(db.checkpoints.values()) == 8
+
+
+def test_the_writer_waiting_for_a_bad_event_gets_its_error(buffer, db):
+    error = buffer.submit(1, "x" * 101, datetime(2026, 1, 1), wait=True, timeout=5)
+    assert error.startswith("Invalid data: DataError")
+    assert buffer.submit(2, "Porto", datetime(2026, 1, 1), wait=True, timeout=5) is None
+    assert [package_id for package_id, _, _ in db.rows] == [2]
+
+
+def test_a_type_error_does_not_kill_the_thread(buffer, db):
+    buffer.submit(1, "Lisboa", datetime(2026, 1, 1, tzinfo=timezone.utc))
+    buffer.submit(2, "Porto", datetime(2026, 1, 1))
+    assert buffer.flush(timeout=5)
+    # sozinho cada evento passa; a thread continua viva para os seguintes
+    assert buffer.submit(3, "Faro", datetime(2026, 1, 2), wait=True, timeout=5) is None
+    assert sorted(package_id for package_id, _, _ in db.rows) == [1, 2, 3]
+
+
+def test_database_failures_are_retried_not_dropped(buffer, db):
+    db.down = True
+    _submit(buffer, ["Lisboa", "Porto"])
+    assert not buffer.flush(timeout=0.3)
+    assert buffer.stats()['flush_errors'] >= 1 and buffer.stats()['dropped'] == 0
+    db.down = False
+    assert buffer.flush(timeout=5)
+    assert len(db.rows) == 2 and buffer.stats()['dropped'] == 0
+
+
+def test_replay_skips_the_bad_event_once_and_for_all(db, tmp_path):
+    def connect():
+        return None if db.down else FakeConnection(db)
+    # o journal de um processo que morreu com um evento inválido por gravar
+    journal = write_behind._Journal(str(tmp_path))
+    for seq, city in enumerate(["Lisboa", "x" * 101, "Porto"], start=1):
+        journal.append({'seq': seq, 'package_id': seq, 'city': city, 'time': '2026-01-01T10:00:00'})
+    journal.close()
+
+    replayer = write_behind.WriteBehindBuffer(str(tmp_path), connect, insert_fn, fsync=False)
+    assert replayer.recover() == 3
+    assert sorted(package_id for package_id, _, _ in db.rows) == [1, 3]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(write_behind.JOURNAL_SUFFIX)]